@@ -43,9 +43,13 @@ setup(
     ],
     python_requires=">=3.8",
     install_requires=requirements,
+    extras_require={
+        # Encode animated emojis in-process instead of with an ffmpeg subprocess
+        "pyav": ["av>=10.0.0"],
+    },
     entry_points={
         "console_scripts": [
-            "sticker-to-emoji=sticker_to_emoji.converter:main",
+            "sticker-to-emoji=sticker_to_emoji.cli:run",
         ],
     },
     keywords="telegram sticker emoji converter tgs lottie",
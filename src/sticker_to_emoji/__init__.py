@@ -4,6 +4,12 @@ __version__ = "1.1.0"
 __author__ = "Your Name"
 __license__ = "MIT"
 
-from .converter import StickerToEmojiConverter
-
 __all__ = ["StickerToEmojiConverter"]
+
+
+def __getattr__(name):
+    # The converter pulls in Telethon and aiohttp; only import it when it is used
+    if name == "StickerToEmojiConverter":
+        from .converter import StickerToEmojiConverter
+        return StickerToEmojiConverter
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,7 +1,6 @@
 """CLI entry point for sticker_to_emoji package."""
 
-import asyncio
-from .converter import main
+from .cli import run
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run()
@@ -0,0 +1,221 @@
+"""
+Batch mode: convert many sticker packs with one Telegram login.
+
+    python -m sticker_to_emoji batch packs.txt
+    cat packs.txt | python -m sticker_to_emoji batch -
+
+Each line of the list is a pack name or URL, optionally followed by a custom
+emoji pack name. All packs share one Telethon client, one HTTP session and
+one conversion worker pool. With several bots (see bots.py) that many packs
+are converted at once, each uploaded by the bot with the most rate budget
+left, so a 429 on one token doesn't hold up the others. Progress is kept
+in a small SQLite journal, so re-running the same command after a crash or
+a FloodWait picks up where it stopped. A pack that was started before is
+finished as with --sync, so a set that was already created is filled up
+rather than created again; with the conversion cache, its stickers aren't
+re-downloaded or re-uploaded either.
+"""
+
+import argparse
+import asyncio
+import re
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+from .cli import add_common_arguments, load_credentials
+
+# Longer FloodWaits stop the batch; the journal lets the next run resume
+DEFAULT_MAX_FLOOD_WAIT = 15 * 60
+
+
+class BatchJournal:
+    """SQLite record of which packs in a batch are done."""
+    
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.db = sqlite3.connect(str(self.path))
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS packs (
+                pack TEXT PRIMARY KEY,
+                name TEXT,
+                position INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                pack_url TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL
+            )
+        """)
+        self.db.commit()
+    
+    def close(self):
+        self.db.close()
+    
+    def add(self, packs: list):
+        """Queue (pack, name) pairs; packs already in the journal keep their state."""
+        start = self.db.execute("SELECT COALESCE(MAX(position), 0) FROM packs").fetchone()[0]
+        self.db.executemany(
+            "INSERT OR IGNORE INTO packs (pack, name, position, updated_at) VALUES (?, ?, ?, ?)",
+            [(pack, name, start + i, time.time()) for i, (pack, name) in enumerate(packs, 1)]
+        )
+        self.db.commit()
+    
+    def pending(self, retry_failed: bool = False) -> list:
+        """Packs still to do, in list order. Packs left 'running' by a crash are redone."""
+        statuses = ('pending', 'running', 'failed') if retry_failed else ('pending', 'running')
+        rows = self.db.execute(
+            f"SELECT pack, name FROM packs WHERE status IN ({','.join('?' * len(statuses))}) ORDER BY position",
+            statuses
+        )
+        return rows.fetchall()
+    
+    def _set(self, pack: str, **fields):
+        fields['updated_at'] = time.time()
+        assignments = ', '.join(f"{key} = ?" for key in fields)
+        self.db.execute(f"UPDATE packs SET {assignments} WHERE pack = ?", (*fields.values(), pack))
+        self.db.commit()
+    
+    def start(self, pack: str):
+        self.db.execute("UPDATE packs SET attempts = attempts + 1 WHERE pack = ?", (pack,))
+        self._set(pack, status='running', error=None)
+    
+    def finish(self, pack: str, pack_url: str):
+        self._set(pack, status='done', pack_url=pack_url)
+    
+    def fail(self, pack: str, error: str):
+        self._set(pack, status='failed', error=error)
+    
+    def defer(self, pack: str, error: str):
+        """Leave a pack for the next run (e.g. after a long FloodWait)."""
+        self._set(pack, status='pending', error=error)
+    
+    def deferred(self, pack: str) -> bool:
+        """Whether a FloodWait stopped the pack's last attempt."""
+        row = self.db.execute("SELECT error FROM packs WHERE pack = ?", (pack,)).fetchone()
+        return bool(row and row[0] and row[0].startswith('FloodWait'))
+    
+    def attempted(self, pack: str) -> bool:
+        """Whether an earlier run started the pack, and so may have created its set."""
+        row = self.db.execute("SELECT attempts FROM packs WHERE pack = ?", (pack,)).fetchone()
+        return bool(row and row[0])
+    
+    def counts(self) -> dict:
+        return dict(self.db.execute("SELECT status, COUNT(*) FROM packs GROUP BY status").fetchall())
+
+
+def read_pack_list(source: str) -> list:
+    """Read (pack, name) pairs from a file, or stdin for '-'. Blank lines and # comments are skipped."""
+    if source == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        lines = Path(source).read_text(encoding='utf-8').splitlines()
+    
+    packs = []
+    for line in lines:
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        parts = line.split(None, 1)
+        packs.append((parts[0], parts[1].strip() if len(parts) > 1 else None))
+    return packs
+
+
+def pack_dir_name(pack: str) -> str:
+    """Filesystem-safe directory name for a pack name or URL."""
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', pack.rstrip('/').split('/')[-1].split('=')[-1])
+
+
+async def run_batch(converter, session, journal: BatchJournal, args) -> int:
+    """Convert every pending pack in the journal, --parallel at a time. Returns the number of failures."""
+    from telethon import errors
+    from .converter import convert_pack
+    
+    todo = journal.pending(retry_failed=args.retry_failed)
+    queue = iter(enumerate(todo, 1))
+    failures = 0
+    stopped = False
+    
+    async def run_pack(pack: str, name: str):
+        nonlocal failures, stopped
+        # A crash or a FloodWait can stop a pack after its set was created: finish that set with --sync
+        resume = journal.attempted(pack)
+        while True:
+            journal.start(pack)
+            pack_args = argparse.Namespace(**{**vars(args), 'sync': True}) if resume else args
+            try:
+                pack_url = await convert_pack(
+                    converter, session, pack, pack_args,
+                    Path(args.output) / pack_dir_name(pack), name=name
+                )
+            except errors.FloodWaitError as e:
+                journal.defer(pack, f"FloodWait {e.seconds}s")
+                resume = True
+                if e.seconds > args.max_flood_wait:
+                    print(f"⏳ FloodWait of {e.seconds}s, stopping; re-run to resume", file=sys.stderr)
+                    stopped = True
+                    return
+                print(f"⏳ FloodWait, retrying in {e.seconds}s")
+                await asyncio.sleep(e.seconds)
+                continue
+            except Exception as e:
+                print(f"❌ {pack}: {e}", file=sys.stderr)
+                journal.fail(pack, str(e))
+                failures += 1
+            else:
+                journal.finish(pack, pack_url)
+            return
+    
+    async def worker():
+        # Workers share one iterator, so each pack is taken exactly once
+        for i, (pack, name) in queue:
+            if stopped:
+                break
+            print(f"\n━━━ [{i}/{len(todo)}] {pack} ━━━")
+            await run_pack(pack, name)
+    
+    await asyncio.gather(*(worker() for _ in range(max(1, args.parallel or len(converter.bots)))))
+    return failures
+
+
+async def batch_main(argv: list = None):
+    """Entry point for the batch subcommand."""
+    parser = argparse.ArgumentParser(
+        prog="sticker-to-emoji batch",
+        description="Convert a list of Telegram sticker packs to emoji packs",
+        epilog="Each line: <pack name or URL> [custom emoji pack name]"
+    )
+    parser.add_argument("pack_list", help="File with one pack per line, or - for stdin")
+    parser.add_argument("--journal", default="sticker_batch.sqlite3", help="Progress journal (default: sticker_batch.sqlite3)")
+    parser.add_argument("--retry-failed", action="store_true", help="Also retry packs that failed in earlier runs")
+    parser.add_argument("--parallel", type=int, help="Packs converted at once (default: one per bot)")
+    parser.add_argument("--max-flood-wait", type=int, default=DEFAULT_MAX_FLOOD_WAIT, help=f"Longest FloodWait to sleep through, in seconds (default: {DEFAULT_MAX_FLOOD_WAIT})")
+    add_common_arguments(parser)
+    args = parser.parse_args(argv)
+    
+    credentials = load_credentials()
+    
+    from .converter import create_converter, create_session
+    
+    journal = BatchJournal(Path(args.journal))
+    journal.add(read_pack_list(args.pack_list))
+    
+    print("🎨 Sticker to Emoji Converter (batch)\n")
+    print(f"📒 Journal: {args.journal} {journal.counts()}")
+    
+    try:
+        async with create_session() as session:
+            async with create_converter(args, credentials) as converter:
+                failures = await run_batch(converter, session, journal, args)
+                converter.bots.print_summary()
+    except KeyboardInterrupt:
+        print("\n\n⚠️  Cancelled, re-run to resume", file=sys.stderr)
+        sys.exit(130)
+    finally:
+        counts = journal.counts()
+        journal.close()
+    
+    print(f"\n📒 Batch finished: {counts}")
+    if failures:
+        sys.exit(1)
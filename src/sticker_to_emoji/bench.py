@@ -0,0 +1,471 @@
+"""
+Offline benchmarks for the conversion engine.
+
+Run: python -m sticker_to_emoji.bench [-o results.json] [--compare old.json]
+     python -m sticker_to_emoji.bench --startup-only --max-startup-ms 150
+
+Synthetic fixtures are generated locally: TGS stickers (gzipped Lottie JSON)
+of increasing complexity, WEBP stickers and, with ffmpeg or else PyAV, a
+WEBM sticker that has to be transcoded and one that fits as it is; without
+either, the WEBM cases are reported as skipped. Every case runs in a fresh
+process so its peak RSS can be reported, and each conversion path is
+broken down into stages. Results are plain JSON with
+stable keys so two runs can be compared with --compare.
+
+Startup cases time CLI runs that should exit before anything heavy is
+imported (--help, bad credentials) and list which heavy modules they loaded
+anyway, from `python -X importtime`. --max-startup-ms makes a slow or heavy
+startup fail the run, e.g. in CI.
+"""
+
+import argparse
+import gzip
+import io
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from . import __version__, engine
+from .static import StaticConverter
+
+# name -> keyword arguments for make_lottie
+TGS_FIXTURES = {
+    'tgs_simple': {'layers': 1, 'frames': 60, 'fps': 30},
+    'tgs_medium': {'layers': 8, 'frames': 120, 'fps': 60},
+    'tgs_complex': {'layers': 32, 'frames': 180, 'fps': 60},
+    'tgs_hold': {'layers': 8, 'frames': 180, 'fps': 60, 'hold': 0.5},
+    'tgs_slow': {'layers': 8, 'frames': 180, 'fps': 60, 'turns': 0.25},
+}
+
+# name -> keyword arguments for make_webp
+WEBP_FIXTURES = {
+    'webp_square': {'width': 512, 'height': 512},
+    'webp_wide': {'width': 512, 'height': 320},
+}
+
+# name -> (CLI arguments, environment); every one of these exits before doing any work
+STARTUP_FIXTURES = {
+    'startup_help': (['--help'], {}),
+    'startup_bad_credentials': (['SomePack'], {
+        'TELEGRAM_API_ID': 'not-a-number', 'TELEGRAM_API_HASH': 'x', 'TELEGRAM_BOT_TOKEN': 'x', 'TELEGRAM_USER_ID': '1'
+    }),
+    'startup_batch_help': (['batch', '--help'], {}),
+    'startup_convert_local_help': (['convert-local', '--help'], {}),
+}
+
+# Modules the CLI should only load once it has work to do
+HEAVY_MODULES = ('telethon', 'aiohttp', 'PIL', 'rlottie_python', 'av', 'dotenv')
+
+
+def make_lottie(layers: int = 4, frames: int = 60, fps: int = 60, size: int = 512, turns: float = 1.0, hold: float = 0.0) -> dict:
+    """Build a Lottie animation of rectangles rotating `turns` times, then holding still for the `hold` fraction."""
+    ease = {'i': {'x': [0.5], 'y': [0.5]}, 'o': {'x': [0.5], 'y': [0.5]}}
+    static = lambda value: {'a': 0, 'k': value}
+    
+    layer_list = []
+    for i in range(layers):
+        end = round(frames * (1 - hold))
+        rotation = {'a': 1, 'k': [dict(t=0, s=[i * 15], **ease), {'t': end, 's': [i * 15 + 360 * turns]}]}
+        layer_list.append({
+            'ddd': 0, 'ind': i + 1, 'ty': 4, 'nm': f'layer {i}', 'sr': 1,
+            'ks': {
+                'o': static(100), 'r': rotation, 'p': static([size / 2, size / 2, 0]),
+                'a': static([0, 0, 0]), 's': static([100, 100, 100])
+            },
+            'ao': 0,
+            'shapes': [{'ty': 'gr', 'it': [
+                {'ty': 'rc', 'd': 1, 's': static([size * 0.6, size * 0.1 + i * 8]), 'p': static([0, 0]), 'r': static(8)},
+                {'ty': 'fl', 'c': static([1, (i * 0.23) % 1, 0.3, 1]), 'o': static(80)},
+                {'ty': 'tr', 'p': static([0, 0]), 'a': static([0, 0]), 's': static([100, 100]), 'r': static(0), 'o': static(100)}
+            ]}],
+            'ip': 0, 'op': frames, 'st': 0, 'bm': 0
+        })
+    
+    return {
+        'v': '5.5.2', 'fr': fps, 'ip': 0, 'op': frames, 'w': size, 'h': size,
+        'nm': 'bench', 'ddd': 0, 'assets': [], 'layers': layer_list
+    }
+
+
+def make_tgs(**kwargs) -> bytes:
+    """Build a gzipped Lottie sticker, see make_lottie for options."""
+    return gzip.compress(json.dumps(make_lottie(**kwargs)).encode('utf-8'))
+
+
+def make_webp(width: int = 512, height: int = 512, shapes: int = 40) -> bytes:
+    """Build a semi-transparent WEBP sticker of overlapping ellipses."""
+    from PIL import Image, ImageDraw
+    
+    img = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(img)
+    for i in range(shapes):
+        x, y = (i * 37) % width, (i * 53) % height
+        draw.ellipse((x, y, x + width // 4, y + height // 5), fill=((i * 41) % 256, 120, 255 - (i * 17) % 256, 200))
+    
+    buffer = io.BytesIO()
+    img.save(buffer, format='WEBP')
+    return buffer.getvalue()
+
+
+def make_webm(output_path: Path, size: int = 512, duration: float = 3.0, rate: int = 30, bitrate: str = '200k') -> bool:
+    """Build a VP9 WEBM clip with ffmpeg's test source, or PyAV without ffmpeg. Returns False with neither."""
+    if not engine.ffmpeg_available():
+        return engine.pyav_available() and make_webm_pyav(output_path, size, duration, rate, bitrate)
+    result = subprocess.run([
+        'ffmpeg', '-y', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', f'testsrc2=size={size}x{size}:rate={rate}:duration={duration}',
+        '-c:v', 'libvpx-vp9', '-b:v', bitrate, str(output_path)
+    ], capture_output=True)
+    return result.returncode == 0
+
+
+def make_webm_pyav(output_path: Path, size: int, duration: float, rate: int, bitrate: str) -> bool:
+    """Build a VP9 WEBM clip of moving ellipses with PyAV, as a stand-in for ffmpeg's test source."""
+    import av
+    from PIL import Image, ImageDraw
+    
+    try:
+        with av.open(str(output_path), mode='w', format='webm') as container:
+            stream = container.add_stream('libvpx-vp9', rate=rate)
+            stream.width = size
+            stream.height = size
+            stream.pix_fmt = 'yuv420p'
+            stream.bit_rate = int(bitrate.rstrip('k')) * 1000
+            
+            for i in range(round(duration * rate)):
+                img = Image.new('RGB', (size, size), (i * 3 % 256, 80, 160))
+                draw = ImageDraw.Draw(img)
+                for shape in range(6):
+                    x = (i * (shape + 2) * size // rate + shape * size // 6) % size
+                    draw.ellipse((x, shape * size // 6, x + size // 4, (shape + 1) * size // 6), fill=(255, shape * 40, 0))
+                for packet in stream.encode(av.VideoFrame.from_image(img)):
+                    container.mux(packet)
+            for packet in stream.encode():
+                container.mux(packet)
+    except (av.FFmpegError, OSError, ValueError):
+        return False
+    return True
+
+
+class Stopwatch:
+    """Collect wall-clock time per named stage, in milliseconds."""
+    
+    def __init__(self):
+        self.stages = {}
+        self._start = time.perf_counter()
+    
+    def lap(self, stage: str = None):
+        """End the current stage; without a name its time is discarded."""
+        now = time.perf_counter()
+        if stage:
+            self.stages[stage] = round(self.stages.get(stage, 0) + (now - self._start) * 1000, 2)
+        self._start = now
+
+
+def timed(func, *args, repeat: int = 3, **kwargs) -> float:
+    """Best wall-clock time of several calls, in milliseconds."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best, 2)
+
+
+def bench_tgs(tgs_bytes: bytes, size: int = 100) -> dict:
+    """Time the TGS -> WEBM path stage by stage."""
+    from rlottie_python import LottieAnimation
+    from . import encoding, frames, preflight
+    
+    watch = Stopwatch()
+    check = preflight.check_tgs(tgs_bytes)
+    watch.lap('preflight')
+    
+    decompressed = gzip.decompress(tgs_bytes).decode('utf-8')
+    watch.lap('decompress')
+    
+    complexity = encoding.count_elements(json.loads(decompressed))
+    anim = LottieAnimation.from_data(decompressed)
+    watch.lap('parse')
+    
+    fps = anim.lottie_animation_get_framerate()
+    frame_count = min(anim.lottie_animation_get_totalframe(), int(fps * 3))
+    motion = frames.probe_motion(lambda numbers: engine.iter_raw_frames_at(anim, numbers, size), frame_count, size)
+    watch.lap('probe_motion')
+    
+    plan = encoding.plan_encode(complexity, fps, frame_count, motion)
+    timeline = frames.build_timeline(engine.iter_raw_frames(anim, frame_count, size, plan.frame_step))
+    watch.lap('render_and_dedupe')
+    
+    result = {
+        'frames': frame_count,
+        'fps': fps,
+        'complexity': round(complexity.score, 1),
+        'estimated_ms': check.estimated_ms,
+        'motion': round(motion, 4),
+        'frame_step': plan.frame_step,
+        'encoded_frames': len(timeline.frames),
+    }
+    if engine.pick_encoders():
+        watch.lap()
+        report = engine.render_tgs_to_webm(tgs_bytes, size=size)
+        watch.lap('render_and_encode')
+        result['encode_attempts'] = report.attempts if report else None
+        result['output_bytes'] = report.size_bytes if report else None
+    
+    watch.lap()
+    engine.render_tgs_to_png(tgs_bytes, size=size)
+    watch.lap('first_frame_png')
+    
+    result['stages_ms'] = watch.stages
+    return result
+
+
+def bench_static(image_bytes: bytes, png_mode: str = 'optimize') -> dict:
+    """Time the static sticker path stage by stage."""
+    from PIL import Image
+    from .static import PNG_MODES
+    
+    converter = StaticConverter(png_mode=png_mode)
+    watch = Stopwatch()
+    
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        img.load()
+    watch.lap('decode')
+    
+    img = converter.resize(image_bytes)
+    watch.lap('decode_and_resize')
+    
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG', **PNG_MODES[png_mode])
+    watch.lap('encode')
+    
+    return {'output_bytes': len(buffer.getvalue()), 'stages_ms': watch.stages}
+
+
+def bench_webm(webm_bytes: bytes) -> dict:
+    """Time the video sticker path: a probe, then a pass-through or a transcode."""
+    watch = Stopwatch()
+    job = engine.ConversionJob('video', webm_bytes, 'out.webm')
+    watch.lap()
+    result = engine.run_job(job)
+    watch.lap('convert')
+    return {
+        'input_bytes': len(webm_bytes),
+        'output_bytes': result.size_bytes,
+        'transcoded': 'encode' in result.stages_ms,
+        'attempts': result.attempts,
+        'stages_ms': {**result.stages_ms, **watch.stages}
+    }
+
+
+def parse_importtime(stderr: str) -> dict:
+    """Module -> (cumulative import time in microseconds, nesting depth) from python -X importtime."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        modules[name.strip()] = (int(cumulative), depth)
+    return modules
+
+
+def bench_startup(args: list, env: dict = None, repeat: int = 5) -> dict:
+    """Time one CLI invocation in a fresh interpreter, and what it imported."""
+    run_env = {key: value for key, value in os.environ.items() if not key.startswith('TELEGRAM_')}
+    run_env.update(env or {})
+    package_root = str(Path(__file__).resolve().parent.parent)
+    run_env['PYTHONPATH'] = os.pathsep.join(filter(None, [package_root, run_env.get('PYTHONPATH')]))
+    command = [sys.executable, '-m', __package__] + args
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        wall_ms = timed(subprocess.run, command, env=run_env, cwd=tmpdir, capture_output=True, repeat=repeat)
+        result = subprocess.run(
+            command[:1] + ['-X', 'importtime'] + command[1:], env=run_env, cwd=tmpdir, capture_output=True
+        )
+    
+    modules = parse_importtime(result.stderr.decode('utf-8', errors='replace'))
+    return {
+        'exit_code': result.returncode,
+        'wall_ms': wall_ms,
+        'import_ms': round(sum(us for us, depth in modules.values() if depth == 0) / 1000, 2),
+        'package_import_ms': round(modules.get(f'{__package__}.cli', (0, 0))[0] / 1000, 2),
+        'heavy_modules': [name for name in HEAVY_MODULES if name in modules],
+    }
+
+
+def check_startup(cases: dict, max_ms: float) -> list:
+    """Startup cases that went over max_ms or loaded heavy modules."""
+    problems = []
+    for name, case in sorted(cases.items()):
+        if not name.startswith('startup_'):
+            continue
+        if case['wall_ms'] > max_ms:
+            problems.append(f"{name}: {case['wall_ms']:.0f} ms > {max_ms:.0f} ms")
+        # Subcommands import their own module before parsing, so only the main command is held to this
+        if case['heavy_modules'] and name in ('startup_help', 'startup_bad_credentials'):
+            problems.append(f"{name}: imported {', '.join(case['heavy_modules'])}")
+    return problems
+
+
+def run_startup(repeat: int = 5) -> dict:
+    return {name: bench_startup(args, env, repeat=repeat) for name, (args, env) in STARTUP_FIXTURES.items()}
+
+
+def bench_frame_modes(tgs_bytes: bytes, size: int = 100, repeat: int = 3) -> dict:
+    """Compare encoding in-process, piping raw frames into ffmpeg and the PNG-directory path."""
+    anim, fps, frame_count, _ = engine.load_animation(tgs_bytes)
+    
+    def produce_png():
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for frame_num in range(frame_count):
+                img = anim.render_pillow_frame(frame_num, width=size, height=size)
+                img.save(Path(tmpdir) / f"frame_{frame_num:04d}.png", format='PNG')
+    
+    def produce_raw():
+        for _ in engine.iter_raw_frames(anim, frame_count, size):
+            pass
+    
+    results = {
+        'frames_ms': {
+            'png': timed(produce_png, repeat=repeat),
+            'pipe': timed(produce_raw, repeat=repeat)
+        }
+    }
+    
+    modes = [mode for mode in engine.FRAME_MODES if engine.frame_mode_available(mode)]
+    if modes:
+        results['encode_ms'] = {
+            mode: timed(engine.render_tgs_to_webm, tgs_bytes, size=size, frame_mode=mode, repeat=repeat)
+            for mode in modes
+        }
+    
+    return results
+
+
+def _run_case(func, *args) -> dict:
+    """Run one benchmark case and attach the process's peak RSS, where it can be measured."""
+    result = func(*args)
+    try:
+        import resource  # Unix only
+    except ImportError:
+        result['peak_rss_kb'] = None
+        return result
+    # ru_maxrss is in KB on Linux, bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result['peak_rss_kb'] = maxrss // 1024 if sys.platform == 'darwin' else maxrss
+    return result
+
+
+def run_isolated(func, *args) -> dict:
+    """Run a case in a fresh process so peak RSS belongs to that case alone."""
+    # Spawn, not fork: rlottie's render threads in this process don't survive a fork
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(_run_case, func, *args).result()
+
+
+def run_all(repeat: int = 3, startup_only: bool = False) -> dict:
+    """Run every benchmark case."""
+    cases = run_startup()
+    if startup_only:
+        return {'meta': bench_meta(), 'cases': cases}
+    
+    for name, options in TGS_FIXTURES.items():
+        tgs_bytes = make_tgs(**options)
+        cases[name] = run_isolated(bench_tgs, tgs_bytes)
+        cases[name]['frame_modes'] = bench_frame_modes(tgs_bytes, repeat=repeat)
+    
+    for name, options in WEBP_FIXTURES.items():
+        webp_bytes = make_webp(**options)
+        for png_mode in ('optimize', 'fast'):
+            cases[f'{name}_{png_mode}'] = run_isolated(bench_static, webp_bytes, png_mode)
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        webm_path = Path(tmpdir) / 'clip.webm'
+        # A 512 px 60 fps sticker is transcoded; an emoji-sized clip is passed through
+        fixtures = {'webm_clip': {'rate': 60, 'duration': 4.0}, 'webm_emoji': {'size': 100, 'bitrate': '100k'}}
+        for name, options in fixtures.items():
+            if make_webm(webm_path, **options):
+                cases[name] = run_isolated(bench_webm, webm_path.read_bytes())
+            else:
+                # Listed rather than silently left out of the results
+                cases[name] = {'skipped': 'needs ffmpeg or PyAV with libvpx-vp9'}
+    
+    return {'meta': bench_meta(), 'cases': cases}
+
+
+def bench_meta() -> dict:
+    return {
+        'version': __version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'ffmpeg': engine.ffmpeg_available(),
+        'pyav': engine.pyav_available(),
+    }
+
+
+def iter_numbers(data, prefix: str = ''):
+    """Yield (dotted.path, value) for every number in nested results."""
+    if isinstance(data, dict):
+        for key, value in data.items():
+            yield from iter_numbers(value, f"{prefix}{key}.")
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        yield prefix.rstrip('.'), data
+
+
+def compare(old: dict, new: dict) -> list:
+    """Lines describing how timings and sizes changed between two runs."""
+    old_values = dict(iter_numbers(old.get('cases', {})))
+    lines = []
+    for path, value in iter_numbers(new.get('cases', {})):
+        before = old_values.get(path)
+        if before is None:
+            lines.append(f"  {path}: {value} (new)")
+        elif before != value:
+            change = f"{(value - before) / before * 100:+.1f}%" if before else "n/a"
+            lines.append(f"  {path}: {before} -> {value} ({change})")
+    return lines
+
+
+def main(argv=None):
+    """Run the benchmarks and print or save JSON results."""
+    parser = argparse.ArgumentParser(description="Benchmark sticker conversion paths offline")
+    parser.add_argument("-o", "--output", help="Write JSON results to this file")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Runs per frame-mode measurement, best is kept (default: 3)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--startup-only", action="store_true", help="Only run the CLI startup cases")
+    parser.add_argument("--max-startup-ms", type=float, help="Fail if a startup case takes longer or loads heavy modules")
+    args = parser.parse_args(argv)
+    
+    results = run_all(repeat=args.repeat, startup_only=args.startup_only)
+    
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        Path(args.output).write_text(output + '\n', encoding='utf-8')
+    else:
+        print(output)
+    
+    if args.compare:
+        old = json.loads(Path(args.compare).read_text(encoding='utf-8'))
+        print(f"\nChanges since {args.compare}:", file=sys.stderr)
+        for line in compare(old, results) or ["  (none)"]:
+            print(line, file=sys.stderr)
+    
+    if args.max_startup_ms is not None:
+        problems = check_startup(results['cases'], args.max_startup_ms)
+        for problem in problems:
+            print(f"Slow startup: {problem}", file=sys.stderr)
+        return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
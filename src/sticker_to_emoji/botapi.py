@@ -0,0 +1,218 @@
+"""
+Bot API client.
+
+Every Bot API call for a bot token goes through one BotAPIClient. It caps the
+number of requests in flight, spaces them with a token bucket and retries
+transient failures: network errors and 5xx responses with jittered
+exponential backoff, 429 Too Many Requests after the retry_after Telegram
+asks for. A 429 pauses the whole bucket, not just the request that hit it, so
+the other uploads in flight back off too instead of piling up more 429s.
+
+After a network error or a 5xx, Telegram may have applied the call and only
+the response was lost. Reads and uploads are simply sent again; calls that
+change a set are only repeated once the caller has checked (usually with
+getStickerSet) that the lost attempt didn't go through, so a set isn't
+created twice or given the same emoji twice.
+
+The client rides on the caller's aiohttp session, whose connector keeps
+connections to the Bot API alive between requests.
+"""
+
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+
+import aiohttp
+
+from .metrics import Metrics
+
+API_URL = "https://api.telegram.org"
+DEFAULT_CONCURRENCY = 4
+DEFAULT_RATE = 20.0  # Requests per second per bot, under Telegram's ~30/s
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5  # Seconds
+BACKOFF_MAX = 30.0
+
+# Safe to send again when it's unknown whether the last attempt went through.
+# Moving a sticker to a position twice leaves it there, like doing it once.
+IDEMPOTENT_METHODS = frozenset({'getMe', 'getStickerSet', 'uploadStickerFile', 'setStickerPositionInSet'})
+
+
+class BotAPIError(ValueError):
+    """A Bot API call that returned ok: false."""
+    
+    def __init__(self, method: str, description: str, error_code: int = None, retry_after: float = None):
+        super().__init__(description)
+        self.method = method
+        self.description = description
+        self.error_code = error_code
+        self.retry_after = retry_after
+    
+    @property
+    def transient(self) -> bool:
+        """Whether the same call may succeed if retried."""
+        return self.error_code == 429 or (self.error_code or 0) >= 500
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff for the given retry number (0-based)."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+class TokenBucket:
+    """Token bucket rate limiter that can be paused for a retry_after."""
+    
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self):
+        """Wait for a token. Waiters are served in arrival order."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+    
+    def wait_time(self) -> float:
+        """Seconds until the next token would be handed out, if nobody else is waiting."""
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        return max(0.0, (1 - tokens) / self.rate)
+    
+    def pause(self, seconds: float):
+        """Hand out no tokens for the next `seconds`."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+
+class BotAPIClient:
+    """Rate-limited, retrying Bot API calls for one bot token."""
+    
+    def __init__(
+        self,
+        token: str,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        rate: float = DEFAULT_RATE,
+        max_retries: int = MAX_RETRIES,
+        base_url: str = API_URL,
+        metrics: Metrics = None
+    ):
+        self.url = f"{base_url}/bot{token}"
+        self.bot_id = token.split(':')[0]
+        self.max_retries = max_retries
+        self.metrics = metrics or Metrics()
+        self.requests = defaultdict(int)  # Successful calls per method
+        self.rate_limited = 0  # 429 responses
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._bucket = TokenBucket(rate, burst=concurrency)
+    
+    def wait_time(self) -> float:
+        """Seconds before this bot can send another request: a 429 pause, then the rate limit."""
+        return self._bucket.wait_time()
+    
+    async def call(
+        self,
+        session: aiohttp.ClientSession,
+        method: str,
+        params: dict = None,
+        files: dict = None,
+        applied=None
+    ):
+        """Call a Bot API method and return its result, retrying transient failures.
+        
+        params are sent as JSON, or as form fields when files are attached.
+        files maps a field name to (filename, content bytes, content type).
+        
+        Methods not in IDEMPOTENT_METHODS are only retried after a network
+        error or 5xx if `applied` is given: an async function that tells
+        whether the failed attempt took effect after all. If it did, True is
+        returned, as the method itself would.
+        """
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.metrics.count('api_retries_total', method=method)
+            
+            # Each attempt is its own span, including its wait for a token
+            with self.metrics.span('api_call', method=method, attempt=attempt + 1, bot=self.bot_id) as span:
+                try:
+                    result = await self._request(session, method, params, files)
+                    self.requests[method] += 1
+                    self.metrics.count('api_requests_total', bot=self.bot_id, method=method)
+                    return result
+                except BotAPIError as e:
+                    span['ok'] = False
+                    span['error_code'] = e.error_code
+                    if e.error_code == 429:
+                        self.rate_limited += 1
+                        self.metrics.count('api_rate_limited_total', bot=self.bot_id)
+                    if not e.transient or attempt == self.max_retries:
+                        raise
+                    if e.retry_after:
+                        # The bucket makes every request for this bot wait it out
+                        self._bucket.pause(e.retry_after)
+                        continue
+                    error = e
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    if attempt == self.max_retries:
+                        raise
+                    span['ok'] = False
+                    error = e
+            
+            # A 429 means the call wasn't applied, so any method can be sent again
+            unsure = method not in IDEMPOTENT_METHODS and getattr(error, 'error_code', None) != 429
+            if unsure and applied is None:
+                raise error
+            await asyncio.sleep(backoff_delay(attempt))
+            if unsure and await applied():
+                return True
+    
+    async def _request(self, session: aiohttp.ClientSession, method: str, params: dict, files: dict):
+        """Send one request. Raises BotAPIError if Telegram returns ok: false."""
+        if files:
+            # FormData can only be sent once, so it is rebuilt for every attempt
+            data = aiohttp.FormData()
+            for key, value in (params or {}).items():
+                data.add_field(key, value if isinstance(value, str) else json.dumps(value))
+            for field, (filename, content, content_type) in files.items():
+                data.add_field(field, content, filename=filename, content_type=content_type)
+            kwargs = {'data': data}
+        else:
+            kwargs = {'json': params or {}}
+        
+        async with self._semaphore:
+            await self._bucket.acquire()
+            async with session.post(f"{self.url}/{method}", **kwargs) as response:
+                try:
+                    result = await response.json(content_type=None)
+                except ValueError:
+                    result = None
+                if not isinstance(result, dict):
+                    raise BotAPIError(method, f"HTTP {response.status}", error_code=response.status)
+        
+        if result.get('ok'):
+            return result['result']
+        
+        parameters = result.get('parameters') or {}
+        raise BotAPIError(
+            method,
+            result.get('description', 'Unknown error'),
+            error_code=result.get('error_code', response.status),
+            retry_after=parameters.get('retry_after')
+        )
@@ -0,0 +1,175 @@
+"""
+A pool of bots to upload with.
+
+Every Bot API call is rate limited per bot token, and a 429 pauses
+everything that bot is doing. With more than one bot, packs are spread over
+them: each new pack goes to the bot expected to be free soonest, judging by
+what is left of its rate budget (see botapi.TokenBucket) and the packs it is
+already working on. Each bot is paired with the owner account its packs are
+created for.
+
+Extra bots come from the environment (or .env) and from a --bots file:
+
+    TELEGRAM_BOT_TOKENS=111:AAA,222:BBB
+    TELEGRAM_USER_IDS=987654321,123456789   # Optional, one per token
+
+    # bots.txt: <bot token> [owner user id]
+    333:CCC 987654321
+
+TELEGRAM_BOT_TOKEN stays the first bot in the pool, and owners default to
+TELEGRAM_USER_ID. A pack belongs to the bot that created it (its name ends
+in _by_<bot>), so --sync sends a pack back to its owner bot.
+"""
+
+import os
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Optional
+
+from .botapi import API_URL, DEFAULT_CONCURRENCY, BotAPIClient
+from .metrics import Metrics
+
+DEFAULT_PACK_SECONDS = 60.0  # Assumed length of a pack until a bot has finished one
+
+
+def parse_id_list(value: str) -> list:
+    return [item for item in value.replace(',', ' ').split() if item]
+
+
+def read_bot_list(path: Path) -> list:
+    """Read (token, user id or None) pairs from a bot list file. Blank lines and # comments are skipped."""
+    bots = []
+    for number, line in enumerate(Path(path).read_text(encoding='utf-8').splitlines(), 1):
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        parts = line.split()
+        try:
+            user_id = int(parts[1]) if len(parts) > 1 else None
+        except ValueError:
+            raise ValueError(f"{path}:{number}: owner user id must be a number")
+        bots.append((parts[0], user_id))
+    return bots
+
+
+def load_bot_list(path: Optional[str], default_user_id: int) -> list:
+    """Extra (token, user_id) pairs from TELEGRAM_BOT_TOKENS / TELEGRAM_USER_IDS and a bot list file."""
+    if 'TELEGRAM_BOT_TOKENS' not in os.environ:
+        from dotenv import load_dotenv
+        load_dotenv()
+    
+    tokens = parse_id_list(os.getenv('TELEGRAM_BOT_TOKENS', ''))
+    user_ids = parse_id_list(os.getenv('TELEGRAM_USER_IDS', ''))
+    if user_ids and len(user_ids) not in (1, len(tokens)):
+        raise ValueError("TELEGRAM_USER_IDS needs one id, or one per token in TELEGRAM_BOT_TOKENS")
+    try:
+        user_ids = [int(user_id) for user_id in user_ids]
+    except ValueError:
+        raise ValueError("TELEGRAM_USER_IDS must be numbers")
+    
+    bots = [(token, user_ids[i % len(user_ids)] if user_ids else None) for i, token in enumerate(tokens)]
+    if path:
+        bots += read_bot_list(Path(path))
+    return [(token, default_user_id if user_id is None else user_id) for token, user_id in bots]
+
+
+class BotAccount:
+    """A bot token, the account its packs are created for, and how it has been doing."""
+    
+    def __init__(self, token: str, user_id: int, api: BotAPIClient):
+        self.token = token
+        self.user_id = user_id
+        self.api = api
+        self.bot_id = token.split(':')[0]
+        self.username = None  # Filled in by getMe
+        self.active = 0  # Packs in progress
+        self.packs = 0
+        self.busy_seconds = 0.0
+    
+    @property
+    def name(self) -> str:
+        return f"@{self.username}" if self.username else self.bot_id
+    
+    @property
+    def uploads(self) -> int:
+        return self.api.requests['uploadStickerFile']
+    
+    @property
+    def throughput(self) -> float:
+        """Stickers uploaded per second of pack time."""
+        return self.uploads / self.busy_seconds if self.busy_seconds else 0.0
+    
+    def expected_wait(self) -> float:
+        """Seconds until this bot could start on a new pack."""
+        pack_seconds = self.busy_seconds / self.packs if self.packs else DEFAULT_PACK_SECONDS
+        return self.api.wait_time() + self.active * pack_seconds
+    
+    def stats(self) -> dict:
+        return {
+            'bot': self.name,
+            'active': self.active,
+            'packs': self.packs,
+            'uploads': self.uploads,
+            'uploads_per_second': round(self.throughput, 2),
+            'rate_limited': self.api.rate_limited,
+            'wait_seconds': round(self.api.wait_time(), 1),
+        }
+
+
+class BotPool:
+    """The bots a converter uploads with; the first is TELEGRAM_BOT_TOKEN."""
+    
+    def __init__(
+        self,
+        bots: list,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        base_url: str = API_URL,
+        metrics: Metrics = None
+    ):
+        self.accounts = []
+        seen = set()
+        for token, user_id in bots:
+            if token in seen:
+                continue
+            seen.add(token)
+            api = BotAPIClient(token, concurrency=concurrency, base_url=base_url, metrics=metrics)
+            self.accounts.append(BotAccount(token, user_id, api))
+    
+    def __len__(self) -> int:
+        return len(self.accounts)
+    
+    @property
+    def primary(self) -> BotAccount:
+        return self.accounts[0]
+    
+    def pick(self) -> BotAccount:
+        """The bot expected to be free soonest; the faster one when that's a tie."""
+        return min(self.accounts, key=lambda account: (round(account.expected_wait(), 1), -account.throughput))
+    
+    @asynccontextmanager
+    async def lease(self, account: BotAccount = None):
+        """Use a bot for one pack, picking one unless given, and count the time against it."""
+        account = account or self.pick()
+        account.active += 1
+        start = time.perf_counter()
+        try:
+            yield account
+        finally:
+            account.active -= 1
+            account.packs += 1
+            account.busy_seconds += time.perf_counter() - start
+    
+    def stats(self) -> list:
+        return [account.stats() for account in self.accounts]
+    
+    def print_summary(self):
+        """Print each bot's packs and throughput, if there is more than one."""
+        if len(self) < 2:
+            return
+        print("\n🤖 Bots:")
+        for stats in self.stats():
+            print(
+                f"   {stats['bot']}: {stats['packs']} packs, {stats['uploads']} uploads, "
+                f"{stats['uploads_per_second']}/s, rate limited {stats['rate_limited']}x"
+            )
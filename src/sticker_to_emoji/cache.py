@@ -0,0 +1,195 @@
+"""
+Content-addressed cache for converted emoji files.
+
+Converted outputs are stored by a hash of the source sticker bytes and the
+render settings, with a small alias per Telegram document (id + access hash)
+so a repeat run can skip the download as well as the render. Each entry also
+remembers the Bot API file_id returned by uploadStickerFile, per bot, so
+repeat uploads can be skipped entirely.
+
+Layout:
+    objects/ab/<key>.<ext>   converted file
+    objects/ab/<key>.json    metadata (format, file ids, document aliases)
+    documents/<doc key>      content key of a converted Telegram document
+
+Evicting an entry deletes the document aliases that point at it too.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "sticker-to-emoji"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+@dataclass
+class CacheEntry:
+    """A converted emoji stored in the cache."""
+    key: str
+    path: Path
+    sticker_format: str
+    file_ids: dict = field(default_factory=dict)  # bot id -> Bot API file_id
+
+
+def atomic_write(path: Path, data: bytes):
+    """Write a file so readers never see a partial version."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class ConversionCache:
+    """On-disk LRU cache of converted emoji files."""
+    
+    def __init__(self, directory: Path = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.objects_dir = self.directory / "objects"
+        self.documents_dir = self.directory / "documents"
+        self._total_bytes = None
+    
+    @staticmethod
+    def content_key(data: bytes, params: str) -> str:
+        """Key for sticker bytes rendered with the given settings."""
+        digest = hashlib.sha256(params.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(data)
+        return digest.hexdigest()
+    
+    @staticmethod
+    def document_key(document_id: int, access_hash: int, params: str) -> str:
+        """Key for a Telegram document rendered with the given settings."""
+        return hashlib.sha256(f"{document_id}:{access_hash}:{params}".encode('utf-8')).hexdigest()
+    
+    def _meta_path(self, key: str) -> Path:
+        return self.objects_dir / key[:2] / f"{key}.json"
+    
+    def _read_meta(self, key: str) -> Optional[dict]:
+        try:
+            return json.loads(self._meta_path(key).read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return None
+    
+    def _write_meta(self, key: str, meta: dict):
+        atomic_write(self._meta_path(key), json.dumps(meta).encode('utf-8'))
+    
+    @staticmethod
+    def _unlink(path: Path):
+        try:
+            path.unlink()
+        except OSError:
+            pass
+    
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """Look up a converted file by content key and mark it recently used."""
+        meta = self._read_meta(key)
+        if meta is None:
+            return None
+        
+        path = self.objects_dir / key[:2] / f"{key}{meta['ext']}"
+        try:
+            os.utime(path)
+        except OSError:
+            # Evicted by another process
+            return None
+        
+        return CacheEntry(key, path, meta['format'], meta.get('file_ids', {}))
+    
+    def get_document(self, document_key: str) -> Optional[CacheEntry]:
+        """Look up a converted file by Telegram document key."""
+        try:
+            key = (self.documents_dir / document_key).read_text(encoding='utf-8').strip()
+        except OSError:
+            return None
+        entry = self.get(key)
+        if entry is None:
+            # Dangling: evicted by another process, or left behind by an older version
+            self._unlink(self.documents_dir / document_key)
+        return entry
+    
+    def put(self, key: str, data: bytes, suffix: str, sticker_format: str, document_key: str = None) -> CacheEntry:
+        """Store a converted file, e.g. data with suffix '.webm'."""
+        path = self.objects_dir / key[:2] / f"{key}{suffix}"
+        
+        atomic_write(path, data)
+        meta = self._read_meta(key) or {}
+        # Same key, same content: uploads from an earlier put are still good
+        file_ids = meta.get('file_ids', {})
+        self._write_meta(key, {
+            'format': sticker_format,
+            'ext': path.suffix,
+            'file_ids': file_ids,
+            'documents': meta.get('documents', []),
+        })
+        if document_key:
+            self.link_document(document_key, key)
+        
+        if self._total_bytes is not None:
+            self._total_bytes += len(data)
+        if self._total_bytes is None or self._total_bytes > self.max_bytes:
+            self.evict()
+        
+        return CacheEntry(key, path, sticker_format, file_ids)
+    
+    def link_document(self, document_key: str, key: str):
+        """Point a Telegram document at an existing content key."""
+        meta = self._read_meta(key)
+        if meta is None:
+            return
+        atomic_write(self.documents_dir / document_key, key.encode('utf-8'))
+        documents = meta.setdefault('documents', [])
+        if document_key not in documents:
+            documents.append(document_key)
+            self._write_meta(key, meta)
+    
+    def set_file_id(self, key: str, bot_id: str, file_id: str):
+        """Remember the Bot API file_id of an uploaded entry."""
+        meta = self._read_meta(key)
+        if meta is None:
+            return
+        meta.setdefault('file_ids', {})[bot_id] = file_id
+        self._write_meta(key, meta)
+    
+    def evict(self):
+        """Delete least recently used entries until the cache fits max_bytes."""
+        files = []
+        total = 0
+        for path in self.objects_dir.glob("*/*"):
+            if path.suffix == '.json' or path.name.startswith('.tmp-'):
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        
+        self._total_bytes = total
+        if total <= self.max_bytes:
+            return
+        
+        for _, file_size, path in sorted(files):
+            meta = self._read_meta(path.stem) or {}
+            for document_key in meta.get('documents', []):
+                self._unlink(self.documents_dir / document_key)
+            self._unlink(path)
+            self._unlink(path.with_suffix('.json'))
+            total -= file_size
+            if total <= self.max_bytes:
+                break
+        
+        self._total_bytes = total
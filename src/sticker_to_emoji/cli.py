@@ -0,0 +1,168 @@
+"""
+Command line entry point.
+
+    sticker-to-emoji Opa4958
+    python -m sticker_to_emoji batch packs.txt
+
+Only the standard library is imported here: options are parsed and
+credentials checked before Telethon, aiohttp or the conversion engine are
+loaded, so --help and a missing variable answer at once. This matters when
+the CLI is started thousands of times, e.g. from cron. `python -m
+sticker_to_emoji.bench --startup-only` measures it.
+"""
+
+import argparse
+import importlib
+import os
+import sys
+from pathlib import Path
+
+MAX_EMOJI_PER_SET = 200
+
+CREDENTIAL_VARS = ("TELEGRAM_API_ID", "TELEGRAM_API_HASH", "TELEGRAM_BOT_TOKEN", "TELEGRAM_USER_ID")
+# Enough for commands that only use the Bot API
+BOT_CREDENTIAL_VARS = ("TELEGRAM_BOT_TOKEN", "TELEGRAM_USER_ID")
+
+# Subcommand -> (module, entry point); a module is only imported when its subcommand runs
+SUBCOMMANDS = {
+    "batch": ("batch", "batch_main"),
+    "convert-local": ("local", "convert_local_main"),
+    "upload-local": ("local", "upload_local_main"),
+    "serve": ("service", "serve_main"),
+}
+
+
+def add_common_arguments(parser: argparse.ArgumentParser):
+    """Options shared by single-pack and batch runs."""
+    parser.add_argument("-l", "--limit", type=int, default=MAX_EMOJI_PER_SET, help=f"Max emojis (default and maximum: {MAX_EMOJI_PER_SET})")
+    parser.add_argument("--save-local", action="store_true", help="Also save converted files to --output (they are uploaded from memory)")
+    parser.add_argument("-o", "--output", default="emoji_output", help="Output directory for --save-local (default: emoji_output)")
+    parser.add_argument("--download-concurrency", type=int, default=4, help="Parallel sticker downloads (default: 4)")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1, help="Conversion worker processes (default: CPU count)")
+    parser.add_argument("--convert-concurrency", type=int, help="Conversions in flight (default: twice --workers)")
+    parser.add_argument("--upload-concurrency", type=int, default=4, help="Parallel Bot API uploads (default: 4)")
+    parser.add_argument("--fast-png", action="store_true", help="Single-pass PNG compression for static emojis (faster, slightly larger)")
+    parser.add_argument("--cache-dir", help="Conversion cache directory (default: ~/.cache/sticker-to-emoji)")
+    parser.add_argument("--cache-size", type=int, default=512, help="Max conversion cache size in MB (default: 512)")
+    parser.add_argument("--no-cache", action="store_true", help="Don't read or write the conversion cache")
+    parser.add_argument("--sync", action="store_true", help="Update the emoji pack if it already exists instead of creating a new one")
+    parser.add_argument("--bots", metavar="FILE", help="Extra bots to spread packs over, one '<token> [owner user id]' per line")
+    parser.add_argument("--bot-api-url", help="Bot API server, e.g. a local telegram-bot-api (default: https://api.telegram.org)")
+    parser.add_argument("--metrics", metavar="FILE", help="Append per-stage timings as JSON lines to FILE")
+    parser.add_argument("--metrics-prometheus", metavar="FILE", help="Write stage totals in Prometheus text format to FILE at the end of the run")
+
+
+def load_credentials(telegram: bool = True):
+    """Read credentials from the environment, exiting with a message if any are missing.
+    
+    With telegram=False, for commands that never log in to Telegram, only the
+    bot token and user id are required; api_id and api_hash may be None.
+    """
+    required = CREDENTIAL_VARS if telegram else BOT_CREDENTIAL_VARS
+    
+    # Only read .env if the environment doesn't already have everything; it never overrides set variables
+    if not all(os.getenv(var) for var in required):
+        from dotenv import load_dotenv
+        load_dotenv()
+    
+    # Get credentials
+    api_id, api_hash, bot_token, user_id = (os.getenv(var) for var in CREDENTIAL_VARS)
+    
+    # Validate
+    missing = [var for var in required if not os.getenv(var)]
+    
+    if missing:
+        print(f"❌ Error: Missing required environment variables:", file=sys.stderr)
+        for var in missing:
+            print(f"   - {var}", file=sys.stderr)
+        print("\nSet them in .env file or as environment variables", file=sys.stderr)
+        sys.exit(1)
+    
+    try:
+        api_id = int(api_id) if api_id else None
+        user_id = int(user_id)
+    except (ValueError, TypeError):
+        print("❌ Error: API_ID and USER_ID must be numbers", file=sys.stderr)
+        sys.exit(1)
+    
+    return api_id, api_hash, bot_token, user_id
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="sticker-to-emoji",
+        description="Convert Telegram sticker pack to emoji pack",
+        epilog="Example: sticker-to-emoji Opa4958\n"
+               "Batch mode: sticker-to-emoji batch packs.txt (see batch --help)\n"
+               "Offline mode: sticker-to-emoji convert-local stickers/ (see convert-local --help)\n"
+               "Service mode: sticker-to-emoji serve (see serve --help)",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("sticker_pack", help="Sticker pack name or URL")
+    parser.add_argument("-n", "--name", help="Custom name for emoji pack (optional)")
+    add_common_arguments(parser)
+    return parser
+
+
+def load_subcommand(name: str):
+    """Import a subcommand's module and return its async entry point."""
+    module, function = SUBCOMMANDS[name]
+    return getattr(importlib.import_module(f".{module}", __package__), function)
+
+
+async def convert_pack_main(args, credentials):
+    """Convert the sticker pack named on the command line."""
+    from .converter import convert_pack, create_converter, create_session
+    
+    print("🎨 Sticker to Emoji Converter\n")
+    
+    try:
+        async with create_session() as session:
+            async with create_converter(args, credentials) as converter:
+                await convert_pack(
+                    converter, session, args.sticker_pack, args,
+                    Path(args.output), name=args.name
+                )
+                print(f"\n💡 Add this pack in Telegram and use emojis as reactions!")
+    
+    except KeyboardInterrupt:
+        print("\n\n⚠️  Cancelled", file=sys.stderr)
+        sys.exit(130)
+    except Exception as e:
+        print(f"\n❌ Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+async def main(argv: list = None):
+    """Main entry point."""
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in SUBCOMMANDS:
+        return await load_subcommand(argv[0])(argv[1:])
+    
+    args = build_parser().parse_args(argv)
+    await convert_pack_main(args, load_credentials())
+
+
+def run(argv: list = None):
+    """Console script entry point.
+    
+    Options and credentials are checked before asyncio and the converter
+    are imported, so --help and configuration errors exit straight away.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in SUBCOMMANDS:
+        command = load_subcommand(argv[0])(argv[1:])
+    else:
+        args = build_parser().parse_args(argv)
+        command = convert_pack_main(args, load_credentials())
+    
+    import asyncio
+    try:
+        return asyncio.run(command)
+    except KeyboardInterrupt:
+        print("\n\n⚠️  Cancelled", file=sys.stderr)
+        sys.exit(130)
+
+
+if __name__ == "__main__":
+    run()
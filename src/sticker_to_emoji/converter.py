@@ -4,46 +4,135 @@ One-command sticker pack to emoji pack converter.
 Just run: python sticker_to_emoji.py <sticker_pack_name>
 """
 
-import os
-import sys
 import asyncio
-import argparse
-from pathlib import Path
-from dotenv import load_dotenv
+import copy
+from contextlib import asynccontextmanager
+from pathlib import Path, PurePath
 import aiohttp
 import ssl
-from telethon import TelegramClient
+import time
+from typing import Optional
+from telethon import TelegramClient, errors
 from telethon.tl.types import Document, DocumentAttributeSticker, InputStickerSetShortName, DocumentAttributeFilename
 from telethon.tl.functions.messages import GetStickerSetRequest
-from PIL import Image
-import io
-import gzip
-import json
-from rlottie_python import LottieAnimation
+
+from . import engine
+from .botapi import API_URL, BotAPIError
+from .bots import BotAccount, BotPool, load_bot_list
+from .cache import DEFAULT_CACHE_DIR, CacheEntry, ConversionCache
+# The command line lives in cli.py; these names stay importable from here
+from .cli import MAX_EMOJI_PER_SET, add_common_arguments, load_credentials, main, run  # noqa: F401
+from .downloads import DownloadManager
+from .engine import ConversionEngine, ConversionJob, ConversionResult
+from .metrics import Metrics
+from .pipeline import PipelineConfig, PipelineResult, StickerPipeline
+from .sync import SyncState, plan_moves, plan_sync
+
+# createNewStickerSet takes at most 50 stickers; the rest are added one by one
+MAX_INITIAL_STICKERS = 50
 
 
 class StickerToEmojiConverter:
     """Convert Telegram sticker packs to emoji packs."""
     
-    def __init__(self, api_id: int, api_hash: str, bot_token: str, user_id: int):
+    def __init__(
+        self,
+        api_id: int,
+        api_hash: str,
+        bot_token: str,
+        user_id: int,
+        workers: int = None,
+        cache: ConversionCache = None,
+        download_concurrency: int = 4,
+        png_mode: str = 'optimize',
+        upload_concurrency: int = 4,
+        metrics: Metrics = None,
+        bot_api_url: str = API_URL,
+        extra_bots: list = None
+    ):
         self.api_id = api_id
         self.api_hash = api_hash
-        self.bot_token = bot_token
-        self.user_id = user_id
-        self.bot_api_url = f"https://api.telegram.org/bot{bot_token}"
-        self.bot_username = None
+        self.metrics = metrics or Metrics()
+        # (token, owner user id) pairs; packs are spread over them, see bots.py
+        self.bots = BotPool(
+            [(bot_token, user_id)] + list(extra_bots or ()),
+            concurrency=upload_concurrency, base_url=bot_api_url, metrics=self.metrics
+        )
+        self.use_bot(self.bots.primary)
         self.client = None
+        self.downloads = None
+        self.download_concurrency = download_concurrency
+        self.engine = ConversionEngine(workers)
+        self.cache = cache
+        self.png_mode = png_mode
+        
+    def use_bot(self, account: BotAccount):
+        """Upload with, and create packs for, this bot from now on."""
+        self.account = account
+        self.bot_token = account.token
+        self.user_id = account.user_id
+        self.bot_api = account.api
+        self.bot_id = account.bot_id
+    
+    @property
+    def bot_username(self) -> Optional[str]:
+        return self.account.username
+    
+    @bot_username.setter
+    def bot_username(self, username: str):
+        self.account.username = username
+    
+    def view(self, account: BotAccount = None, **context) -> 'StickerToEmojiConverter':
+        """A converter sharing this one's Telegram client, workers and cache, for one pack.
         
+        It uploads with `account` (default: the same bot) and adds context to
+        its metrics events, so packs converted side by side don't mix up.
+        Only the original converter should be closed.
+        """
+        converter = copy.copy(self)
+        converter.use_bot(account or self.account)
+        converter.metrics = self.metrics.bind(**context)
+        return converter
+    
+    @asynccontextmanager
+    async def lease_bot(self, account: BotAccount = None):
+        """Yield a view that uploads with the pool's least busy bot, or the given one, while a pack is made."""
+        async with self.bots.lease(account) as account:
+            yield self.view(account, bot=account.bot_id)
+    
+    async def find_set_owner(self, pack_name: str, session: aiohttp.ClientSession) -> Optional[BotAccount]:
+        """The bot in the pool that already has this emoji set, if there is more than one bot to ask."""
+        if len(self.bots) < 2:
+            return None
+        for account in self.bots.accounts:
+            converter = self.view(account)
+            if await converter.get_sticker_set(await converter.get_full_pack_name(pack_name, session), session):
+                return account
+        return None
+    
     async def __aenter__(self):
         """Setup Telegram client."""
+        await self.connect()
+        return self
+    
+    async def connect(self):
+        """Start the Telegram client, logging in on the first run."""
+        if self.client is not None:
+            return
         self.client = TelegramClient("sticker_session", self.api_id, self.api_hash)
         await self.client.start()
-        return self
+        self.downloads = DownloadManager(self.client, concurrency=self.download_concurrency)
         
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         """Cleanup."""
+        await self.close()
+    
+    async def close(self):
+        """Disconnect from Telegram and stop the worker pool."""
         if self.client:
             await self.client.disconnect()
+        self.engine.shutdown()
+        self.metrics.close()
     
     def is_animated_sticker(self, sticker: Document) -> bool:
         """Check if sticker is animated (TGS format)."""
@@ -57,103 +146,14 @@ class StickerToEmojiConverter:
         """Check if sticker is video (WEBM format)."""
         return sticker.mime_type == 'video/webm'
     
-    def render_tgs_to_png(self, tgs_bytes: bytes, output_path: Path, size: int = 100):
+    def render_tgs_to_png(self, tgs_bytes: bytes, size: int = 100) -> Optional[bytes]:
         """Render TGS (Lottie) animation to PNG (first frame) - for static emojis."""
-        try:
-            # Decompress gzip
-            decompressed = gzip.decompress(tgs_bytes)
-            
-            # Load animation with rlottie
-            anim = LottieAnimation.from_data(decompressed.decode('utf-8'))
-            
-            # Render first frame using Pillow
-            img = anim.render_pillow_frame(0, width=size, height=size)
-            
-            # Ensure RGBA
-            if img.mode != 'RGBA':
-                img = img.convert('RGBA')
-            
-            # Center and save
-            emoji_img = Image.new('RGBA', (size, size), (0, 0, 0, 0))
-            emoji_img.paste(img, (0, 0), img)
-            emoji_img.save(output_path, format='PNG', optimize=True)
-            
-            return True
-            
-        except Exception as e:
-            # Fallback: if rendering fails, skip
-            return False
+        return engine.render_tgs_to_png(tgs_bytes, size=size, png_mode=self.png_mode)
     
-    def render_tgs_to_webm(self, tgs_bytes: bytes, output_path: Path, size: int = 100):
+    def render_tgs_to_webm(self, tgs_bytes: bytes, size: int = 100) -> Optional[bytes]:
         """Render TGS (Lottie) animation to WEBM - for animated emojis."""
-        try:
-            import subprocess
-            import tempfile
-            
-            # Decompress gzip
-            decompressed = gzip.decompress(tgs_bytes)
-            
-            # Load animation with rlottie  
-            anim = LottieAnimation.from_data(decompressed.decode('utf-8'))
-            
-            # Get total frames and FPS
-            total_frames = anim.lottie_animation_get_totalframe()
-            fps = anim.lottie_animation_get_framerate()
-            if total_frames == 0 or fps == 0:
-                return False
-            
-            # Telegram limit: max 3 seconds for custom emoji
-            max_duration = 3.0
-            max_frames = int(fps * max_duration)
-            frames_to_render = min(total_frames, max_frames)
-            
-            # Create temp directory for frames
-            with tempfile.TemporaryDirectory() as tmpdir:
-                frames_dir = Path(tmpdir)
-                
-                # Render frames (limited to 3 seconds)
-                for frame_num in range(frames_to_render):
-                    img = anim.render_pillow_frame(frame_num, width=size, height=size)
-                    if img.mode != 'RGBA':
-                        img = img.convert('RGBA')
-                    
-                    frame_path = frames_dir / f"frame_{frame_num:04d}.png"
-                    img.save(frame_path, format='PNG')
-                
-                # Check if ffmpeg is available
-                try:
-                    subprocess.run(['ffmpeg', '-version'], capture_output=True, check=True)
-                except (FileNotFoundError, subprocess.CalledProcessError):
-                    # FFmpeg not available, fallback to first frame PNG
-                    return False
-                
-                # Calculate actual duration
-                duration = frames_to_render / fps
-                
-                # Convert frames to WEBM using ffmpeg
-                # Telegram custom emoji limits: ~64KB size, max 3 seconds
-                ffmpeg_cmd = [
-                    'ffmpeg', '-y', '-loglevel', 'error',
-                    '-framerate', str(fps),
-                    '-i', str(frames_dir / 'frame_%04d.png'),
-                    '-c:v', 'libvpx-vp9',
-                    '-pix_fmt', 'yuva420p',
-                    '-auto-alt-ref', '0',
-                    '-b:v', '50k',  # Bitrate limit
-                    '-maxrate', '50k',
-                    '-bufsize', '100k',
-                    '-quality', 'realtime',
-                    '-speed', '8',  # Faster encoding
-                    '-t', str(duration),
-                    '-fs', '64000',  # File size limit 64KB
-                    str(output_path)
-                ]
-                
-                result = subprocess.run(ffmpeg_cmd, capture_output=True)
-                return result.returncode == 0
-            
-        except Exception as e:
-            return False
+        report = engine.render_tgs_to_webm(tgs_bytes, size=size)
+        return report.data if report else None
     
     async def get_sticker_pack(self, pack_name: str):
         """Download sticker pack from Telegram."""
@@ -168,23 +168,120 @@ class StickerToEmojiConverter:
         print(f"📦 Fetching sticker pack: {pack_name}")
         
         try:
-            sticker_set = await self.client(GetStickerSetRequest(
-                stickerset=InputStickerSetShortName(short_name=pack_name),
-                hash=0
-            ))
+            with self.metrics.span('fetch_pack') as span:
+                sticker_set = await self.client(GetStickerSetRequest(
+                    stickerset=InputStickerSetShortName(short_name=pack_name),
+                    hash=0
+                ))
+                span['stickers'] = len(sticker_set.documents)
             return sticker_set
+        except errors.FloodWaitError:
+            # Let callers wait it out instead of treating the pack as missing
+            raise
         except Exception as e:
             raise ValueError(f"Could not retrieve sticker pack: {e}")
     
-    async def download_and_convert_stickers(self, sticker_set, output_dir: Path, limit: int = 50, is_video: bool = False):
-        """Download stickers and convert to emoji format."""
+    def get_sticker_emoji(self, sticker: Document) -> str:
+        """Get the emoji a sticker is attached to."""
+        for attr in sticker.attributes:
+            if isinstance(attr, DocumentAttributeSticker):
+                return attr.alt or '😀'
+        return '😀'
+    
+    def get_emoji_filename(self, sticker: Document, number: int) -> str:
+        """Build the file name for a converted sticker."""
+        emoji = self.get_sticker_emoji(sticker)
+        file_ext = '.webm' if self.is_video_sticker(sticker) else '.png'
+        return f"emoji_{number:03d}_{emoji}{file_ext}"
+    
+    def make_conversion_job(self, sticker: Document, file_bytes: bytes, filename: str) -> ConversionJob:
+        """Describe a downloaded sticker as a picklable conversion job."""
+        if self.is_video_sticker(sticker):
+            kind = 'video'
+        elif self.is_animated_sticker(sticker):
+            kind = 'tgs'
+        else:
+            kind = 'static'
+        return ConversionJob(kind=kind, data=file_bytes, filename=filename, size=100, png_mode=self.png_mode)
+    
+    def convert_sticker(self, sticker: Document, file_bytes: bytes, filename: str) -> ConversionResult:
+        """Convert downloaded sticker bytes to emoji format in this process."""
+        return engine.run_job(self.make_conversion_job(sticker, file_bytes, filename))
+    
+    def get_render_signature(self) -> str:
+        """Render settings that affect converted output."""
+        return engine.render_signature(100, self.png_mode)
+    
+    def get_cache_document_key(self, sticker: Document) -> str:
+        """Cache key for a Telegram document rendered with the current settings."""
+        return ConversionCache.document_key(sticker.id, sticker.access_hash, self.get_render_signature())
+    
+    def restore_cached(self, entry: CacheEntry, filename: str) -> Optional[ConversionResult]:
+        """Read a cached conversion into memory."""
+        try:
+            data = entry.path.read_bytes()
+        except OSError:
+            # Evicted by another process
+            return None
+        return ConversionResult(
+            str(PurePath(filename).with_suffix(entry.path.suffix)), data, entry.sticker_format,
+            cache_key=entry.key, size_bytes=len(data)
+        )
+    
+    def find_cached_document(self, sticker: Document, filename: str) -> Optional[ConversionResult]:
+        """Reuse a previous conversion of this document, before downloading it."""
+        if self.cache is None:
+            return None
+        entry = self.cache.get_document(self.get_cache_document_key(sticker))
+        return self.restore_cached(entry, filename) if entry else None
+    
+    def find_cached_content(self, sticker: Document, file_bytes: bytes, filename: str) -> Optional[ConversionResult]:
+        """Reuse a previous conversion of identical sticker bytes, before rendering them."""
+        if self.cache is None:
+            return None
+        key = ConversionCache.content_key(file_bytes, self.get_render_signature())
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        self.cache.link_document(self.get_cache_document_key(sticker), key)
+        return self.restore_cached(entry, filename)
+    
+    def get_cached_content_key(self, sticker: Document) -> Optional[str]:
+        """Content key of this document's cached conversion, without downloading it."""
+        if self.cache is None:
+            return None
+        entry = self.cache.get_document(self.get_cache_document_key(sticker))
+        return entry.key if entry else None
+    
+    def record_render_stages(self, result: ConversionResult, **fields):
+        """Record the worker's probe, render and encode times as stages of their own."""
+        for stage, ms in result.stages_ms.items():
+            self.metrics.record(stage, ms / 1000, **fields)
+    
+    def store_converted(self, sticker: Document, file_bytes: bytes, result: ConversionResult):
+        """Add a fresh conversion to the cache."""
+        if self.cache is None:
+            return
+        key = ConversionCache.content_key(file_bytes, self.get_render_signature())
+        self.cache.put(
+            key, result.data, PurePath(result.filename).suffix, result.sticker_format, self.get_cache_document_key(sticker)
+        )
+        result.cache_key = key
+    
+    async def download_and_convert_stickers(self, sticker_set, output_dir: Path = None, limit: int = 50, is_video: bool = False):
+        """Download stickers and convert to emoji format.
+        
+        Returns ([(ConversionResult, emoji)], pack_title). Converted files are
+        only written to disk if an output_dir is given.
+        """
         stickers = sticker_set.documents
         pack_title = sticker_set.set.title
         
         print(f"📊 Found {len(stickers)} stickers in '{pack_title}'")
         
         # Create output directory
-        output_dir.mkdir(parents=True, exist_ok=True)
+        if output_dir is not None:
+            output_dir.mkdir(parents=True, exist_ok=True)
         
         converted = []
         skipped = 0
@@ -195,70 +292,46 @@ class StickerToEmojiConverter:
                 break
             
             try:
-                # Get emoji
-                emoji = '😀'
-                for attr in sticker.attributes:
-                    if isinstance(attr, DocumentAttributeSticker):
-                        emoji = attr.alt or '😀'
-                        break
-                
-                # Check sticker type
-                is_video_sticker = self.is_video_sticker(sticker)
-                is_tgs = self.is_animated_sticker(sticker)
-                
-                # Determine file extension and format
-                if is_video_sticker:
-                    file_ext = '.webm'
-                    sticker_format = 'video'
-                else:
-                    file_ext = '.png'
-                    sticker_format = 'static'
-                
-                filename = f"emoji_{len(converted)+1:03d}_{emoji}{file_ext}"
-                filepath = output_dir / filename
+                emoji = self.get_sticker_emoji(sticker)
+                filename = self.get_emoji_filename(sticker, len(converted) + 1)
                 
                 print(f"  {len(converted)+1}/{limit}: {emoji}", end=' ')
                 
-                # Download sticker
-                file_bytes = await self.client.download_media(sticker, file=bytes)
+                number = len(converted) + 1
+                result = self.find_cached_document(sticker, filename)
+                file_bytes = None
+                if result is None:
+                    # Download sticker
+                    with self.metrics.span('download', sticker=number, document_id=sticker.id) as span:
+                        file_bytes = await self.downloads.download(sticker)
+                        span['bytes'] = len(file_bytes)
                 
-                if is_video_sticker:
-                    # Save video sticker as-is (WEBM)
-                    with open(filepath, 'wb') as f:
-                        f.write(file_bytes)
-                elif is_tgs:
-                    # Try to render TGS to WEBM for animated emoji
-                    webm_path = filepath.with_suffix('.webm')
-                    success = self.render_tgs_to_webm(file_bytes, webm_path, size=100)
-                    
-                    if success:
-                        # Update filepath and format for animated emoji
-                        filepath = webm_path
-                        sticker_format = 'video'
+                with self.metrics.span('convert', sticker=number) as span:
+                    if result is not None:
+                        span['cache'] = 'document'
                     else:
-                        # Fallback to PNG (first frame)
-                        success = self.render_tgs_to_png(file_bytes, filepath, size=100)
-                        if not success:
-                            print("✗ (TGS render failed)")
-                            skipped += 1
-                            continue
-                else:
-                    # Convert static sticker to emoji format
-                    with Image.open(io.BytesIO(file_bytes)) as img:
-                        if img.mode != 'RGBA':
-                            img = img.convert('RGBA')
-                        
-                        img.thumbnail((100, 100), Image.Resampling.LANCZOS)
-                        
-                        emoji_img = Image.new('RGBA', (100, 100), (0, 0, 0, 0))
-                        offset = ((100 - img.width) // 2, (100 - img.height) // 2)
-                        emoji_img.paste(img, offset, img)
-                        
-                        emoji_img.save(filepath, format='PNG', optimize=True)
+                        result = self.find_cached_content(sticker, file_bytes, filename)
+                        if result is not None:
+                            span['cache'] = 'content'
+                    if result is None:
+                        result = self.convert_sticker(sticker, file_bytes, filename)
+                        if result.ok:
+                            self.store_converted(sticker, file_bytes, result)
+                    span.update(ok=result.ok, bytes=result.size_bytes, attempts=result.attempts)
+                self.record_render_stages(result, sticker=number)
+                
+                if not result.ok:
+                    print(f"✗ ({result.error})")
+                    skipped += 1
+                    continue
                 
-                converted.append((filepath, emoji, sticker_format))
+                if output_dir is not None:
+                    result.save(output_dir)
+                converted.append((result, emoji))
                 print("✓")
                 
+            except errors.FloodWaitError:
+                raise
             except Exception as e:
                 print(f"✗ Error: {e}")
                 continue
@@ -274,13 +347,256 @@ class StickerToEmojiConverter:
         if self.bot_username:
             return self.bot_username
         
-        url = f"{self.bot_api_url}/getMe"
-        async with session.get(url) as response:
-            result = await response.json()
-            if result.get('ok'):
-                self.bot_username = result['result']['username']
-                return self.bot_username
-            raise ValueError(f"Failed to get bot info: {result.get('description')}")
+        try:
+            bot = await self.bot_api.call(session, 'getMe')
+        except ValueError as e:
+            raise ValueError(f"Failed to get bot info: {e}")
+        self.bot_username = bot['username']
+        return self.bot_username
+    
+    async def get_full_pack_name(self, pack_name: str, session: aiohttp.ClientSession) -> str:
+        """Add the required _by_<bot> suffix to a pack name."""
+        bot_username = await self.get_bot_info(session)
+        if not pack_name.endswith(f"_by_{bot_username}"):
+            pack_name = f"{pack_name}_by_{bot_username}"
+        return pack_name
+    
+    async def upload_sticker_file(self, result: ConversionResult, emoji: str, session: aiohttp.ClientSession) -> dict:
+        """Upload a converted emoji from memory and return it as an InputSticker.
+        
+        Files this bot already uploaded are taken from the cache instead.
+        """
+        sticker_format = result.sticker_format
+        cache_key = result.cache_key
+        entry = self.cache.get(cache_key) if self.cache and cache_key else None
+        if entry and self.bot_id in entry.file_ids:
+            self.metrics.record('upload', 0.0, file=result.filename, cache='file_id')
+            return {
+                'sticker': entry.file_ids[self.bot_id],
+                'emoji_list': [emoji],
+                'format': sticker_format
+            }
+        
+        # Determine content type based on format
+        if sticker_format == 'video':
+            content_type = 'video/webm'
+        else:
+            content_type = 'image/png'
+        
+        with self.metrics.span('upload', file=result.filename, bytes=len(result.data)):
+            uploaded = await self.bot_api.call(
+                session, 'uploadStickerFile',
+                params={'user_id': str(self.user_id), 'sticker_format': sticker_format},
+                files={'sticker': (result.filename, result.data, content_type)}
+            )
+        file_id = uploaded['file_id']
+        
+        if entry:
+            self.cache.set_file_id(entry.key, self.bot_id, file_id)
+        
+        return {
+            'sticker': file_id,
+            'emoji_list': [emoji],
+            'format': sticker_format
+        }
+    
+    async def create_sticker_set(
+        self,
+        stickers: list,
+        pack_name: str,
+        pack_title: str,
+        session: aiohttp.ClientSession
+    ) -> str:
+        """Create the emoji set from uploaded stickers and return its URL."""
+        print(f"\n📝 Creating pack with {len(stickers)} emojis...")
+        
+        data = {
+            'user_id': self.user_id,
+            'name': pack_name,
+            'title': pack_title,
+            'stickers': stickers,
+            'sticker_type': 'custom_emoji'
+        }
+        
+        async def applied() -> bool:
+            return await self.get_sticker_set(pack_name, session) is not None
+        
+        try:
+            await self.bot_api.call(session, 'createNewStickerSet', params=data, applied=applied)
+        except ValueError as e:
+            raise ValueError(f"Failed to create pack: {e}")
+        
+        pack_url = f"https://t.me/addemoji/{pack_name}"
+        return pack_url
+    
+    async def get_sticker_set(self, pack_name: str, session: aiohttp.ClientSession) -> Optional[dict]:
+        """Fetch a sticker set from the Bot API, or None if it doesn't exist."""
+        try:
+            return await self.bot_api.call(session, 'getStickerSet', params={'name': pack_name})
+        except BotAPIError as e:
+            if e.error_code == 400 and 'STICKERSET_INVALID' in e.description:
+                return None
+            raise
+    
+    async def add_sticker_to_set(self, pack_name: str, sticker: dict, session: aiohttp.ClientSession, set_size: int = None):
+        """Append an uploaded InputSticker to an existing set.
+        
+        set_size is the number of stickers in the set before the call. Only
+        if it is known is a call whose response was lost retried: the set
+        having grown means it went through.
+        """
+        params = {'user_id': self.user_id, 'name': pack_name, 'sticker': sticker}
+        
+        async def applied() -> bool:
+            target = await self.get_sticker_set(pack_name, session)
+            return target is not None and len(target['stickers']) > set_size
+        
+        await self.bot_api.call(session, 'addStickerToSet', params=params, applied=applied if set_size is not None else None)
+    
+    async def delete_sticker_from_set(self, pack_name: str, sticker: dict, session: aiohttp.ClientSession):
+        """Remove a sticker, as returned by getStickerSet, from a set."""
+        async def applied() -> bool:
+            target = await self.get_sticker_set(pack_name, session)
+            return target is not None and all(
+                other['file_unique_id'] != sticker['file_unique_id'] for other in target['stickers']
+            )
+        
+        await self.bot_api.call(session, 'deleteStickerFromSet', params={'sticker': sticker['file_id']}, applied=applied)
+    
+    async def set_sticker_position(self, file_id: str, position: int, session: aiohttp.ClientSession):
+        await self.bot_api.call(session, 'setStickerPositionInSet', params={'sticker': file_id, 'position': position})
+    
+    async def fill_sticker_set(
+        self,
+        ready: asyncio.Queue,
+        pack_name: str,
+        pack_title: str,
+        session: aiohttp.ClientSession,
+        exists: bool = False,
+        state: SyncState = None
+    ) -> list:
+        """Create or extend an emoji set with uploaded stickers as they arrive.
+        
+        `ready` yields (document, InputSticker) pairs in pack order and ends
+        with None. A new set is created from the first chunk of up to 50
+        stickers, the rest are added while later uploads are still running,
+        until the set holds MAX_EMOJI_PER_SET. Returns the pairs that made it
+        into the set, in order.
+        
+        With a SyncState, the set is read after every chunk and the emoji
+        that are new since the last read are matched, in order, to the
+        stickers added in between; they are recorded in the state, which is
+        saved each time.
+        """
+        in_set = []
+        chunk = []
+        chunk_start = time.perf_counter()
+        chunks = 0
+        set_size = None  # Stickers in the set, when known
+        left_out = 0  # Stickers that arrived once the set was full
+        known = None if exists else []  # file_unique_ids at the last read of the set
+        unread = []  # (pair, whether the add is known to have gone through) since that read
+        
+        def report(action: str):
+            nonlocal chunk, chunk_start, chunks
+            chunks += 1
+            elapsed = time.perf_counter() - chunk_start
+            print(f"📦 Chunk {chunks}: {len(chunk)} emojis {action} in {elapsed:.1f}s")
+            self.metrics.record('chunk', elapsed, chunk=chunks, action=action, stickers=len(chunk))
+            in_set.extend(chunk)
+            chunk = []
+            chunk_start = time.perf_counter()
+        
+        async def read_set():
+            """Count the set and work out which of its new emoji came from which sticker."""
+            nonlocal set_size, known, unread
+            target = await self.get_sticker_set(pack_name, session)
+            uids = [sticker['file_unique_id'] for sticker in target['stickers']] if target else []
+            if known is not None:
+                seen = set(known)
+                fresh = [uid for uid in uids if uid not in seen]
+                added = [pair for pair, sure in unread if sure]
+                if len(fresh) == len(unread):
+                    # Adds whose response was lost went through after all
+                    chunk.extend(pair for pair, sure in unread if not sure)
+                    added = [pair for pair, _ in unread]
+                # Otherwise there's no telling which emoji is which; sync treats them as unknown
+                if len(fresh) == len(added) and state is not None:
+                    for (document, _), uid in zip(added, fresh):
+                        if document is not None:
+                            state.record(uid, document.id, self.get_cached_content_key(document))
+            known = uids
+            unread = []
+            set_size = len(uids) if target else None
+        
+        async def checkpoint():
+            """Record the stickers added since the last read in the state."""
+            if state is None or not unread:
+                return
+            try:
+                await read_set()
+            except Exception as e:
+                # They are matched at the next read instead
+                print(f"  ✗ Could not read {pack_name}: {e}")
+                return
+            state.save()
+        
+        async def create():
+            nonlocal exists, set_size
+            await self.create_sticker_set([sticker for _, sticker in chunk], pack_name, pack_title, session)
+            exists = True
+            set_size = len(chunk)
+            unread.extend((pair, True) for pair in chunk)
+            await checkpoint()
+            report("created")
+        
+        while True:
+            item = await ready.get()
+            if item is None:
+                break
+            
+            if not exists:
+                chunk.append(item)
+                if len(chunk) == MAX_INITIAL_STICKERS:
+                    await create()
+                continue
+            
+            _, sticker = item
+            if set_size is None:
+                try:
+                    await read_set()
+                except Exception as e:
+                    print(f"  ✗ Could not read {pack_name}: {e}")
+            if set_size is not None and set_size >= MAX_EMOJI_PER_SET:
+                left_out += 1
+                continue
+            try:
+                await self.add_sticker_to_set(pack_name, sticker, session, set_size)
+                chunk.append(item)
+                unread.append((item, True))
+                if set_size is not None:
+                    set_size += 1
+            except Exception as e:
+                # Whether it was added is unknown: count the set again before the next one
+                set_size = None
+                unread.append((item, False))
+                print(f"  ✗ Could not add {sticker['emoji_list'][0]}: {e}")
+            if len(chunk) >= MAX_INITIAL_STICKERS:
+                await checkpoint()
+                report("added")
+        
+        if not exists:
+            if not chunk:
+                raise ValueError("No stickers uploaded successfully")
+            await create()
+        else:
+            await checkpoint()
+            if chunk:
+                report("added")
+        
+        if left_out:
+            print(f"⚠️  Set is full ({MAX_EMOJI_PER_SET} emojis), {left_out} not added")
+        return in_set
     
     async def upload_and_create_emoji_pack(
         self, 
@@ -289,195 +605,332 @@ class StickerToEmojiConverter:
         pack_title: str,
         session: aiohttp.ClientSession
     ):
-        """Upload emojis and create Telegram emoji pack."""
+        """Upload emojis and create Telegram emoji pack. emoji_files holds (ConversionResult, emoji) pairs."""
         
         # Get bot username and fix pack name
-        bot_username = await self.get_bot_info(session)
-        if not pack_name.endswith(f"_by_{bot_username}"):
-            pack_name = f"{pack_name}_by_{bot_username}"
+        pack_name = await self.get_full_pack_name(pack_name, session)
         
         print(f"\n🚀 Creating emoji pack...")
         print(f"   Name: {pack_title}")
         print(f"   URL name: {pack_name}")
         
-        # Upload files
-        stickers = []
-        for i, file_info in enumerate(emoji_files, 1):
+        # Upload files concurrently; the Bot API client paces and retries them
+        async def upload(i: int, result: ConversionResult, emoji: str):
             try:
-                filepath, emoji, sticker_format = file_info
-                print(f"   Uploading {i}/{len(emoji_files)}: {emoji}", end=' ')
-                
-                # Upload file
-                url = f"{self.bot_api_url}/uploadStickerFile"
-                data = aiohttp.FormData()
-                data.add_field('user_id', str(self.user_id))
-                data.add_field('sticker_format', sticker_format)
-                
-                # Determine content type based on format
-                if sticker_format == 'video':
-                    content_type = 'video/webm'
-                else:
-                    content_type = 'image/png'
-                
-                with open(filepath, 'rb') as f:
-                    data.add_field('sticker', f, filename=filepath.name, content_type=content_type)
-                    
-                    async with session.post(url, data=data) as response:
-                        result = await response.json()
-                        
-                        if not result.get('ok'):
-                            print(f"✗ {result.get('description')}")
-                            continue
-                        
-                        file_id = result['result']['file_id']
-                
-                stickers.append({
-                    'sticker': file_id,
-                    'emoji_list': [emoji],
-                    'format': sticker_format
-                })
-                
-                print("✓")
-                
+                sticker = await self.upload_sticker_file(result, emoji, session)
             except Exception as e:
-                print(f"✗ {e}")
-                continue
+                print(f"   Uploading {i}/{len(emoji_files)}: {emoji} ✗ {e}")
+                return None
+            print(f"   Uploading {i}/{len(emoji_files)}: {emoji} ✓")
+            return sticker
+        
+        uploaded = await asyncio.gather(*(
+            upload(i, result, emoji)
+            for i, (result, emoji) in enumerate(emoji_files, 1)
+        ))
+        
+        ready = asyncio.Queue()
+        for sticker in uploaded:
+            if sticker is not None:
+                ready.put_nowait((None, sticker))
+        ready.put_nowait(None)
+        
+        await self.fill_sticker_set(ready, pack_name, pack_title, session)
+        return f"https://t.me/addemoji/{pack_name}"
+    
+    async def convert_and_create_emoji_pack(
+        self,
+        sticker_set,
+        pack_name: str,
+        output_dir: Optional[Path],
+        session: aiohttp.ClientSession,
+        limit: int = 50,
+        config: PipelineConfig = None,
+        state_dir: Path = None
+    ):
+        """Stream stickers through download, convert and upload into a new pack.
+        
+        The pack is created as soon as the first chunk of stickers is uploaded
+        and filled while the rest are still in the pipeline. Converted files
+        are saved to output_dir if one is given. With a state_dir, the sync
+        state of the new pack is written there, so a later --sync only has to
+        upload what changed. Returns (pack_url, emoji_files), where
+        emoji_files holds (ConversionResult, emoji) pairs in pack order.
+        """
+        pack_title = sticker_set.set.title
+        pack_name = await self.get_full_pack_name(pack_name, session)
+        state = SyncState(state_dir / f"{pack_name}.json") if state_dir is not None else None
+        
+        print(f"📊 Found {len(sticker_set.documents)} stickers in '{pack_title}'")
+        print(f"\n🚀 Converting and uploading...")
+        print(f"   Name: {pack_title}")
+        print(f"   URL name: {pack_name}")
+        
+        pipeline = StickerPipeline(self, session, output_dir, limit=limit, config=config)
+        run = asyncio.ensure_future(pipeline.run(sticker_set.documents))
+        try:
+            try:
+                await self.fill_sticker_set(pipeline.ready, pack_name, pack_title, session, state=state)
+            except ValueError:
+                # The pipeline failing (e.g. on a FloodWait) ended the stickers early; raise that instead
+                if run.done() and not run.cancelled() and run.exception() is not None:
+                    await run
+                raise
+            result = await run
+        finally:
+            run.cancel()
+        
+        print(f"\n✅ Converted {len(result.converted)} stickers")
+        if result.skipped > 0:
+            print(f"⏭️  Skipped {result.skipped} stickers")
+        
+        return f"https://t.me/addemoji/{pack_name}", result.converted
+    
+    async def find_content_keys(self, documents: list, set_stickers: list, state: SyncState) -> dict:
+        """Content keys of new source stickers, when an emoji in the set might already match one.
+        
+        Only needed if the set has emoji whose source sticker is gone from the
+        pack; new stickers missing from the cache are downloaded to hash them.
+        """
+        document_ids = {document.id for document in documents}
+        candidates = [
+            state.stickers[sticker['file_unique_id']] for sticker in set_stickers
+            if sticker['file_unique_id'] in state.stickers
+        ]
+        if not any(entry.get('content_key') and entry['document_id'] not in document_ids for entry in candidates):
+            return {}
+        
+        tracked_ids = {entry['document_id'] for entry in candidates}
+        signature = self.get_render_signature()
         
-        if not stickers:
+        async def content_key(document):
+            key = self.get_cached_content_key(document)
+            if key is None:
+                try:
+                    key = ConversionCache.content_key(await self.downloads.download(document), signature)
+                except errors.FloodWaitError:
+                    raise
+                except Exception:
+                    return None
+            return key
+        
+        new = [document for document in documents if document.id not in tracked_ids]
+        keys = await asyncio.gather(*(content_key(document) for document in new))
+        return {document.id: key for document, key in zip(new, keys) if key}
+    
+    async def sync_emoji_pack(
+        self,
+        sticker_set,
+        pack_name: str,
+        output_dir: Optional[Path],
+        session: aiohttp.ClientSession,
+        state_dir: Path,
+        limit: int = 50,
+        config: PipelineConfig = None
+    ):
+        """Update an existing emoji pack to match the sticker pack, creating it if needed.
+        
+        Only new stickers are downloaded, converted and uploaded; they are
+        saved to output_dir if one is given. Returns (pack_url, emoji_files),
+        where emoji_files holds the added stickers as (ConversionResult,
+        emoji) pairs.
+        """
+        pack_title = sticker_set.set.title
+        pack_name = await self.get_full_pack_name(pack_name, session)
+        documents = sticker_set.documents
+        
+        print(f"📊 Found {len(documents)} stickers in '{pack_title}'")
+        print(f"\n🔄 Syncing {pack_name}...")
+        
+        state = SyncState.load(state_dir / f"{pack_name}.json")
+        target = await self.get_sticker_set(pack_name, session)
+        set_stickers = target['stickers'] if target else []
+        
+        content_keys = await self.find_content_keys(documents, set_stickers, state)
+        plan = plan_sync(documents, set_stickers, state, content_keys, limit=limit)
+        print(f"   {len(plan.keep)} unchanged, {len(plan.add)} to add, {len(plan.delete)} to remove")
+        
+        by_uid = {sticker['file_unique_id']: sticker for sticker in set_stickers}
+        deleted = 0
+        
+        async def delete_stale(uids: list):
+            nonlocal deleted
+            for uid in uids:
+                try:
+                    await self.delete_sticker_from_set(pack_name, by_uid[uid], session)
+                    deleted += 1
+                except Exception as e:
+                    print(f"  ✗ Could not remove {uid}: {e}")
+        
+        # Delete before adding to stay under the set size limit. The set can't
+        # be emptied, so if every emoji in it goes, they are deleted after the
+        # adds, or all but one before them if the adds wouldn't fit otherwise
+        adding = min(len(plan.add), max(0, limit - len(plan.keep)))
+        if len(plan.delete) < len(set_stickers):
+            delete_now, delete_later = plan.delete, []
+        elif len(set_stickers) + adding > MAX_EMOJI_PER_SET:
+            delete_now, delete_later = plan.delete[1:], plan.delete[:1]
+        else:
+            delete_now, delete_later = [], plan.delete
+        await delete_stale(delete_now)
+        
+        # Start the state afresh from the emoji that stay; fill_sticker_set records the ones it adds
+        previous = state.stickers
+        state.stickers = {}
+        for document in documents:
+            if document.id in plan.keep:
+                uid = plan.keep[document.id]
+                content_key = (
+                    content_keys.get(document.id) or self.get_cached_content_key(document)
+                    or previous[uid].get('content_key')
+                )
+                state.record(uid, document.id, content_key)
+        
+        result = PipelineResult()
+        added = []
+        room = min(limit, MAX_EMOJI_PER_SET - len(delete_later)) - len(plan.keep)
+        if plan.add and room > 0:
+            pipeline = StickerPipeline(self, session, output_dir, limit=room, config=config)
+            run = asyncio.ensure_future(pipeline.run(plan.add))
+            try:
+                try:
+                    in_set = await self.fill_sticker_set(
+                        pipeline.ready, pack_name, pack_title, session, exists=target is not None, state=state
+                    )
+                except ValueError:
+                    # The pipeline failing (e.g. on a FloodWait) ended the stickers early; raise that instead
+                    if run.done() and not run.cancelled() and run.exception() is not None:
+                        await run
+                    raise
+                result = await run
+            finally:
+                run.cancel()
+            added = [document for document, _ in in_set]
+        elif target is None:
             raise ValueError("No stickers uploaded successfully")
         
-        # Create sticker set
-        print(f"\n📝 Creating pack with {len(stickers)} emojis...")
+        await delete_stale(delete_later)
         
-        url = f"{self.bot_api_url}/createNewStickerSet"
-        data = {
-            'user_id': self.user_id,
-            'name': pack_name,
-            'title': pack_title,
-            'stickers': stickers,
-            'sticker_type': 'custom_emoji'
-        }
+        target = await self.get_sticker_set(pack_name, session)
+        in_target = {sticker['file_unique_id'] for sticker in target['stickers']}
+        state.stickers = {uid: entry for uid, entry in state.stickers.items() if uid in in_target}
+        assigned = {entry['document_id']: uid for uid, entry in state.stickers.items()}
         
-        async with session.post(url, json=data) as response:
-            result = await response.json()
-            
-            if not result.get('ok'):
-                raise ValueError(f"Failed to create pack: {result.get('description')}")
+        # Put the emoji in source pack order
+        file_ids = {sticker['file_unique_id']: sticker['file_id'] for sticker in target['stickers']}
+        desired = [assigned[document.id] for document in documents if document.id in assigned]
+        moves = plan_moves([sticker['file_unique_id'] for sticker in target['stickers']], desired)
+        for uid, position in moves:
+            await self.set_sticker_position(file_ids[uid], position, session)
         
-        pack_url = f"https://t.me/addemoji/{pack_name}"
-        return pack_url
+        state.save()
+        print(f"\n✅ Synced: {len(added)} added, {deleted} removed, {len(moves)} moved, {len(plan.keep)} unchanged")
+        return f"https://t.me/addemoji/{pack_name}", result.converted
+
+
+def create_session() -> aiohttp.ClientSession:
+    """HTTP session for the Bot API."""
+    # Setup SSL context
+    ssl_context = ssl.create_default_context()
+    ssl_context.check_hostname = False
+    ssl_context.verify_mode = ssl.CERT_NONE
+    # Keep Bot API connections open between uploads instead of re-handshaking
+    connector = aiohttp.TCPConnector(ssl=ssl_context, keepalive_timeout=60, ttl_dns_cache=300)
+    return aiohttp.ClientSession(connector=connector)
+
+
+def get_cache_dir(args) -> Path:
+    return Path(args.cache_dir) if args.cache_dir else DEFAULT_CACHE_DIR
 
 
-async def main():
-    """Main entry point."""
-    parser = argparse.ArgumentParser(
-        description="Convert Telegram sticker pack to emoji pack",
-        epilog="Example: python sticker_to_emoji.py Opa4958"
+def create_converter(args, credentials) -> StickerToEmojiConverter:
+    """Build a converter from parsed command line options."""
+    cache = None
+    if not args.no_cache:
+        cache = ConversionCache(get_cache_dir(args), max_bytes=args.cache_size * 1024 * 1024)
+    
+    api_id, api_hash, bot_token, user_id = credentials
+    return StickerToEmojiConverter(
+        api_id, api_hash, bot_token, user_id,
+        workers=args.workers,
+        cache=cache,
+        download_concurrency=args.download_concurrency,
+        png_mode='fast' if args.fast_png else 'optimize',
+        upload_concurrency=args.upload_concurrency,
+        metrics=Metrics(args.metrics, args.metrics_prometheus),
+        bot_api_url=args.bot_api_url or API_URL,
+        extra_bots=load_bot_list(args.bots, user_id)
     )
-    parser.add_argument("sticker_pack", help="Sticker pack name or URL")
-    parser.add_argument("-n", "--name", help="Custom name for emoji pack (optional)")
-    parser.add_argument("-l", "--limit", type=int, default=50, help="Max emojis (default: 50)")
-    parser.add_argument("--save-local", action="store_true", help="Save converted files locally instead of deleting")
-    parser.add_argument("-o", "--output", default="emoji_output", help="Output directory for --save-local (default: emoji_output)")
-    args = parser.parse_args()
-    
-    # Load environment
-    load_dotenv()
-    
-    # Get credentials
-    api_id = os.getenv("TELEGRAM_API_ID")
-    api_hash = os.getenv("TELEGRAM_API_HASH")
-    bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
-    user_id = os.getenv("TELEGRAM_USER_ID")
-    
-    # Validate
-    missing = []
-    if not api_id: missing.append("TELEGRAM_API_ID")
-    if not api_hash: missing.append("TELEGRAM_API_HASH")
-    if not bot_token: missing.append("TELEGRAM_BOT_TOKEN")
-    if not user_id: missing.append("TELEGRAM_USER_ID")
-    
-    if missing:
-        print(f"❌ Error: Missing required environment variables:", file=sys.stderr)
-        for var in missing:
-            print(f"   - {var}", file=sys.stderr)
-        print("\nSet them in .env file or as environment variables", file=sys.stderr)
-        sys.exit(1)
-    
-    try:
-        api_id = int(api_id)
-        user_id = int(user_id)
-    except (ValueError, TypeError):
-        print("❌ Error: API_ID and USER_ID must be numbers", file=sys.stderr)
-        sys.exit(1)
-    
-    print("🎨 Sticker to Emoji Converter\n")
-    
-    # Create temporary directory
-    temp_dir = Path("temp_emojis")
-    temp_dir.mkdir(exist_ok=True)
-    save_local = args.save_local  # Store for finally block
-    
-    try:
-        # Setup SSL context
-        ssl_context = ssl.create_default_context()
-        ssl_context.check_hostname = False
-        ssl_context.verify_mode = ssl.CERT_NONE
-        connector = aiohttp.TCPConnector(ssl=ssl_context)
-        
-        async with aiohttp.ClientSession(connector=connector) as session:
-            async with StickerToEmojiConverter(api_id, api_hash, bot_token, user_id) as converter:
-                # Download and convert stickers
-                sticker_set = await converter.get_sticker_pack(args.sticker_pack)
-                emoji_files, pack_title = await converter.download_and_convert_stickers(
-                    sticker_set, 
-                    temp_dir, 
-                    limit=args.limit
-                )
-                
-                if not emoji_files:
-                    print("❌ No emojis to upload", file=sys.stderr)
-                    sys.exit(1)
-                
-                # Use custom name or generate from pack title
-                pack_name = args.name or pack_title.replace(" ", "_")
-                
-                # Create emoji pack
-                pack_url = await converter.upload_and_create_emoji_pack(
-                    emoji_files,
-                    pack_name,
-                    pack_title,
-                    session
-                )
-                
-                print(f"\n✅ Success! Emoji pack created!")
-                print(f"🔗 {pack_url}")
-                print(f"\n💡 Add this pack in Telegram and use emojis as reactions!")
-                
-                # Save locally if requested
-                if args.save_local:
-                    import shutil
-                    output_path = Path(args.output)
-                    output_path.mkdir(parents=True, exist_ok=True)
-                    
-                    for filepath, _, _ in emoji_files:
-                        dest = output_path / filepath.name
-                        shutil.copy2(filepath, dest)
-                    
-                    print(f"\n💾 Files saved to: {output_path.absolute()}")
-        
-    except KeyboardInterrupt:
-        print("\n\n⚠️  Cancelled", file=sys.stderr)
-        sys.exit(130)
-    except Exception as e:
-        print(f"\n❌ Error: {e}", file=sys.stderr)
-        sys.exit(1)
-    finally:
-        # Cleanup temp files (unless save-local is used)
-        import shutil
-        if temp_dir.exists() and not save_local:
-            shutil.rmtree(temp_dir)
+
+
+async def convert_pack(
+    converter: StickerToEmojiConverter,
+    session: aiohttp.ClientSession,
+    sticker_pack: str,
+    args,
+    output_dir: Path,
+    name: str = None
+) -> str:
+    """Convert one sticker pack to an emoji pack and return its URL.
+    
+    Converted files stay in memory; with --save-local they are also written
+    to output_dir as they are converted.
+    """
+    converter = converter.view(pack=sticker_pack)
+    sticker_set = await converter.get_sticker_pack(sticker_pack)
+    limit = min(args.limit, MAX_EMOJI_PER_SET)
+    if args.limit > MAX_EMOJI_PER_SET:
+        print(f"⚠️  Emoji packs hold at most {MAX_EMOJI_PER_SET} emojis, using --limit {limit}")
+    
+    # Use custom name or generate from pack title
+    pack_name = name or sticker_set.set.title.replace(" ", "_")
+    
+    # Which sticker each emoji came from, for --sync; written for new packs too
+    state_dir = get_cache_dir(args) / "sync"
+    
+    # Packs are spread over the bot pool, but a set can only be changed by the bot that made it
+    owner = await converter.find_set_owner(pack_name, session) if args.sync else None
+    async with converter.lease_bot(owner) as converter:
+        if len(converter.bots) > 1:
+            print(f"🤖 Uploading with bot {converter.account.name}")
+        
+        # Download, convert and upload stickers, then create emoji pack
+        config = PipelineConfig(
+            download_concurrency=args.download_concurrency,
+            convert_concurrency=args.convert_concurrency or args.workers * 2,
+            upload_concurrency=args.upload_concurrency
+        )
+        save_dir = output_dir if args.save_local else None
+        if args.sync:
+            pack_url, emoji_files = await converter.sync_emoji_pack(
+                sticker_set,
+                pack_name,
+                save_dir,
+                session,
+                state_dir,
+                limit=limit,
+                config=config
+            )
+            print(f"🔗 {pack_url}")
+        else:
+            pack_url, emoji_files = await converter.convert_and_create_emoji_pack(
+                sticker_set,
+                pack_name,
+                save_dir,
+                session,
+                limit=limit,
+                config=config,
+                state_dir=state_dir
+            )
+            
+            print(f"\n✅ Success! Emoji pack created!")
+            print(f"🔗 {pack_url}")
+    
+    if args.save_local:
+        print(f"\n💾 Files saved to: {output_dir.absolute()}")
+    
+    return pack_url
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run()
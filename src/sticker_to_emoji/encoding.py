@@ -0,0 +1,193 @@
+"""
+Adaptive VP9 encoder settings for animated emoji.
+
+Telegram rejects custom emoji WEBMs over 64 KB. Instead of a fixed bitrate
+and ffmpeg's -fs (which truncates the file once it goes over), the encoder
+controller estimates how complex a Lottie animation is and picks a bitrate
+ceiling, CRF and frame-rate decimation expected to land just under the
+limit. The first encode is the probe; only when it misses is the sticker
+re-encoded with tighter settings.
+"""
+
+import math
+from dataclasses import dataclass, field, replace
+from typing import Optional
+
+from .frames import LOW_MOTION_DELTA
+
+MAX_EMOJI_BYTES = 64000
+MAX_DURATION = 3.0  # Seconds
+MAX_FPS = 30  # Custom emoji play no faster
+MIN_FPS = 15  # Decimation never goes below this
+TARGET_FILL = 0.9  # Aim a little below the limit to absorb rate-control error
+CONTAINER_OVERHEAD = 1500  # WEBM headers and cues, in bytes
+MAX_ATTEMPTS = 4
+
+# Base libvpx-vp9 options shared by every attempt
+VP9_CODEC = 'libvpx-vp9'
+VP9_PIX_FMT = 'yuva420p'
+VP9_OPTIONS = {
+    'auto-alt-ref': '0',
+    'quality': 'realtime',
+    'speed': '8',  # Faster encoding
+}
+VP9_BASE_SETTINGS = ['-c:v', VP9_CODEC, '-pix_fmt', VP9_PIX_FMT] + [
+    arg for name, value in VP9_OPTIONS.items() for arg in (f'-{name}', value)
+]
+
+# Bump when the planning rules change, so cached outputs are re-rendered
+CONTROLLER_VERSION = 3
+
+
+@dataclass
+class AnimationComplexity:
+    """Rough measure of how expensive a Lottie animation is to encode."""
+    layers: int = 0
+    shapes: int = 0
+    masks: int = 0
+    frames: int = 0
+    fps: float = 0.0
+    
+    @property
+    def score(self) -> float:
+        """Weighted element count; ~5 is a simple sticker, 40+ a busy one."""
+        return self.layers + self.shapes * 0.5 + self.masks * 2
+
+
+@dataclass
+class EncodePlan:
+    """Encoder settings for one attempt."""
+    bitrate_k: int
+    crf: int
+    frame_step: int = 1  # Render every n-th frame
+    
+    def output_fps(self, fps: float) -> float:
+        return fps / self.frame_step
+    
+    def ffmpeg_args(self) -> list:
+        """Rate-control options for ffmpeg (constrained quality mode)."""
+        return VP9_BASE_SETTINGS + [
+            '-crf', str(self.crf),
+            '-b:v', f'{self.bitrate_k}k',  # Ceiling in constrained quality mode
+            '-maxrate', f'{self.bitrate_k}k',
+            '-bufsize', f'{self.bitrate_k * 2}k',
+        ]
+    
+    def codec_options(self) -> dict:
+        """The same settings as libvpx-vp9 codec options, for encoding in-process."""
+        return dict(
+            VP9_OPTIONS,
+            crf=str(self.crf),
+            b=f'{self.bitrate_k}k',
+            maxrate=f'{self.bitrate_k}k',
+            bufsize=f'{self.bitrate_k * 2}k',
+        )
+
+
+@dataclass
+class EncodeReport:
+    """How a sticker was encoded."""
+    attempts: int
+    size_bytes: int
+    plan: EncodePlan
+    stages_ms: dict = field(default_factory=dict)  # Time per step, e.g. 'render' and 'encode'
+    data: Optional[bytes] = None  # The encoded file, filled in by the engine
+
+
+def count_elements(lottie: dict) -> AnimationComplexity:
+    """Count layers, shapes and masks in a Lottie document, including precomps."""
+    complexity = AnimationComplexity(
+        frames=int(lottie.get('op', 0) - lottie.get('ip', 0)),
+        fps=float(lottie.get('fr', 0))
+    )
+    
+    def walk_shapes(shapes):
+        for shape in shapes or ():
+            complexity.shapes += 1
+            if shape.get('ty') == 'gr':
+                walk_shapes(shape.get('it'))
+    
+    layer_lists = [lottie.get('layers')]
+    layer_lists += [asset.get('layers') for asset in lottie.get('assets') or () if 'layers' in asset]
+    
+    for layers in layer_lists:
+        for layer in layers or ():
+            complexity.layers += 1
+            complexity.masks += len(layer.get('masksProperties') or ())
+            walk_shapes(layer.get('shapes'))
+    
+    return complexity
+
+
+def target_bitrate_k(duration: float) -> int:
+    """Average bitrate that fills the size budget over the clip duration."""
+    budget_bits = (MAX_EMOJI_BYTES * TARGET_FILL - CONTAINER_OVERHEAD) * 8
+    return max(8, int(budget_bits / max(duration, 0.1) / 1000))
+
+
+def plan_encode(complexity: AnimationComplexity, fps: float, frame_count: int, motion: Optional[float] = None) -> EncodePlan:
+    """Pick first-attempt encoder settings for an animation.
+    
+    motion is the largest change between neighbouring frames (see
+    frames.probe_motion), if it was measured.
+    """
+    score = complexity.score
+    
+    # Simple animations get high quality, the bitrate ceiling keeps them in budget
+    if score < 10:
+        crf = 24
+    elif score < 40:
+        crf = 32
+    else:
+        crf = 40
+    
+    # Animations faster than emoji allow render every n-th frame, e.g. 60 fps at 30
+    frame_step = max(1, math.ceil(round(fps / MAX_FPS, 3)))
+    
+    # Busy or slow-moving 60 fps animations spend most of their bits on frames nobody notices
+    low_motion = motion is not None and motion < LOW_MOTION_DELTA
+    if fps >= 50 and (score >= 40 or low_motion) and fps / frame_step / 2 >= MIN_FPS:
+        frame_step *= 2
+    
+    return EncodePlan(
+        bitrate_k=target_bitrate_k(frame_count / fps),
+        crf=crf,
+        frame_step=frame_step
+    )
+
+
+def next_plan(plan: EncodePlan, size_bytes: int, fps: float) -> EncodePlan:
+    """Tighten settings after an attempt that came out over the limit."""
+    overshoot = size_bytes / (MAX_EMOJI_BYTES * TARGET_FILL)
+    bitrate_k = max(8, int(plan.bitrate_k / overshoot * 0.9))
+    crf = min(63, plan.crf + 8)
+    
+    frame_step = plan.frame_step
+    if overshoot > 1.3 and plan.output_fps(fps) / 2 >= MIN_FPS:
+        frame_step *= 2
+    
+    return replace(plan, bitrate_k=bitrate_k, crf=crf, frame_step=frame_step)
+
+
+def encode_adaptive(encode, complexity: AnimationComplexity, fps: float, frame_count: int, motion: Optional[float] = None):
+    """Encode with as few attempts as possible.
+    
+    encode(plan) runs one encode and returns the output size in bytes, or None
+    if ffmpeg failed. Returns an EncodeReport, or None if no attempt fit.
+    """
+    plan = plan_encode(complexity, fps, frame_count, motion)
+    
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        size_bytes = encode(plan)
+        if size_bytes is None:
+            return None
+        if size_bytes <= MAX_EMOJI_BYTES:
+            return EncodeReport(attempts=attempt, size_bytes=size_bytes, plan=plan)
+        plan = next_plan(plan, size_bytes, fps)
+    
+    return None
+
+
+def settings_signature() -> str:
+    """Identify the encoder settings, e.g. for cache keys."""
+    return f"adaptive-v{CONTROLLER_VERSION};" + ' '.join(VP9_BASE_SETTINGS)
@@ -0,0 +1,625 @@
+"""
+Conversion engine.
+
+Rendering TGS stickers (rlottie + ffmpeg) and resizing static stickers is
+CPU-bound, so it runs in a process pool instead of on the event loop. Jobs
+and results are plain dataclasses so they can be pickled to the workers.
+Results carry the converted file's bytes; nothing is written to disk unless
+the caller saves it.
+
+Animated stickers are encoded in the worker process itself through PyAV
+(libvpx, no subprocess) when it is installed, and by an ffmpeg subprocess
+otherwise. Which of the two exist is checked once per worker, not per sticker.
+Video stickers are probed on a thread first; only clips that don't already
+fit the emoji limits are sent to a worker to be transcoded. TGS stickers are
+preflighted on a thread too (see preflight.py): absurd ones never reach a
+worker, and when every worker is busy the most expensive waiting job is the
+next one to start.
+
+rlottie and Pillow are imported by the functions that use them, so a pack of
+static stickers never loads rlottie and the CLI starts without either.
+"""
+
+import asyncio
+import ctypes
+import functools
+import gzip
+import heapq
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from fractions import Fraction
+from pathlib import Path, PurePath
+from typing import Optional
+
+from . import encoding, frames, preflight, video
+from .encoding import EncodePlan, EncodeReport
+from .preflight import Preflight
+
+# Expected worker time of a video transcode: up to 3 s of frames at 30 fps
+VIDEO_ESTIMATE_MS = preflight.estimate_ms(video.CLIP_COMPLEXITY.score, int(video.MAX_FPS * encoding.MAX_DURATION))
+
+
+@dataclass
+class ConversionJob:
+    """A single sticker to convert."""
+    kind: str  # 'tgs', 'video' or 'static'
+    data: bytes
+    filename: str  # Output file name; its suffix is changed to .webm for animated output
+    size: int = 100
+    frame_mode: str = 'auto'  # 'auto' or one of FRAME_MODES, see render_tgs_to_webm
+    png_mode: str = 'optimize'  # See static.PNG_MODES
+    preflight: Optional[Preflight] = None  # For 'tgs'; checked by the worker if missing
+
+
+@dataclass
+class ConversionResult:
+    """Outcome of a conversion job: the converted file in memory."""
+    filename: Optional[str] = None
+    data: Optional[bytes] = None
+    sticker_format: Optional[str] = None  # 'video' or 'static'
+    error: Optional[str] = None
+    cache_key: Optional[str] = None
+    attempts: int = 0  # Encoder attempts for animated output
+    size_bytes: int = 0
+    render_ms: float = 0.0  # Time spent converting inside the worker
+    stages_ms: dict = field(default_factory=dict)  # Part of render_ms per step, for animated output
+    
+    @property
+    def ok(self) -> bool:
+        return self.data is not None
+    
+    def save(self, directory: Path) -> Path:
+        """Write the converted file to a directory."""
+        path = Path(directory) / self.filename
+        with open(path, 'wb') as f:
+            f.write(self.data)
+        return path
+
+
+def render_tgs_to_png(tgs_bytes: bytes, size: int = 100, png_mode: str = 'optimize') -> Optional[bytes]:
+    """Render TGS (Lottie) animation to PNG (first frame) - for static emojis."""
+    from PIL import Image
+    from rlottie_python import LottieAnimation
+    from .static import PNG_MODES
+    
+    try:
+        # Decompress gzip
+        decompressed = gzip.decompress(tgs_bytes)
+        
+        # Load animation with rlottie
+        anim = LottieAnimation.from_data(decompressed.decode('utf-8'))
+        
+        # Render first frame using Pillow
+        img = anim.render_pillow_frame(0, width=size, height=size)
+        
+        # Ensure RGBA
+        if img.mode != 'RGBA':
+            img = img.convert('RGBA')
+        
+        # Center and save
+        emoji_img = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+        emoji_img.paste(img, (0, 0), img)
+        buffer = io.BytesIO()
+        emoji_img.save(buffer, format='PNG', **PNG_MODES[png_mode])
+        
+        return buffer.getvalue()
+    
+    except Exception:
+        # Fallback: if rendering fails, skip
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def ffmpeg_available() -> bool:
+    """Check if ffmpeg is available. Checked once per process."""
+    try:
+        subprocess.run(['ffmpeg', '-version'], capture_output=True, check=True)
+        return True
+    except (FileNotFoundError, subprocess.CalledProcessError):
+        return False
+
+
+@functools.lru_cache(maxsize=None)
+def pyav_available() -> bool:
+    """Check if PyAV is installed with a VP9 encoder. Checked once per process."""
+    if not video.pyav_available():
+        return False
+    import av
+    return encoding.VP9_CODEC in av.codecs_available
+
+
+def load_animation(tgs_bytes: bytes, complexity: encoding.AnimationComplexity = None):
+    """Load a TGS sticker and work out how many frames fit in an emoji.
+    
+    Returns (animation, fps, frames_to_render, complexity), or None if the
+    animation is empty. The JSON is only parsed for its complexity when the
+    caller doesn't already have it from a preflight.
+    """
+    from rlottie_python import LottieAnimation
+    
+    # Decompress gzip
+    decompressed = gzip.decompress(tgs_bytes).decode('utf-8')
+    
+    # Load animation with rlottie
+    anim = LottieAnimation.from_data(decompressed)
+    
+    # Get total frames and FPS
+    total_frames = anim.lottie_animation_get_totalframe()
+    fps = anim.lottie_animation_get_framerate()
+    if total_frames == 0 or fps == 0:
+        return None
+    
+    # Telegram limit: max 3 seconds for custom emoji
+    max_frames = int(fps * encoding.MAX_DURATION)
+    if complexity is None:
+        complexity = encoding.count_elements(json.loads(decompressed))
+    return anim, fps, min(total_frames, max_frames), complexity
+
+
+def iter_raw_frames(anim, frame_count: int, size: int = 100, frame_step: int = 1):
+    """Yield every frame_step-th frame as a memoryview over one reused BGRA buffer.
+    
+    rlottie renders premultiplied ARGB32, which is BGRA byte order on
+    little-endian machines. The buffer is overwritten by the next frame, so
+    consumers must finish with a frame before asking for the next one.
+    """
+    return iter_raw_frames_at(anim, range(0, frame_count, frame_step), size)
+
+
+def iter_raw_frames_at(anim, frame_numbers, size: int = 100):
+    """Like iter_raw_frames, for any sequence of frame numbers."""
+    stride = size * 4
+    buffer_size = stride * size
+    lib = getattr(anim, 'rlottie_lib', None)
+    
+    if lib is None or getattr(anim, 'animation_p', None) is None:
+        # Unknown binding layout: let rlottie_python allocate each frame
+        for frame_num in frame_numbers:
+            yield memoryview(anim.lottie_animation_render(frame_num, buffer_size, size, size, stride))
+        return
+    
+    buffer = ctypes.create_string_buffer(buffer_size)
+    render = lib.lottie_animation_render
+    render.argtypes = [
+        ctypes.c_void_p, ctypes.c_size_t, ctypes.c_void_p,
+        ctypes.c_size_t, ctypes.c_size_t, ctypes.c_size_t
+    ]
+    render.restype = None
+    view = memoryview(buffer).cast('B')
+    
+    for frame_num in frame_numbers:
+        render(anim.animation_p, frame_num, buffer, size, size, stride)
+        yield view
+
+
+def timeline_args(timeline: frames.FrameTimeline) -> list:
+    """ffmpeg output options that give merged frames their full duration."""
+    pts_filter = timeline.pts_filter()
+    return ['-vf', pts_filter] if pts_filter else []
+
+
+def encode_frames_pyav(timeline: frames.FrameTimeline, fps: float, plan: EncodePlan, size: int = 100) -> Optional[bytes]:
+    """Encode raw frames with libvpx inside this process through PyAV, into memory."""
+    import av
+    
+    rate = Fraction(plan.output_fps(fps)).limit_denominator(1001)
+    output = io.BytesIO()
+    try:
+        with av.open(output, mode='w', format='webm') as container:
+            stream = container.add_stream(encoding.VP9_CODEC, rate=rate, options=plan.codec_options())
+            stream.width = size
+            stream.height = size
+            stream.pix_fmt = encoding.VP9_PIX_FMT
+            
+            # Each kept frame is stamped with the frame it starts at, so merged
+            # runs keep their full duration without a setpts filter
+            for frame, start in zip(timeline.frames, timeline.starts):
+                video_frame = av.VideoFrame(size, size, 'bgra')
+                video_frame.planes[0].update(frame)
+                video_frame.pts = start
+                for packet in stream.encode(video_frame):
+                    container.mux(packet)
+            for packet in stream.encode():
+                container.mux(packet)
+    except (av.FFmpegError, OSError, ValueError):
+        return None
+    return output.getvalue()
+
+
+def encode_frames_piped(timeline: frames.FrameTimeline, fps: float, plan: EncodePlan, size: int = 100) -> Optional[bytes]:
+    """Stream raw rendered frames straight into ffmpeg's stdin."""
+    # ffmpeg writes the WEBM to a private temp dir: the muxer has to seek
+    # back to write the duration and cues, which a pipe can't do
+    with tempfile.TemporaryDirectory() as tmpdir:
+        output_path = Path(tmpdir) / 'out.webm'
+        ffmpeg_cmd = [
+            'ffmpeg', '-y', '-loglevel', 'error',
+            '-f', 'rawvideo',
+            '-pix_fmt', 'bgra',
+            '-s', f'{size}x{size}',
+            '-framerate', str(plan.output_fps(fps)),
+            '-i', 'pipe:0',
+        ] + timeline_args(timeline) + plan.ffmpeg_args() + [str(output_path)]
+        
+        process = subprocess.Popen(
+            ffmpeg_cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+        )
+        try:
+            for frame in timeline.frames:
+                process.stdin.write(frame)
+            process.stdin.close()
+        except BrokenPipeError:
+            # ffmpeg exited early; its return code tells us why
+            pass
+        finally:
+            process.stderr.read()
+            process.wait()
+        
+        return output_path.read_bytes() if process.returncode == 0 else None
+
+
+def encode_frames_png(timeline: frames.FrameTimeline, fps: float, plan: EncodePlan, size: int = 100) -> Optional[bytes]:
+    """Write frames to a temp dir as PNG files and encode them with ffmpeg."""
+    from PIL import Image
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        frames_dir = Path(tmpdir)
+        
+        for i, frame in enumerate(timeline.frames):
+            img = Image.frombuffer('RGBA', (size, size), frame, 'raw', 'BGRA', 0, 1)
+            frame_path = frames_dir / f"frame_{i:04d}.png"
+            img.save(frame_path, format='PNG')
+        
+        output_path = frames_dir / 'out.webm'
+        ffmpeg_cmd = [
+            'ffmpeg', '-y', '-loglevel', 'error',
+            '-framerate', str(plan.output_fps(fps)),
+            '-i', str(frames_dir / 'frame_%04d.png'),
+        ] + timeline_args(timeline) + plan.ffmpeg_args() + [str(output_path)]
+        
+        result = subprocess.run(ffmpeg_cmd, capture_output=True)
+        return output_path.read_bytes() if result.returncode == 0 else None
+
+
+# Ways to get rendered frames into a WEBM, preferred first; each falls back to the ones after it
+FRAME_MODES = ('pyav', 'pipe', 'png')
+
+ENCODERS = {
+    'pyav': encode_frames_pyav,
+    'pipe': encode_frames_piped,
+    'png': encode_frames_png,
+}
+
+
+def frame_mode_available(frame_mode: str) -> bool:
+    return pyav_available() if frame_mode == 'pyav' else ffmpeg_available()
+
+
+def pick_encoders(frame_mode: str = 'auto') -> list:
+    """Encode functions to try in order for a frame_mode, leaving out missing backends."""
+    modes = FRAME_MODES if frame_mode == 'auto' else FRAME_MODES[FRAME_MODES.index(frame_mode):]
+    return [ENCODERS[mode] for mode in modes if frame_mode_available(mode)]
+
+
+def render_signature(size: int = 100, png_mode: str = 'optimize') -> str:
+    """Identify the render and encoder settings, e.g. for cache keys."""
+    return f"size={size};png={png_mode};" + encoding.settings_signature()
+
+
+def add_stage_time(stages_ms: dict, stage: str, start: float):
+    stages_ms[stage] = round(stages_ms.get(stage, 0.0) + (time.perf_counter() - start) * 1000, 2)
+
+
+def encode_rendered(
+    render,
+    complexity: encoding.AnimationComplexity,
+    fps: float,
+    frame_count: int,
+    size: int,
+    encoders: list,
+    motion: Optional[float] = None,
+    stages_ms: dict = None
+) -> Optional[EncodeReport]:
+    """Encode frames to a WEBM under the size limit, see encoding.encode_adaptive.
+    
+    render(frame_step) gives every frame_step-th raw frame. It is called once
+    per frame step, so re-encodes after an overshoot reuse the frames. The
+    report's data holds the encoded file.
+    """
+    stages_ms = {} if stages_ms is None else stages_ms
+    timelines = {}
+    output = [None]  # Bytes of the latest encode, which is the one the report describes
+    
+    def encode(plan: EncodePlan):
+        timeline = timelines.get(plan.frame_step)
+        if timeline is None:
+            start = time.perf_counter()
+            timeline = timelines[plan.frame_step] = frames.build_timeline(render(plan.frame_step))
+            add_stage_time(stages_ms, 'render', start)
+        
+        start = time.perf_counter()
+        output[0] = next(filter(None, (encoder(timeline, fps, plan, size) for encoder in encoders)), None)
+        add_stage_time(stages_ms, 'encode', start)
+        return len(output[0]) if output[0] is not None else None
+    
+    report = encoding.encode_adaptive(encode, complexity, fps, frame_count, motion)
+    if report is not None:
+        report.stages_ms = stages_ms
+        report.data = output[0]
+    return report
+
+
+def render_tgs_to_webm(
+    tgs_bytes: bytes,
+    size: int = 100,
+    frame_mode: str = 'auto',
+    complexity: encoding.AnimationComplexity = None
+) -> Optional[EncodeReport]:
+    """Render TGS (Lottie) animation to WEBM - for animated emojis.
+    
+    frame_mode 'pyav' encodes in-process, 'pipe' streams raw frames into an
+    ffmpeg subprocess and 'png' writes a PNG per frame for ffmpeg to read;
+    each falls back to the later ones if it fails or is missing, and 'auto'
+    starts with the first one installed. Returns an EncodeReport with the
+    WEBM bytes in its data, or None if the sticker could not be encoded
+    within the size limit.
+    """
+    try:
+        # Neither PyAV nor ffmpeg available: caller falls back to first frame PNG
+        encoders = pick_encoders(frame_mode)
+        if not encoders:
+            return None
+        
+        loaded = load_animation(tgs_bytes, complexity)
+        if loaded is None:
+            return None
+        anim, fps, frame_count, complexity = loaded
+        
+        stages_ms = {}
+        
+        # Only 60 fps animations are candidates for rendering below the 30 fps cap
+        motion = None
+        if fps >= 50:
+            start = time.perf_counter()
+            motion = frames.probe_motion(lambda numbers: iter_raw_frames_at(anim, numbers, size), frame_count, size)
+            add_stage_time(stages_ms, 'probe', start)
+        
+        return encode_rendered(
+            lambda frame_step: iter_raw_frames(anim, frame_count, size, frame_step),
+            complexity, fps, frame_count, size, encoders, motion, stages_ms
+        )
+    
+    except Exception:
+        return None
+
+
+def convert_video(job: ConversionJob, transcode: bool = True) -> Optional[ConversionResult]:
+    """Write a WEBM sticker as it is if it fits the emoji limits, else scale, trim and re-encode it.
+    
+    With transcode=False, returns None instead of transcoding.
+    """
+    stages_ms = {}
+    start = time.perf_counter()
+    info = video.probe_video(job.data)
+    add_stage_time(stages_ms, 'probe', start)
+    
+    # Without PyAV or ffprobe nothing can be checked, so the clip goes as it is
+    if info is None or not info.problems(job.size):
+        return ConversionResult(job.filename, job.data, 'video', size_bytes=len(job.data), stages_ms=stages_ms)
+    
+    if not transcode:
+        return None
+    
+    encoders = pick_encoders(job.frame_mode)
+    if not encoders:
+        return ConversionResult(error=f"WEBM needs transcoding ({', '.join(info.problems(job.size))}) but no encoder is installed")
+    
+    start = time.perf_counter()
+    decoded = video.decode_frames(job.data, info, job.size)
+    add_stage_time(stages_ms, 'decode', start)
+    if not decoded:
+        return ConversionResult(error="WEBM has no frames")
+    
+    report = encode_rendered(
+        lambda frame_step: decoded[::frame_step],
+        video.CLIP_COMPLEXITY, video.output_fps(info), len(decoded), job.size, encoders,
+        stages_ms=stages_ms
+    )
+    if report is None:
+        return ConversionResult(error="WEBM transcode failed")
+    return ConversionResult(
+        job.filename, report.data, 'video', attempts=report.attempts, size_bytes=report.size_bytes, stages_ms=report.stages_ms
+    )
+
+
+def pass_through_video(job: ConversionJob) -> Optional[ConversionResult]:
+    """Pass a WEBM that already fits through as it is. None if it has to be transcoded."""
+    try:
+        return convert_video(job, transcode=False)
+    except ValueError:
+        # Unreadable: the worker reports it
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def get_static_converter(size: int = 100, png_mode: str = 'optimize'):
+    """Shared static.StaticConverter; its canvases are per thread, so it is safe to share."""
+    from .static import StaticConverter
+    return StaticConverter(size=size, png_mode=png_mode)
+
+
+def convert_static(image_bytes: bytes, size: int = 100, png_mode: str = 'optimize') -> bytes:
+    """Resize a static WEBP/PNG sticker and center it on a transparent canvas."""
+    return get_static_converter(size, png_mode).convert(image_bytes)
+
+
+def run_job(job: ConversionJob, convert=None) -> Optional[ConversionResult]:
+    """Convert one sticker and time it. Runs inside a pool worker."""
+    start = time.perf_counter()
+    result = (convert or _convert)(job)
+    if result is not None:
+        result.render_ms = round((time.perf_counter() - start) * 1000, 2)
+    return result
+
+
+def refused(check: Preflight, stages_ms: dict = None) -> ConversionResult:
+    return ConversionResult(error=f"Refused by preflight: {check.reason}", stages_ms=stages_ms or {})
+
+
+def _convert(job: ConversionJob) -> ConversionResult:
+    """Dispatch a job to the converter for its kind."""
+    try:
+        if job.kind == 'video':
+            return convert_video(job)
+        
+        if job.kind == 'tgs':
+            stages_ms = {}
+            check = job.preflight
+            if check is None:
+                start = time.perf_counter()
+                check = preflight.check_tgs(job.data)
+                add_stage_time(stages_ms, 'preflight', start)
+            if check.action == 'refuse':
+                return refused(check, stages_ms)
+            
+            # Try to render TGS to WEBM for animated emoji, unless the preflight says it would take too long
+            if check.action == 'animate':
+                report = render_tgs_to_webm(job.data, size=job.size, frame_mode=job.frame_mode, complexity=check.complexity)
+                if report:
+                    return ConversionResult(
+                        str(PurePath(job.filename).with_suffix('.webm')), report.data, 'video',
+                        attempts=report.attempts, size_bytes=report.size_bytes, stages_ms={**stages_ms, **report.stages_ms}
+                    )
+            
+            # Fallback to PNG (first frame)
+            data = render_tgs_to_png(job.data, size=job.size, png_mode=job.png_mode)
+            if data is not None:
+                return ConversionResult(job.filename, data, 'static', size_bytes=len(data), stages_ms=stages_ms)
+            return ConversionResult(error="TGS render failed")
+        
+        data = convert_static(job.data, size=job.size, png_mode=job.png_mode)
+        return ConversionResult(job.filename, data, 'static', size_bytes=len(data))
+    
+    except Exception as e:
+        return ConversionResult(error=str(e))
+
+
+class ConversionEngine:
+    """Run conversion jobs on a process pool and await their results.
+    
+    Static stickers go to a thread pool instead: Pillow releases the GIL, and
+    it saves pickling the image bytes over to another process. At most
+    `workers` jobs are on the process pool at a time; the rest wait here and
+    the one expected to take longest goes next (longest job first), so a slow
+    sticker submitted late doesn't leave the other workers idle at the end.
+    """
+    
+    def __init__(self, workers: int = None):
+        self.workers = workers or os.cpu_count() or 1
+        self._executor = None
+        self._static_executor = None
+        self._running = 0
+        self._waiting = []  # Heap of (-estimated_ms, order, future)
+        self._order = itertools.count()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+    
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        """Process pool, started on first use.
+        
+        Workers are spawned, not forked: by the time the pool starts, the
+        event loop and the static/preflight threads are running, and a fork
+        would copy their locks in whatever state they are in.
+        """
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+    
+    @property
+    def static_executor(self) -> ThreadPoolExecutor:
+        """Thread pool for static stickers, started on first use."""
+        if self._static_executor is None:
+            self._static_executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='static')
+        return self._static_executor
+    
+    @asynccontextmanager
+    async def worker_slot(self, estimated_ms: float):
+        """Wait for a free worker; waiting jobs get one in order of estimated_ms, largest first."""
+        if self._running < self.workers and not self._waiting:
+            self._running += 1
+        else:
+            future = asyncio.get_event_loop().create_future()
+            heapq.heappush(self._waiting, (-estimated_ms, next(self._order), future))
+            try:
+                await future
+            except asyncio.CancelledError:
+                # Cancelled after the slot was handed over: pass it on
+                if future.done() and not future.cancelled():
+                    self._release_slot()
+                raise
+        try:
+            yield
+        finally:
+            self._release_slot()
+    
+    def _release_slot(self):
+        """Hand a finished job's slot to the most expensive waiting job."""
+        while self._waiting:
+            _, _, future = heapq.heappop(self._waiting)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._running -= 1
+    
+    async def convert(self, job: ConversionJob) -> ConversionResult:
+        """Submit a job to the pool and wait for its result."""
+        loop = asyncio.get_event_loop()
+        if job.kind == 'static':
+            return await loop.run_in_executor(self.static_executor, run_job, job)
+        
+        preflight_ms = None
+        if job.kind == 'video':
+            # Clips that already fit are passed through on a thread, without shipping them to a worker
+            result = await loop.run_in_executor(self.static_executor, run_job, job, pass_through_video)
+            if result is not None:
+                return result
+            estimated_ms = VIDEO_ESTIMATE_MS
+        else:
+            if job.preflight is None:
+                start = time.perf_counter()
+                job.preflight = await loop.run_in_executor(self.static_executor, preflight.check_tgs, job.data)
+                preflight_ms = round((time.perf_counter() - start) * 1000, 2)
+            if job.preflight.action == 'refuse':
+                return refused(job.preflight, {'preflight': preflight_ms} if preflight_ms is not None else None)
+            estimated_ms = job.preflight.estimated_ms
+        
+        async with self.worker_slot(estimated_ms):
+            result = await loop.run_in_executor(self.executor, run_job, job)
+        if preflight_ms is not None:
+            result.stages_ms['preflight'] = preflight_ms
+        return result
+    
+    def shutdown(self):
+        """Stop the worker processes and threads."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._static_executor is not None:
+            self._static_executor.shutdown(wait=True)
+            self._static_executor = None
@@ -0,0 +1,248 @@
+"""
+Offline mode: convert sticker files on disk without touching Telegram.
+
+    python -m sticker_to_emoji convert-local stickers/ -o out/
+    python -m sticker_to_emoji convert-local pack.zip -o out/ --emoji-map emojis.json
+    python -m sticker_to_emoji upload-local out/manifest.json my_pack
+
+convert-local reads .tgs, .webp, .png and .webm files from a directory or a
+tar/zip archive, runs them through the same conversion engine as the online
+path and writes the emoji files plus a manifest.json describing each one. It
+needs no credentials or network, so packs can be pre-rendered on build
+workers; upload-local then creates the emoji pack from a manifest on the
+host that has the bot token.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tarfile
+import zipfile
+from pathlib import Path
+
+from .cache import atomic_write
+from .engine import ConversionEngine, ConversionJob, ConversionResult
+from .metrics import Metrics
+
+# File suffix -> conversion job kind
+STICKER_KINDS = {
+    '.tgs': 'tgs',
+    '.webm': 'video',
+    '.webp': 'static',
+    '.png': 'static',
+}
+
+DEFAULT_EMOJI = '😀'
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+
+def is_sticker_name(name: str) -> bool:
+    """Whether a file name looks like a sticker we can convert."""
+    base = name.rsplit('/', 1)[-1]
+    return not base.startswith('.') and Path(base).suffix.lower() in STICKER_KINDS
+
+
+def iter_sticker_files(source: Path):
+    """Yield (name, bytes) for every sticker in a directory, tar or zip archive, in name order."""
+    if source.is_dir():
+        paths = sorted(p for p in source.rglob('*') if p.is_file() and is_sticker_name(p.name))
+        for path in paths:
+            yield path.relative_to(source).as_posix(), path.read_bytes()
+    
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for name in sorted(n for n in archive.namelist() if not n.endswith('/') and is_sticker_name(n)):
+                yield name, archive.read(name)
+    
+    elif tarfile.is_tarfile(source):
+        with tarfile.open(source, 'r:*') as archive:
+            members = sorted((m for m in archive.getmembers() if m.isfile() and is_sticker_name(m.name)), key=lambda m: m.name)
+            for member in members:
+                # tar archives made with `tar -C dir .` prefix every name with ./
+                name = member.name[2:] if member.name.startswith('./') else member.name
+                yield name, archive.extractfile(member).read()
+    
+    else:
+        raise ValueError(f"Not a directory, tar or zip archive: {source}")
+
+
+def load_emoji_map(path: str = None) -> dict:
+    """Read a JSON object mapping sticker file names (or stems) to emoji."""
+    if not path:
+        return {}
+    emoji_map = json.loads(Path(path).read_text(encoding='utf-8'))
+    if not isinstance(emoji_map, dict):
+        raise ValueError("Emoji map must be a JSON object of file name -> emoji")
+    return emoji_map
+
+
+def pick_emoji(name: str, emoji_map: dict, default: str) -> str:
+    """Emoji for a sticker, looked up by path, file name, then stem."""
+    base = name.rsplit('/', 1)[-1]
+    for key in (name, base, Path(base).stem):
+        if key in emoji_map:
+            return emoji_map[key]
+    return default
+
+
+async def convert_local(
+    source: Path,
+    output_dir: Path,
+    engine: ConversionEngine,
+    emoji_map: dict = None,
+    default_emoji: str = DEFAULT_EMOJI,
+    limit: int = None,
+    size: int = 100,
+    png_mode: str = 'optimize',
+    concurrency: int = None,
+    metrics: Metrics = None
+) -> dict:
+    """Convert sticker files in parallel and write manifest.json. Returns the manifest."""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    emoji_map = emoji_map or {}
+    metrics = metrics or Metrics()
+    # Bounds how many files are read into memory ahead of the workers
+    semaphore = asyncio.Semaphore(concurrency or engine.workers * 2)
+    
+    async def convert_one(number: int, name: str, data: bytes, emoji: str) -> dict:
+        kind = STICKER_KINDS[Path(name).suffix.lower()]
+        suffix = '.webm' if kind == 'video' else '.png'
+        job = ConversionJob(kind, data, f"emoji_{number:03d}_{emoji}{suffix}", size=size, png_mode=png_mode)
+        try:
+            result = await engine.convert(job)
+        finally:
+            semaphore.release()
+        
+        metrics.record('convert', result.render_ms / 1000, ok=result.ok, sticker=number, source=name, bytes=result.size_bytes)
+        for stage, ms in result.stages_ms.items():
+            metrics.record(stage, ms / 1000, sticker=number)
+        
+        if not result.ok:
+            print(f"  {number}: {name} ✗ {result.error}")
+            return {'source': name, 'emoji': emoji, 'error': result.error}
+        
+        result.save(output_dir)
+        print(f"  {number}: {name} {emoji} ✓ ({result.size_bytes / 1024:.1f} KB, {result.render_ms:.0f} ms)")
+        return {
+            'source': name,
+            'file': result.filename,
+            'emoji': emoji,
+            'format': result.sticker_format,
+            'size_bytes': result.size_bytes,
+            'render_ms': result.render_ms,
+            'attempts': result.attempts,
+        }
+    
+    tasks = []
+    for number, (name, data) in enumerate(iter_sticker_files(source), 1):
+        if limit and number > limit:
+            break
+        await semaphore.acquire()
+        emoji = pick_emoji(name, emoji_map, default_emoji)
+        tasks.append(asyncio.create_task(convert_one(number, name, data, emoji)))
+    
+    entries = await asyncio.gather(*tasks)
+    
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'source': str(source),
+        'size': size,
+        'stickers': [entry for entry in entries if 'error' not in entry],
+        'failed': [entry for entry in entries if 'error' in entry],
+    }
+    atomic_write(output_dir / MANIFEST_NAME, json.dumps(manifest, indent=2, ensure_ascii=False).encode('utf-8'))
+    return manifest
+
+
+def read_manifest(path: Path) -> list:
+    """(ConversionResult, emoji) for each converted file in a manifest, read into memory for upload."""
+    manifest = json.loads(path.read_text(encoding='utf-8'))
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported manifest version: {manifest.get('version')}")
+    emoji_files = []
+    for entry in manifest['stickers']:
+        data = (path.parent / entry['file']).read_bytes()
+        emoji_files.append((ConversionResult(entry['file'], data, entry['format'], size_bytes=len(data)), entry['emoji']))
+    return emoji_files
+
+
+async def convert_local_main(argv: list = None):
+    """Entry point for the convert-local subcommand."""
+    parser = argparse.ArgumentParser(
+        prog="sticker-to-emoji convert-local",
+        description="Convert sticker files to emoji files offline, without Telegram credentials",
+        epilog="Inputs: .tgs, .webp, .png and .webm files in a directory, tar or zip archive"
+    )
+    parser.add_argument("source", help="Directory, tar or zip archive of sticker files")
+    parser.add_argument("-o", "--output", default="emoji_output", help="Output directory (default: emoji_output)")
+    parser.add_argument("-l", "--limit", type=int, help="Convert at most this many stickers")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1, help="Conversion worker processes (default: CPU count)")
+    parser.add_argument("--emoji", default=DEFAULT_EMOJI, help=f"Emoji for stickers not in --emoji-map (default: {DEFAULT_EMOJI})")
+    parser.add_argument("--emoji-map", help="JSON file mapping sticker file names to emoji")
+    parser.add_argument("--fast-png", action="store_true", help="Single-pass PNG compression for static emojis (faster, slightly larger)")
+    args = parser.parse_args(argv)
+    
+    print("🎨 Sticker to Emoji Converter (offline)\n")
+    
+    try:
+        with ConversionEngine(args.workers) as engine:
+            manifest = await convert_local(
+                Path(args.source), Path(args.output), engine,
+                emoji_map=load_emoji_map(args.emoji_map),
+                default_emoji=args.emoji,
+                limit=args.limit,
+                png_mode='fast' if args.fast_png else 'optimize'
+            )
+    except KeyboardInterrupt:
+        print("\n\n⚠️  Cancelled", file=sys.stderr)
+        sys.exit(130)
+    except Exception as e:
+        print(f"\n❌ Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    
+    output_dir = Path(args.output)
+    print(f"\n✅ Converted {len(manifest['stickers'])} stickers, {len(manifest['failed'])} failed")
+    print(f"💾 Manifest: {(output_dir / MANIFEST_NAME).absolute()}")
+    if manifest['failed']:
+        sys.exit(1)
+
+
+async def upload_local_main(argv: list = None):
+    """Entry point for the upload-local subcommand."""
+    from .cli import load_credentials
+    from .bots import load_bot_list
+    from .converter import StickerToEmojiConverter, create_session
+    
+    parser = argparse.ArgumentParser(
+        prog="sticker-to-emoji upload-local",
+        description="Create an emoji pack from files converted with convert-local"
+    )
+    parser.add_argument("manifest", help="manifest.json written by convert-local")
+    parser.add_argument("name", help="Emoji pack name")
+    parser.add_argument("-t", "--title", help="Emoji pack title (default: the name)")
+    parser.add_argument("--bots", metavar="FILE", help="Extra bots to pick from, one '<token> [owner user id]' per line")
+    args = parser.parse_args(argv)
+    
+    credentials = load_credentials(telegram=False)
+    
+    try:
+        # Only the Bot API is used, the Telegram client is never started
+        converter = StickerToEmojiConverter(*credentials, extra_bots=load_bot_list(args.bots, credentials[3]))
+        emoji_files = read_manifest(Path(args.manifest))
+        async with create_session() as session:
+            async with converter.lease_bot() as uploader:
+                pack_url = await uploader.upload_and_create_emoji_pack(
+                    emoji_files, args.name, args.title or args.name, session
+                )
+    except KeyboardInterrupt:
+        print("\n\n⚠️  Cancelled", file=sys.stderr)
+        sys.exit(130)
+    except Exception as e:
+        print(f"\n❌ Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    
+    print(f"\n✅ Success! Emoji pack created!")
+    print(f"🔗 {pack_url}")
@@ -0,0 +1,156 @@
+"""
+Per-stage instrumentation.
+
+With --metrics FILE every stage of a run is timed and appended to FILE as
+one JSON object per line: fetching the pack, each sticker's download,
+conversion (split into rlottie render and ffmpeg encode time by the worker)
+and upload, every Bot API request and every set chunk. Spans carry the
+sticker index, bytes moved and which cache answered, so a slow pack can be
+traced to the stage that made it slow:
+
+    {"ts": 1700000000.123, "event": "span", "stage": "download", "pack": "Opa4958",
+     "sticker": 3, "duration_ms": 412.5, "ok": true, "bytes": 48211}
+
+--metrics-prometheus FILE also writes totals per stage in Prometheus text
+format when the run ends, for node_exporter's textfile collector. Listeners
+get every event as a dict; the service uses them to stream job progress.
+With no file and no listener a disabled Metrics records nothing.
+"""
+
+import copy
+import json
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+from .cache import atomic_write
+
+PREFIX = "sticker_to_emoji"
+
+COUNTER_HELP = {
+    'bytes_total': "Bytes downloaded, converted and uploaded, by stage.",
+    'cache_hits_total': "Stages answered by a cache, by cache.",
+    'api_retries_total': "Bot API requests retried, by method.",
+    'api_requests_total': "Successful Bot API requests, by bot and method.",
+    'api_rate_limited_total': "Bot API 429 responses, by bot.",
+}
+
+
+def format_labels(labels) -> str:
+    """Prometheus label set, e.g. {stage="upload"}."""
+    if not labels:
+        return ""
+    escaped = (
+        f'{key}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for key, value in labels
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+class Metrics:
+    """Stage timings and counters for one run."""
+    
+    def __init__(self, events_path: str = None, prometheus_path: str = None):
+        self.prometheus_path = Path(prometheus_path) if prometheus_path else None
+        self.context = {}  # Fields added to every event, e.g. the pack being converted
+        self.listeners = []  # Called with each event dict
+        self._events = open(events_path, 'a', encoding='utf-8', buffering=1) if events_path else None
+        self._stages = defaultdict(lambda: [0, 0.0, 0])  # stage -> [count, seconds, failures]
+        self._counters = defaultdict(float)  # (name, sorted label items) -> value
+    
+    def bind(self, **context) -> 'Metrics':
+        """A Metrics sharing this one's files, totals and listeners, with more context on its events.
+        
+        Only the original should be closed.
+        """
+        bound = copy.copy(self)
+        bound.context = {**self.context, **context}
+        return bound
+    
+    @property
+    def enabled(self) -> bool:
+        return self._events is not None or self.prometheus_path is not None or bool(self.listeners)
+    
+    def emit(self, event: str, **fields):
+        """Append one JSON line to the events file and pass the event to listeners."""
+        if self._events is None and not self.listeners:
+            return
+        record = {'ts': round(time.time(), 3), 'event': event, **self.context, **fields}
+        if self._events is not None:
+            self._events.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+        for listener in self.listeners:
+            listener(record)
+    
+    def count(self, name: str, value: float = 1, **labels):
+        if self.enabled:
+            self._counters[(name, tuple(sorted(labels.items())))] += value
+    
+    def record(self, stage: str, seconds: float, ok: bool = True, **fields):
+        """Record a finished stage. `bytes` and `cache` fields also feed the counters."""
+        if not self.enabled:
+            return
+        stats = self._stages[stage]
+        stats[0] += 1
+        stats[1] += seconds
+        if not ok:
+            stats[2] += 1
+        if fields.get('bytes'):
+            self.count('bytes_total', fields['bytes'], stage=stage)
+        if fields.get('cache'):
+            self.count('cache_hits_total', cache=fields['cache'])
+        self.emit('span', stage=stage, duration_ms=round(seconds * 1000, 2), ok=ok, **fields)
+    
+    @contextmanager
+    def span(self, stage: str, **fields):
+        """Time a block as one stage.
+        
+        Yields the span's fields so the block can add to them; setting
+        fields['ok'] = False marks the stage failed without raising.
+        """
+        start = time.perf_counter()
+        ok = True
+        try:
+            yield fields
+        except BaseException:
+            ok = False
+            raise
+        finally:
+            ok = fields.pop('ok', True) and ok
+            self.record(stage, time.perf_counter() - start, ok=ok, **fields)
+    
+    def prometheus_text(self) -> str:
+        lines = [
+            f"# HELP {PREFIX}_stage_seconds Time spent in each stage.",
+            f"# TYPE {PREFIX}_stage_seconds summary",
+        ]
+        for stage, (count, seconds, _) in sorted(self._stages.items()):
+            labels = format_labels([('stage', stage)])
+            lines.append(f"{PREFIX}_stage_seconds_sum{labels} {seconds:.6f}")
+            lines.append(f"{PREFIX}_stage_seconds_count{labels} {count}")
+        
+        lines.append(f"# HELP {PREFIX}_stage_failures_total Stages that failed.")
+        lines.append(f"# TYPE {PREFIX}_stage_failures_total counter")
+        for stage, (_, _, failures) in sorted(self._stages.items()):
+            lines.append(f"{PREFIX}_stage_failures_total{format_labels([('stage', stage)])} {failures}")
+        
+        for name in sorted({name for name, _ in self._counters}):
+            lines.append(f"# HELP {PREFIX}_{name} {COUNTER_HELP.get(name, name)}")
+            lines.append(f"# TYPE {PREFIX}_{name} counter")
+            for (counter, labels), value in sorted(self._counters.items()):
+                if counter == name:
+                    lines.append(f"{PREFIX}_{name}{format_labels(labels)} {int(value) if value == int(value) else value}")
+        
+        return "\n".join(lines) + "\n"
+    
+    def write_prometheus(self):
+        if self.prometheus_path is not None:
+            # Written in one rename so a collector never reads half a file
+            atomic_write(self.prometheus_path, self.prometheus_text().encode('utf-8'))
+    
+    def close(self):
+        """Write the Prometheus file, if any, and close the events file."""
+        self.write_prometheus()
+        if self._events is not None:
+            self._events.close()
+            self._events = None
@@ -0,0 +1,246 @@
+"""
+Streaming download -> convert -> upload pipeline.
+
+Each stage runs its own pool of workers and stages are joined by bounded
+asyncio queues, so uploads start while later stickers are still downloading
+and only a handful of stickers are held in memory at any time. Uploaded
+stickers are also put on the `ready` queue in pack order as soon as every
+sticker before them is done, so the emoji set can be filled while uploads
+are still running. Converted files are passed from stage to stage in
+memory and only written to disk when an output directory is given; at
+most 64 KB each, they are kept for the result.
+"""
+
+import asyncio
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from telethon import errors
+
+
+@dataclass
+class PipelineConfig:
+    """Concurrency limits for each pipeline stage."""
+    download_concurrency: int = 4
+    # Twice the workers, so the engine has waiting jobs to pick the most expensive from
+    convert_concurrency: int = field(default_factory=lambda: (os.cpu_count() or 1) * 2)
+    upload_concurrency: int = 4
+    queue_size: int = 8
+
+
+@dataclass
+class PipelineResult:
+    """Outcome of a pipeline run, in source pack order."""
+    converted: list = field(default_factory=list)  # (ConversionResult, emoji), as the other paths return
+    stickers: list = field(default_factory=list)  # InputSticker dicts for the Bot API
+    documents: list = field(default_factory=list)  # Source document of each entry in stickers
+    skipped: int = 0
+    failed: int = 0
+
+
+class StickerPipeline:
+    """Download, convert and upload stickers concurrently."""
+    
+    def __init__(self, converter, session, output_dir: Optional[Path] = None, limit: int = 50, config: PipelineConfig = None):
+        self.converter = converter
+        self.session = session
+        self.output_dir = output_dir
+        self.limit = limit
+        self.config = config or PipelineConfig()
+        
+        self._documents = {}
+        self._converted = {}
+        self._uploaded = {}
+        self._finished = {}
+        self._next_ready = 1
+        
+        # (document, InputSticker) pairs in pack order, then None
+        self.ready = asyncio.Queue()
+        self._skipped = 0
+        self._failed = 0
+        
+        # Stickers are only fed while in_flight + succeeded < limit, so a failed
+        # conversion or upload frees its slot for the next sticker in the pack
+        self._slots = asyncio.Condition()
+        self._in_flight = 0
+        self._succeeded = 0
+    
+    async def run(self, stickers) -> PipelineResult:
+        """Run every stage to completion and collect the results."""
+        if self.output_dir is not None:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+        
+        size = self.config.queue_size
+        download_queue = asyncio.Queue(maxsize=size)
+        convert_queue = asyncio.Queue(maxsize=size)
+        upload_queue = asyncio.Queue(maxsize=size)
+        
+        tasks = [
+            asyncio.ensure_future(self._feed(stickers, download_queue)),
+            asyncio.ensure_future(self._run_stage(
+                download_queue, convert_queue, self._download,
+                self.config.download_concurrency, self.config.convert_concurrency
+            )),
+            asyncio.ensure_future(self._run_stage(
+                convert_queue, upload_queue, self._convert,
+                self.config.convert_concurrency, self.config.upload_concurrency
+            )),
+            asyncio.ensure_future(self._run_stage(
+                upload_queue, None, self._upload,
+                self.config.upload_concurrency, 0
+            )),
+        ]
+        
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.ready.put_nowait(None)
+        
+        if self._succeeded >= self.limit and len(stickers) > self.limit:
+            print(f"⚠️  Reached limit of {self.limit} emojis")
+        
+        return PipelineResult(
+            converted=[self._converted[index] for index in sorted(self._converted)],
+            stickers=[self._uploaded[index] for index in sorted(self._uploaded)],
+            documents=[self._documents[index] for index in sorted(self._uploaded)],
+            skipped=self._skipped,
+            failed=self._failed
+        )
+    
+    async def _feed(self, stickers, queue: asyncio.Queue):
+        """Put stickers on the download queue until the limit is covered."""
+        for index, sticker in enumerate(stickers, 1):
+            async with self._slots:
+                await self._slots.wait_for(
+                    lambda: self._in_flight + self._succeeded < self.limit or self._succeeded >= self.limit
+                )
+                if self._succeeded >= self.limit:
+                    break
+                self._in_flight += 1
+            self._documents[index] = sticker
+            await queue.put((index, sticker))
+        
+        for _ in range(self.config.download_concurrency):
+            await queue.put(None)
+    
+    def _finish(self, index: int, sticker: dict = None):
+        """Record that a sticker left the pipeline, uploaded or not, and pass on the ones now in order."""
+        self._finished[index] = sticker
+        while self._next_ready in self._finished:
+            uploaded = self._finished.pop(self._next_ready)
+            if uploaded is not None:
+                self.ready.put_nowait((self._documents[self._next_ready], uploaded))
+            self._next_ready += 1
+    
+    async def _release(self, succeeded: bool):
+        """Mark an in-flight sticker as uploaded or dropped."""
+        async with self._slots:
+            self._in_flight -= 1
+            if succeeded:
+                self._succeeded += 1
+            self._slots.notify_all()
+    
+    async def _run_stage(self, inbox: asyncio.Queue, outbox, handler, concurrency: int, next_concurrency: int):
+        """Run a stage's workers, then tell the next stage there is no more input."""
+        
+        async def worker():
+            while True:
+                item = await inbox.get()
+                if item is None:
+                    break
+                result = await handler(*item)
+                if result is not None and outbox is not None:
+                    await outbox.put(result)
+        
+        await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+        
+        if outbox is not None:
+            for _ in range(max(1, next_concurrency)):
+                await outbox.put(None)
+    
+    async def _download(self, index: int, sticker):
+        """Download stage: fetch sticker bytes via Telethon, unless already converted."""
+        emoji = self.converter.get_sticker_emoji(sticker)
+        filename = self.converter.get_emoji_filename(sticker, index)
+        
+        cached = self.converter.find_cached_document(sticker, filename)
+        if cached is not None:
+            return index, sticker, emoji, None, cached
+        
+        try:
+            with self.converter.metrics.span('download', sticker=index, document_id=sticker.id) as span:
+                file_bytes = await self.converter.downloads.download(sticker)
+                span['bytes'] = len(file_bytes)
+        except errors.FloodWaitError:
+            # Not this sticker's fault: stop the pack so the caller can wait and resume it
+            raise
+        except Exception as e:
+            print(f"  {index}: {emoji} ✗ Download error: {e}")
+            self._failed += 1
+            self._finish(index)
+            await self._release(False)
+            return None
+        return index, sticker, emoji, file_bytes, None
+    
+    async def _convert(self, index: int, sticker, emoji: str, file_bytes: bytes, cached):
+        """Convert stage: render the sticker on the engine's process pool."""
+        filename = self.converter.get_emoji_filename(sticker, index)
+        try:
+            with self.converter.metrics.span('convert', sticker=index) as span:
+                if cached is not None:
+                    result = cached
+                    span['cache'] = 'document'
+                else:
+                    result = self.converter.find_cached_content(sticker, file_bytes, filename)
+                    if result is not None:
+                        span['cache'] = 'content'
+                if result is None:
+                    job = self.converter.make_conversion_job(sticker, file_bytes, filename)
+                    result = await self.converter.engine.convert(job)
+                    if result.ok:
+                        self.converter.store_converted(sticker, file_bytes, result)
+                if result.ok and self.output_dir is not None:
+                    result.save(self.output_dir)
+                span.update(ok=result.ok, bytes=result.size_bytes, attempts=result.attempts)
+            self.converter.record_render_stages(result, sticker=index)
+        except Exception as e:
+            print(f"  {index}: {emoji} ✗ Error: {e}")
+            self._failed += 1
+            self._finish(index)
+            await self._release(False)
+            return None
+        
+        if not result.ok:
+            print(f"  {index}: {emoji} ✗ ({result.error})")
+            self._skipped += 1
+            self._finish(index)
+            await self._release(False)
+            return None
+        
+        self._converted[index] = (result, emoji)
+        return index, emoji, result
+    
+    async def _upload(self, index: int, emoji: str, result):
+        """Upload stage: send the converted file to the Bot API."""
+        try:
+            sticker = await self.converter.upload_sticker_file(result, emoji, self.session)
+        except Exception as e:
+            print(f"  {index}: {emoji} ✗ Upload error: {e}")
+            self._failed += 1
+            self._finish(index)
+            await self._release(False)
+            return None
+        
+        self._uploaded[index] = sticker
+        self._finish(index, sticker)
+        await self._release(True)
+        details = f" ({result.size_bytes / 1024:.1f} KB"
+        if result.attempts:
+            details += f", {result.attempts} encode attempt{'s' if result.attempts > 1 else ''}"
+        details += ")"
+        print(f"  {len(self._uploaded)}/{self.limit}: {emoji} ✓{details}")
+        return None
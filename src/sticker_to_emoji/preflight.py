@@ -0,0 +1,180 @@
+"""
+Preflight checks for TGS stickers.
+
+rlottie parses and renders whatever it is given, so one pathological
+sticker (a gzip bomb, precomps nesting each other a hundred times over,
+huge embedded images) can hold a worker for minutes. Before a TGS goes to a
+worker its Lottie JSON is read here: gunzipped with a size cap, parsed once,
+and its frames, elements as rendered and image sizes turned into an
+estimate of the worker time it needs.
+
+The estimate decides what happens to the sticker: absurd ones are refused
+without touching a worker, ones too slow to animate go straight to the
+first-frame PNG, and the engine hands the most expensive waiting sticker to
+the next free worker, so a slow one doesn't start last and hold up a pack.
+"""
+
+import json
+import zlib
+from dataclasses import dataclass, field
+from typing import Optional
+
+from .encoding import MAX_DURATION, AnimationComplexity, count_elements
+
+MAX_JSON_BYTES = 8 * 1024 * 1024  # Decompressed; real stickers are well under 1 MB
+MAX_IMAGE_PIXELS = 50_000_000  # All embedded images together
+MAX_FRAME_MS = 10_000  # Refuse stickers whose first frame alone would take longer
+MAX_ANIMATION_MS = 30_000  # Render only the first frame of stickers that would take longer
+
+# Worker time per unit, fitted to the bench fixtures at 100x100. Only the
+# ratios matter for ordering; the limits above leave a wide margin.
+ENCODE_MS_PER_FRAME = 1.0  # VP9, including the occasional second attempt
+RENDER_MS_PER_UNIT = 0.005  # rlottie, per unit of AnimationComplexity.score per frame
+IMAGE_MS_PER_PIXEL = 0.00001  # Decoding embedded images when the animation loads
+
+
+@dataclass
+class Preflight:
+    """What converting a TGS sticker will take, from its Lottie JSON alone."""
+    action: str = 'animate'  # 'animate', 'first_frame' or 'refuse'
+    reason: Optional[str] = None
+    complexity: AnimationComplexity = field(default_factory=AnimationComplexity)  # Elements as written
+    render_score: float = 0.0  # Elements as rendered: precomps expanded, repeaters multiplied
+    frames: int = 0  # Frames that will be rendered, up to MAX_DURATION
+    json_bytes: int = 0
+    images: list = field(default_factory=list)  # (width, height) of each image asset
+    
+    @property
+    def image_pixels(self) -> int:
+        return sum(width * height for width, height in self.images)
+    
+    @property
+    def estimated_ms(self) -> float:
+        """Expected worker time for the action: every frame to animate it, one frame for the PNG."""
+        if self.action == 'refuse':
+            return 0.0
+        frames = self.frames if self.action == 'animate' else 1
+        return estimate_ms(self.render_score, frames, self.image_pixels)
+
+
+def estimate_ms(render_score: float, frames: int, image_pixels: int = 0) -> float:
+    """Expected worker time to render and encode `frames` frames."""
+    per_frame = ENCODE_MS_PER_FRAME + render_score * RENDER_MS_PER_UNIT
+    return round(frames * per_frame + image_pixels * IMAGE_MS_PER_PIXEL, 1)
+
+
+def decompress_tgs(tgs_bytes: bytes, limit: int = MAX_JSON_BYTES) -> bytes:
+    """Gunzip a TGS sticker, giving up past `limit` bytes so a gzip bomb costs nothing.
+    
+    Raises ValueError if the data isn't gzip or decompresses to more than limit.
+    """
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        data = decompressor.decompress(tgs_bytes, limit + 1)
+    except zlib.error as e:
+        raise ValueError(f"not a gzipped Lottie file ({e})")
+    if len(data) > limit:
+        raise ValueError(f"Lottie JSON is over {limit // (1024 * 1024)} MB")
+    return data
+
+
+def max_value(prop) -> float:
+    """Largest value a Lottie property takes, static or animated."""
+    if not isinstance(prop, dict):
+        return 0.0
+    value = prop.get('k', 0)
+    if prop.get('a'):
+        values = [key.get('s', [0]) for key in value if isinstance(key, dict)]
+        value = max((v[0] if isinstance(v, list) else v for v in values), default=0)
+    elif isinstance(value, list):
+        value = value[0] if value else 0
+    return float(value) if isinstance(value, (int, float)) else 0.0
+
+
+def shapes_score(shapes) -> float:
+    """Shapes drawn by a shape list; a repeater multiplies the shapes above it."""
+    total = 0.0
+    for shape in shapes or ():
+        if shape.get('ty') == 'gr':
+            total += 1 + shapes_score(shape.get('it'))
+        elif shape.get('ty') == 'rp':
+            total *= max(1.0, max_value(shape.get('c')))
+        else:
+            total += 1
+    return total
+
+
+def render_score(lottie: dict) -> float:
+    """AnimationComplexity.score of everything rendered per frame, with each precomp counted every time it is used.
+    
+    Raises ValueError if precomps include each other in a cycle.
+    """
+    assets = {asset.get('id'): asset for asset in lottie.get('assets') or () if 'layers' in asset}
+    scores = {}
+    
+    def layers_score(layers, using: tuple) -> float:
+        total = 0.0
+        for layer in layers or ():
+            total += AnimationComplexity(
+                layers=1, shapes=shapes_score(layer.get('shapes')), masks=len(layer.get('masksProperties') or ())
+            ).score
+            ref = layer.get('refId')
+            if layer.get('ty') == 0 and ref in assets:
+                if ref in using:
+                    raise ValueError(f"precomp {ref!r} includes itself")
+                if ref not in scores:
+                    scores[ref] = layers_score(assets[ref]['layers'], using + (ref,))
+                total += scores[ref]
+        return total
+    
+    return layers_score(lottie.get('layers'), ())
+
+
+def image_sizes(lottie: dict) -> list:
+    """(width, height) of every image asset."""
+    return [
+        (int(asset.get('w') or 0), int(asset.get('h') or 0))
+        for asset in lottie.get('assets') or ()
+        if 'p' in asset and 'layers' not in asset
+    ]
+
+
+def analyze(lottie: dict, json_bytes: int = 0) -> Preflight:
+    """Estimate the cost of a parsed Lottie animation and decide how to convert it."""
+    complexity = count_elements(lottie)
+    check = Preflight(complexity=complexity, json_bytes=json_bytes, images=image_sizes(lottie))
+    if complexity.fps > 0:
+        check.frames = max(0, min(complexity.frames, int(complexity.fps * MAX_DURATION)))
+    
+    try:
+        check.render_score = render_score(lottie)
+    except (ValueError, RecursionError) as e:
+        check.action, check.reason = 'refuse', str(e)
+        return check
+    
+    if check.image_pixels > MAX_IMAGE_PIXELS:
+        check.action, check.reason = 'refuse', f"{check.image_pixels / 1e6:.0f} megapixels of embedded images"
+    elif estimate_ms(check.render_score, 1, check.image_pixels) > MAX_FRAME_MS:
+        check.action, check.reason = 'refuse', f"{check.render_score:.0f} elements to render per frame"
+    elif check.frames == 0:
+        check.action, check.reason = 'first_frame', "not animated"
+    else:
+        animation_ms = estimate_ms(check.render_score, check.frames, check.image_pixels)
+        if animation_ms > MAX_ANIMATION_MS:
+            check.action, check.reason = 'first_frame', f"animating would take ~{animation_ms / 1000:.0f} s"
+    return check
+
+
+def check_tgs(tgs_bytes: bytes) -> Preflight:
+    """Preflight a TGS sticker. Unreadable ones are refused."""
+    try:
+        data = decompress_tgs(tgs_bytes)
+        lottie = json.loads(data)
+    except ValueError as e:
+        return Preflight(action='refuse', reason=str(e))
+    if not isinstance(lottie, dict):
+        return Preflight(action='refuse', reason="Lottie JSON is not an object")
+    try:
+        return analyze(lottie, len(data))
+    except (AttributeError, TypeError) as e:
+        return Preflight(action='refuse', reason=f"malformed Lottie JSON ({e})")
@@ -0,0 +1,342 @@
+"""
+Service mode: a long-running converter that takes jobs over HTTP.
+
+    python -m sticker_to_emoji serve --port 8080
+    python -m sticker_to_emoji serve --socket /run/sticker-to-emoji.sock
+
+Every CLI run pays for imports, the Telegram login, a fresh worker pool and
+cold connections. The service logs in once and keeps the converter, its
+worker processes, the conversion cache and the Bot API connections warm
+between jobs. Jobs run one at a time, in the order they were submitted.
+
+    POST /jobs               {"pack": "Opa4958", "name": "my_pack", "limit": 50, "sync": false}
+                             {"source": "/srv/stickers.zip", "name": "my_pack", "emoji_map": {...}}
+    GET  /jobs/{id}          Job status, and its pack_url once done
+    GET  /jobs/{id}/events   Progress events as JSON lines, streamed until the job ends
+    GET  /metrics            Stage totals in Prometheus text format
+    GET  /health
+
+A job names either a Telegram sticker pack or, like convert-local, a
+directory or archive of sticker files on the server. Progress events are the
+metrics spans of the job (see metrics.py) plus a "job" event when it
+starts and ends. With --offline the service never logs in to Telegram and
+only takes file jobs; together with --bot-api-url pointing at a stub it runs
+without any Telegram access.
+"""
+
+import argparse
+import asyncio
+import json
+import secrets
+import shutil
+import signal
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from aiohttp import web
+from telethon import errors
+
+from .batch import pack_dir_name
+from .cli import MAX_EMOJI_PER_SET, add_common_arguments, load_credentials
+from .converter import convert_pack, create_converter, create_session
+from .local import DEFAULT_EMOJI, MANIFEST_NAME, convert_local, read_manifest
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+MAX_FINISHED_JOBS = 100  # Finished jobs kept for GET /jobs/{id}
+
+
+@dataclass
+class Job:
+    """A conversion submitted to the service."""
+    id: str
+    request: dict
+    status: str = 'queued'  # 'queued', 'running', 'done' or 'failed'
+    pack_url: Optional[str] = None
+    error: Optional[str] = None
+    events: list = field(default_factory=list)
+    _subscribers: list = field(default_factory=list, repr=False)
+    
+    @property
+    def finished(self) -> bool:
+        return self.status in ('done', 'failed')
+    
+    def summary(self) -> dict:
+        return {
+            'id': self.id,
+            'status': self.status,
+            'pack_url': self.pack_url,
+            'error': self.error,
+            'events': len(self.events),
+        }
+    
+    def add_event(self, event: dict):
+        self.events.append(event)
+        for queue in self._subscribers:
+            queue.put_nowait(event)
+    
+    def set_status(self, status: str):
+        self.status = status
+        summary = self.summary()
+        # The event would count itself one short, so it leaves the count to GET /jobs/{id}
+        del summary['events']
+        self.add_event({'ts': round(time.time(), 3), 'event': 'job', **summary})
+        if self.finished:
+            for queue in self._subscribers:
+                queue.put_nowait(None)
+            self._subscribers.clear()
+    
+    def subscribe(self) -> asyncio.Queue:
+        """Queue of every event so far and every later one, ending with None."""
+        queue = asyncio.Queue()
+        for event in self.events:
+            queue.put_nowait(event)
+        if self.finished:
+            queue.put_nowait(None)
+        else:
+            self._subscribers.append(queue)
+        return queue
+
+
+def parse_job_request(body, offline: bool = False) -> dict:
+    """Check a POST /jobs body. Raises ValueError with a message for the client."""
+    if not isinstance(body, dict):
+        raise ValueError("Body must be a JSON object")
+    if ('pack' in body) == ('source' in body):
+        raise ValueError("Give either 'pack' (a sticker pack) or 'source' (a directory or archive)")
+    if 'pack' in body and offline:
+        raise ValueError("The service runs --offline and only takes 'source' jobs")
+    if 'source' in body and not body.get('name'):
+        raise ValueError("'name' is required with 'source'")
+    
+    limit = body.get('limit')
+    if limit is not None and not (isinstance(limit, int) and 0 < limit <= MAX_EMOJI_PER_SET):
+        raise ValueError(f"'limit' must be between 1 and {MAX_EMOJI_PER_SET}")
+    if not isinstance(body.get('emoji_map', {}), dict):
+        raise ValueError("'emoji_map' must be an object of file name -> emoji")
+    return body
+
+
+class ConverterService:
+    """Run submitted jobs one at a time on a converter that stays warm."""
+    
+    def __init__(self, converter, session, args):
+        self.converter = converter
+        self.session = session
+        self.args = args
+        self.jobs = OrderedDict()
+        self.queue = asyncio.Queue()
+        self.current = None
+        converter.metrics.listeners.append(self._on_event)
+    
+    def _on_event(self, event: dict):
+        if self.current is not None:
+            self.current.add_event(event)
+    
+    def submit(self, request: dict) -> Job:
+        job = Job(secrets.token_hex(8), request)
+        self.jobs[job.id] = job
+        self.queue.put_nowait(job)
+        self._forget_finished()
+        return job
+    
+    def _forget_finished(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+    
+    async def run(self):
+        """Work through the job queue until cancelled."""
+        while True:
+            job = await self.queue.get()
+            self.current = job
+            self.converter.metrics.context = {'job': job.id}
+            try:
+                await self.run_job(job)
+            finally:
+                self.current = None
+                self.converter.metrics.context = {}
+                self.converter.metrics.write_prometheus()
+    
+    async def run_job(self, job: Job):
+        job.set_status('running')
+        try:
+            if 'source' in job.request:
+                job.pack_url = await self.run_local_job(job)
+            else:
+                job.pack_url = await self.run_pack_job(job.request)
+        except errors.FloodWaitError as e:
+            job.error = f"FloodWait {e.seconds}s, submit the job again later with \"sync\": true"
+        except Exception as e:
+            job.error = str(e)
+        
+        if job.error:
+            print(f"❌ Job {job.id}: {job.error}", file=sys.stderr)
+        else:
+            print(f"✅ Job {job.id}: {job.pack_url}")
+        job.set_status('failed' if job.error else 'done')
+    
+    async def run_pack_job(self, request: dict) -> str:
+        """Convert a Telegram sticker pack, as the CLI does. Nothing touches the disk without --save-local."""
+        args = argparse.Namespace(**vars(self.args))
+        args.limit = request.get('limit') or args.limit
+        args.sync = request.get('sync', args.sync)
+        pack = request['pack']
+        return await convert_pack(
+            self.converter, self.session, pack, args,
+            Path(args.output) / pack_dir_name(pack), name=request.get('name')
+        )
+    
+    async def run_local_job(self, job: Job) -> str:
+        """Convert sticker files on this machine and upload them, as convert-local and upload-local do."""
+        request = job.request
+        self.converter.metrics.context['pack'] = request['name']
+        # convert-local writes files and a manifest, so these jobs get a directory of their own
+        job_dir = Path(self.args.temp_dir) / job.id
+        try:
+            manifest = await convert_local(
+                Path(request['source']), job_dir, self.converter.engine,
+                emoji_map=request.get('emoji_map'),
+                default_emoji=request.get('emoji', DEFAULT_EMOJI),
+                limit=request.get('limit') or self.args.limit,
+                png_mode=self.converter.png_mode,
+                metrics=self.converter.metrics
+            )
+            if not manifest['stickers']:
+                raise ValueError("No stickers converted successfully")
+            emoji_files = read_manifest(job_dir / MANIFEST_NAME)
+        finally:
+            shutil.rmtree(job_dir, ignore_errors=True)
+        
+        async with self.converter.lease_bot() as converter:
+            return await converter.upload_and_create_emoji_pack(
+                emoji_files, request['name'], request.get('title') or request['name'], self.session
+            )
+    
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.add_routes([
+            web.post('/jobs', self.handle_submit),
+            web.get('/jobs/{id}', self.handle_status),
+            web.get('/jobs/{id}/events', self.handle_events),
+            web.get('/metrics', self.handle_metrics),
+            web.get('/health', self.handle_health),
+        ])
+        return app
+    
+    def get_job(self, request: web.Request) -> Job:
+        job = self.jobs.get(request.match_info['id'])
+        if job is None:
+            raise web.HTTPNotFound(text=json.dumps({'error': 'No such job'}), content_type='application/json')
+        return job
+    
+    async def handle_submit(self, request: web.Request) -> web.Response:
+        try:
+            body = await request.json()
+        except ValueError:
+            return web.json_response({'error': "Body must be JSON"}, status=400)
+        try:
+            body = parse_job_request(body, offline=self.args.offline)
+        except ValueError as e:
+            return web.json_response({'error': str(e)}, status=400)
+        
+        job = self.submit(body)
+        print(f"📥 Job {job.id}: {body.get('pack') or body.get('source')}")
+        return web.json_response(job.summary(), status=202)
+    
+    async def handle_status(self, request: web.Request) -> web.Response:
+        return web.json_response(self.get_job(request).summary())
+    
+    async def handle_events(self, request: web.Request) -> web.StreamResponse:
+        job = self.get_job(request)
+        queue = job.subscribe()
+        
+        response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+        await response.prepare(request)
+        while True:
+            event = await queue.get()
+            if event is None:
+                break
+            await response.write((json.dumps(event, ensure_ascii=False, default=str) + '\n').encode('utf-8'))
+        await response.write_eof()
+        return response
+    
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.converter.metrics.prometheus_text(), content_type='text/plain')
+    
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            'status': 'ok',
+            'queued': self.queue.qsize(),
+            'running': self.current.id if self.current else None,
+            'bots': self.converter.bots.stats(),
+        })
+
+
+async def serve_main(argv: list = None):
+    """Entry point for the serve subcommand."""
+    parser = argparse.ArgumentParser(
+        prog="sticker-to-emoji serve",
+        description="Run the converter as a service that takes jobs over HTTP",
+        epilog="Submit jobs with POST /jobs, follow them with GET /jobs/<id>/events"
+    )
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"Address to listen on (default: {DEFAULT_HOST})")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port to listen on (default: {DEFAULT_PORT})")
+    parser.add_argument("--socket", help="Listen on this Unix socket instead of TCP")
+    parser.add_argument("--offline", action="store_true", help="Don't log in to Telegram; only take jobs with a 'source'")
+    parser.add_argument("--temp-dir", default="temp_emojis", help="Working directory for jobs with a 'source' (default: temp_emojis)")
+    add_common_arguments(parser)
+    args = parser.parse_args(argv)
+    
+    # Offline, the Telegram client is never started, so its API id and hash aren't needed
+    credentials = load_credentials(telegram=not args.offline)
+    
+    print("🎨 Sticker to Emoji Converter (service)\n")
+    
+    stop = asyncio.Event()
+    loop = asyncio.get_event_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            # Not supported on Windows; Ctrl-C still raises KeyboardInterrupt
+            pass
+    
+    converter = create_converter(args, credentials)
+    try:
+        async with create_session() as session:
+            if not args.offline:
+                await converter.connect()
+            
+            service = ConverterService(converter, session, args)
+            runner = web.AppRunner(service.create_app())
+            await runner.setup()
+            if args.socket:
+                # A socket left behind by a service that was killed would block the bind
+                socket_path = Path(args.socket)
+                if socket_path.is_socket():
+                    socket_path.unlink()
+                site = web.UnixSite(runner, args.socket)
+            else:
+                site = web.TCPSite(runner, args.host, args.port)
+            await site.start()
+            print(f"🚀 Listening on {args.socket or f'http://{args.host}:{args.port}'}")
+            
+            worker = asyncio.ensure_future(service.run())
+            try:
+                await stop.wait()
+            finally:
+                worker.cancel()
+                await runner.cleanup()
+                if args.socket and Path(args.socket).is_socket():
+                    Path(args.socket).unlink()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        await converter.close()
+    
+    print("\n👋 Stopped")
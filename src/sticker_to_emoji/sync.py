@@ -0,0 +1,103 @@
+"""
+Incremental emoji pack sync.
+
+Instead of creating a new emoji set on every run, --sync reads the set that
+already exists with getStickerSet, works out which of its emoji still match
+the source pack and applies only the difference with addStickerToSet,
+deleteStickerFromSet and setStickerPositionInSet.
+
+Emoji in a set carry no trace of the sticker they were made from, so a small
+state file per set maps each emoji's file_unique_id to its source document id
+and, with the conversion cache on, the content key of the converted file. It
+is written whenever a set is created or extended, with or without --sync:
+the set is read back after each chunk of adds and its new emoji matched to
+the stickers added in between. Emoji are matched by document id first, then
+by content key, so a sticker that was re-added to the source pack unchanged
+isn't uploaded again. Emoji the state file doesn't know (added by hand, or
+by an older version) are treated as stale and removed.
+"""
+
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from .cache import atomic_write
+
+
+@dataclass
+class SyncPlan:
+    """Difference between a source sticker pack and an emoji set."""
+    keep: dict = field(default_factory=dict)  # Source document id -> file_unique_id already in the set
+    add: list = field(default_factory=list)  # Source documents to convert and add, in pack order
+    delete: list = field(default_factory=list)  # file_unique_ids to remove from the set
+
+
+class SyncState:
+    """Which source sticker each emoji in a set was made from."""
+    
+    def __init__(self, path: Path, stickers: dict = None):
+        self.path = Path(path)
+        self.stickers = stickers or {}  # file_unique_id -> {'document_id', 'content_key'}
+    
+    @classmethod
+    def load(cls, path: Path) -> 'SyncState':
+        """Read a state file; a missing or unreadable file gives an empty state."""
+        try:
+            data = json.loads(Path(path).read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            data = {}
+        return cls(path, data.get('stickers', {}))
+    
+    def save(self):
+        atomic_write(self.path, json.dumps({'stickers': self.stickers}, indent=2).encode('utf-8'))
+    
+    def record(self, file_unique_id: str, document_id: int, content_key: str = None):
+        self.stickers[file_unique_id] = {'document_id': document_id, 'content_key': content_key}
+
+
+def plan_sync(documents: list, set_stickers: list, state: SyncState, content_keys: dict, limit: int = 50) -> SyncPlan:
+    """Diff source documents against the stickers of an emoji set.
+    
+    content_keys maps document id -> content key for documents already in
+    the conversion cache. Documents beyond `limit` are left out of the set.
+    """
+    tracked = {
+        sticker['file_unique_id']: state.stickers[sticker['file_unique_id']]
+        for sticker in set_stickers if sticker['file_unique_id'] in state.stickers
+    }
+    by_document = {entry['document_id']: uid for uid, entry in tracked.items()}
+    by_content = {entry['content_key']: uid for uid, entry in tracked.items() if entry.get('content_key')}
+    
+    matched = {document.id: by_document[document.id] for document in documents if document.id in by_document}
+    used = set(matched.values())
+    for document in documents:
+        if document.id in matched:
+            continue
+        uid = by_content.get(content_keys.get(document.id))
+        if uid is not None and uid not in used:
+            matched[document.id] = uid
+            used.add(uid)
+    
+    plan = SyncPlan()
+    for document in documents:
+        if document.id not in matched:
+            plan.add.append(document)
+        elif len(plan.keep) < limit:
+            plan.keep[document.id] = matched[document.id]
+    
+    kept = set(plan.keep.values())
+    plan.delete = [sticker['file_unique_id'] for sticker in set_stickers if sticker['file_unique_id'] not in kept]
+    return plan
+
+
+def plan_moves(current: list, desired: list) -> list:
+    """(file_unique_id, position) moves that put `desired` at the front of `current`, in order."""
+    current = list(current)
+    moves = []
+    for position, uid in enumerate(desired):
+        if position < len(current) and current[position] == uid:
+            continue
+        current.remove(uid)
+        current.insert(position, uid)
+        moves.append((uid, position))
+    return moves
@@ -0,0 +1,255 @@
+"""
+Video sticker (WEBM) probing and decoding.
+
+Telegram's video stickers are 512 px wide and may run longer and larger
+than a custom emoji is allowed to (100x100, at most 3 s, 30 fps and 64 KB,
+VP9 without audio). Each clip is probed first; clips that already fit are
+uploaded as they are, the rest are decoded to raw frames here and encoded
+again by the engine like a rendered TGS sticker.
+
+PyAV is used when installed, ffprobe/ffmpeg subprocesses otherwise. VP9 and
+VP8 are decoded with libvpx, since ffmpeg's native decoders drop the alpha
+channel.
+"""
+
+import functools
+import io
+import json
+import subprocess
+from dataclasses import dataclass
+from fractions import Fraction
+from typing import Optional
+
+from .encoding import MAX_DURATION, MAX_EMOJI_BYTES, MAX_FPS, AnimationComplexity
+
+# Clips have no Lottie elements to count; encode them like a medium-complexity animation
+CLIP_COMPLEXITY = AnimationComplexity(layers=20)
+DURATION_TOLERANCE = 0.05  # Seconds; container durations are often rounded up a little
+
+# Decoders that keep the alpha channel
+ALPHA_DECODERS = {
+    'vp9': 'libvpx-vp9',
+    'vp8': 'libvpx',
+}
+
+
+@dataclass
+class VideoInfo:
+    """Stream metadata of a video sticker."""
+    codec: str
+    width: int
+    height: int
+    fps: float
+    duration: Optional[float]  # Seconds, None if the container doesn't say
+    has_audio: bool
+    size_bytes: int
+    
+    def problems(self, size: int = 100) -> list:
+        """Reasons the clip can't be used as a custom emoji as it is; empty if it can."""
+        problems = []
+        if self.codec != 'vp9':
+            problems.append(f"codec {self.codec}")
+        if (self.width, self.height) != (size, size):
+            problems.append(f"{self.width}x{self.height}")
+        if self.duration is None or self.duration > MAX_DURATION + DURATION_TOLERANCE:
+            problems.append(f"duration {self.duration}")
+        if self.fps > MAX_FPS:
+            problems.append(f"{self.fps:g} fps")
+        if self.has_audio:
+            problems.append("audio")
+        if self.size_bytes > MAX_EMOJI_BYTES:
+            problems.append(f"{self.size_bytes} bytes")
+        return problems
+
+
+@functools.lru_cache(maxsize=None)
+def pyav_available() -> bool:
+    """Check if PyAV is installed. Checked once per process."""
+    try:
+        import av  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+@functools.lru_cache(maxsize=None)
+def ffprobe_available() -> bool:
+    """Check if ffprobe is available. Checked once per process."""
+    try:
+        subprocess.run(['ffprobe', '-version'], capture_output=True, check=True)
+        return True
+    except (FileNotFoundError, subprocess.CalledProcessError):
+        return False
+
+
+def parse_rate(rate: str) -> float:
+    """ffprobe frame rate such as '30/1' or '0/0'."""
+    try:
+        return float(Fraction(rate))
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+
+def probe_video(data: bytes) -> Optional[VideoInfo]:
+    """Read a WEBM's stream metadata. None if neither PyAV nor ffprobe is installed.
+    
+    Raises ValueError if the data isn't a readable video.
+    """
+    if pyav_available():
+        return probe_video_pyav(data)
+    if ffprobe_available():
+        return probe_video_ffprobe(data)
+    return None
+
+
+def probe_video_pyav(data: bytes) -> VideoInfo:
+    import av
+    
+    try:
+        with av.open(io.BytesIO(data)) as container:
+            if not container.streams.video:
+                raise ValueError("No video stream")
+            stream = container.streams.video[0]
+            if container.duration:
+                duration = container.duration / av.time_base
+            elif stream.duration and stream.time_base:
+                duration = float(stream.duration * stream.time_base)
+            else:
+                duration = None
+            return VideoInfo(
+                codec=stream.codec_context.name,
+                width=stream.codec_context.width,
+                height=stream.codec_context.height,
+                fps=float(stream.average_rate or stream.guessed_rate or 0),
+                duration=duration,
+                has_audio=bool(container.streams.audio),
+                size_bytes=len(data)
+            )
+    except av.FFmpegError as e:
+        raise ValueError(f"Unreadable video: {e}")
+
+
+def probe_video_ffprobe(data: bytes) -> VideoInfo:
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-show_streams', '-show_format', '-of', 'json', 'pipe:0'],
+        input=data, capture_output=True
+    )
+    if result.returncode != 0:
+        raise ValueError(f"Unreadable video: {result.stderr.decode(errors='replace').strip()}")
+    
+    probe = json.loads(result.stdout)
+    streams = probe.get('streams', [])
+    video = next((s for s in streams if s.get('codec_type') == 'video'), None)
+    if video is None:
+        raise ValueError("No video stream")
+    duration = probe.get('format', {}).get('duration') or video.get('duration')
+    return VideoInfo(
+        codec=video.get('codec_name'),
+        width=video.get('width', 0),
+        height=video.get('height', 0),
+        fps=parse_rate(video.get('avg_frame_rate', '0/0')) or parse_rate(video.get('r_frame_rate', '0/0')),
+        duration=float(duration) if duration else None,
+        has_audio=any(s.get('codec_type') == 'audio' for s in streams),
+        size_bytes=len(data)
+    )
+
+
+def output_fps(info: VideoInfo) -> float:
+    return min(info.fps or MAX_FPS, MAX_FPS)
+
+
+def fit_size(width: int, height: int, size: int) -> tuple:
+    """Largest (width, height) with the clip's aspect ratio that fits in size x size."""
+    scale = size / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def decode_frames(data: bytes, info: VideoInfo, size: int = 100) -> list:
+    """Decode the first 3 s of a clip to raw BGRA frames at up to 30 fps, centered on a size x size canvas."""
+    if pyav_available():
+        return decode_frames_pyav(data, info, size)
+    return decode_frames_ffmpeg(data, info, size)
+
+
+def decode_frames_pyav(data: bytes, info: VideoInfo, size: int = 100) -> list:
+    import av
+    from PIL import Image
+    
+    fps = output_fps(info)
+    frame_count = int(min(info.duration or MAX_DURATION, MAX_DURATION) * fps + 0.5)
+    width, height = fit_size(info.width, info.height, size)
+    offset = ((size - width) // 2, (size - height) // 2)
+    
+    frames = []
+    last = None  # Most recent decoded frame, as raw canvas bytes
+    first_seconds = None
+    seconds = 0.0
+    
+    def fill_until(until: float):
+        # Output frame k shows whichever source frame is on screen at k / fps
+        while len(frames) < frame_count and len(frames) / fps < until:
+            frames.append(last)
+    
+    try:
+        with av.open(io.BytesIO(data)) as container:
+            stream = container.streams.video[0]
+            decoder = stream.codec_context
+            if decoder.name in ALPHA_DECODERS:
+                try:
+                    decoder = av.CodecContext.create(ALPHA_DECODERS[decoder.name], 'r')
+                except (av.FFmpegError, ValueError):
+                    pass
+            
+            decoded = 0
+            for packet in container.demux(stream):
+                for frame in decoder.decode(packet):
+                    if frame.pts is not None:
+                        seconds = float(frame.pts * stream.time_base)
+                    else:
+                        seconds = decoded / (info.fps or fps)
+                    if first_seconds is None:
+                        first_seconds = seconds
+                    decoded += 1
+                    
+                    if last is not None:
+                        fill_until(seconds - first_seconds)
+                    if len(frames) >= frame_count:
+                        return frames
+                    
+                    scaled = frame.reformat(width=width, height=height, format='bgra')
+                    plane = scaled.planes[0]
+                    image = Image.frombuffer('RGBA', (width, height), bytes(plane), 'raw', 'BGRA', plane.line_size, 1)
+                    canvas = Image.new('RGBA', (size, size))
+                    canvas.paste(image, offset)
+                    last = canvas.tobytes('raw', 'BGRA')
+    except av.FFmpegError as e:
+        raise ValueError(f"Could not decode video: {e}")
+    
+    if last is None:
+        return []
+    # The last frame stays on screen for one source frame
+    fill_until(seconds - first_seconds + 1 / (info.fps or fps))
+    return frames
+
+
+def decode_frames_ffmpeg(data: bytes, info: VideoInfo, size: int = 100) -> list:
+    fps = output_fps(info)
+    decoder = ['-c:v', ALPHA_DECODERS[info.codec]] if info.codec in ALPHA_DECODERS else []
+    video_filter = (
+        f"fps={fps:g},"
+        f"scale={size}:{size}:force_original_aspect_ratio=decrease,"
+        f"pad={size}:{size}:(ow-iw)/2:(oh-ih)/2:color=black@0"
+    )
+    result = subprocess.run(
+        ['ffmpeg', '-loglevel', 'error'] + decoder + [
+            '-i', 'pipe:0', '-t', str(MAX_DURATION), '-an', '-vf', video_filter,
+            '-f', 'rawvideo', '-pix_fmt', 'bgra', 'pipe:1'
+        ],
+        input=data, capture_output=True
+    )
+    if result.returncode != 0:
+        raise ValueError(f"Could not decode video: {result.stderr.decode(errors='replace').strip()}")
+    
+    frame_bytes = size * size * 4
+    raw = result.stdout
+    return [raw[i:i + frame_bytes] for i in range(0, len(raw) - frame_bytes + 1, frame_bytes)]
@@ -0,0 +1,65 @@
+"""Tests for the batch journal and pack list parsing."""
+
+from sticker_to_emoji.batch import BatchJournal, pack_dir_name, read_pack_list
+
+
+def test_pending_in_list_order(tmp_path):
+    journal = BatchJournal(tmp_path / "journal.sqlite3")
+    journal.add([('b', None), ('a', 'custom')])
+    
+    assert journal.pending() == [('b', None), ('a', 'custom')]
+
+
+def test_resume_skips_done_and_redoes_running(tmp_path):
+    path = tmp_path / "journal.sqlite3"
+    journal = BatchJournal(path)
+    journal.add([('one', None), ('two', None), ('three', None), ('four', None)])
+    journal.start('one')
+    journal.finish('one', 'https://t.me/addemoji/one')
+    journal.start('two')  # Crashed while running
+    journal.start('three')
+    journal.fail('three', 'boom')
+    journal.close()
+    
+    journal = BatchJournal(path)
+    journal.add([('one', None), ('five', None)])
+    assert journal.pending() == [('two', None), ('four', None), ('five', None)]
+    assert journal.pending(retry_failed=True) == [('two', None), ('three', None), ('four', None), ('five', None)]
+    assert journal.counts() == {'done': 1, 'running': 1, 'failed': 1, 'pending': 2}
+
+
+def test_deferred_after_flood_wait(tmp_path):
+    journal = BatchJournal(tmp_path / "journal.sqlite3")
+    journal.add([('one', None), ('two', None)])
+    journal.start('one')
+    journal.defer('one', 'FloodWait 600s')
+    journal.start('two')
+    journal.fail('two', 'Could not retrieve sticker pack')
+    
+    assert journal.pending() == [('one', None)]
+    assert journal.deferred('one')
+    assert not journal.deferred('two')
+    assert not journal.deferred('missing')
+
+
+def test_attempted_after_any_start(tmp_path):
+    journal = BatchJournal(tmp_path / "journal.sqlite3")
+    journal.add([('one', None), ('two', None)])
+    journal.start('one')  # Crashed while running
+    
+    assert journal.attempted('one')
+    assert not journal.attempted('two')
+    assert not journal.attempted('missing')
+
+
+def test_read_pack_list(tmp_path):
+    path = tmp_path / "packs.txt"
+    path.write_text("# packs\nOpa4958\n\nhttps://t.me/addstickers/Cats  my_cats  # comment\n", encoding='utf-8')
+    
+    assert read_pack_list(str(path)) == [('Opa4958', None), ('https://t.me/addstickers/Cats', 'my_cats')]
+
+
+def test_pack_dir_name():
+    assert pack_dir_name('https://t.me/addstickers/Cats/') == 'Cats'
+    assert pack_dir_name('tg://addstickers?set=Cats') == 'Cats'
+    assert pack_dir_name('a b') == 'a_b'
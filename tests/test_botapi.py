@@ -0,0 +1,140 @@
+"""Tests for the Bot API client's rate limiting and retry policy."""
+
+import asyncio
+
+import aiohttp
+import pytest
+
+from sticker_to_emoji import botapi
+from sticker_to_emoji.botapi import BotAPIClient, BotAPIError, TokenBucket, backoff_delay
+
+
+def test_backoff_delay_is_bounded():
+    for attempt in range(12):
+        delay = backoff_delay(attempt)
+        assert 0 <= delay <= min(botapi.BACKOFF_MAX, botapi.BACKOFF_BASE * 2 ** attempt)
+
+
+def test_transient_errors():
+    assert BotAPIError('m', 'Too Many Requests', error_code=429).transient
+    assert BotAPIError('m', 'Bad Gateway', error_code=502).transient
+    assert not BotAPIError('m', 'Bad Request', error_code=400).transient
+
+
+def test_token_bucket_burst_then_rate():
+    async def run():
+        bucket = TokenBucket(rate=1000.0, burst=2)
+        await bucket.acquire()
+        await bucket.acquire()
+        assert bucket.wait_time() > 0
+        await bucket.acquire()
+    
+    asyncio.run(run())
+
+
+def test_token_bucket_pause():
+    bucket = TokenBucket(rate=100.0, burst=4)  # wait_time() and pause() don't need a running loop
+    assert bucket.wait_time() == 0
+    bucket.pause(5)
+    assert 4.9 < bucket.wait_time() <= 5
+    bucket.pause(1)  # A shorter pause doesn't cut the longer one short
+    assert bucket.wait_time() > 4.9
+
+
+class FakeClient(BotAPIClient):
+    """A client whose requests fail with the given errors, then succeed."""
+    
+    def __init__(self, errors: list):
+        super().__init__('123:abc', rate=10_000.0)
+        self.errors = list(errors)
+        self.sent = []
+    
+    async def _request(self, session, method, params, files):
+        self.sent.append(method)
+        if self.errors:
+            raise self.errors.pop(0)
+        return {'method': method}
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(botapi, 'backoff_delay', lambda attempt: 0)
+
+
+def run_call(errors: list, method: str, **kwargs):
+    """Call a method on a FakeClient made inside the event loop; returns (client, result or exception)."""
+    async def run():
+        client = FakeClient(errors)
+        try:
+            return client, await client.call(None, method, **kwargs)
+        except Exception as e:
+            return client, e
+    
+    return asyncio.run(run())
+
+
+def test_idempotent_methods_are_retried():
+    client, result = run_call(
+        [aiohttp.ClientError(), BotAPIError('getStickerSet', 'Bad Gateway', error_code=502)], 'getStickerSet'
+    )
+    
+    assert result == {'method': 'getStickerSet'}
+    assert client.sent == ['getStickerSet'] * 3
+    assert client.requests['getStickerSet'] == 1
+
+
+def test_set_changes_are_not_retried_blindly():
+    client, result = run_call([asyncio.TimeoutError()], 'addStickerToSet')
+    
+    assert isinstance(result, asyncio.TimeoutError)
+    assert client.sent == ['addStickerToSet']
+
+
+def test_set_change_that_went_through_is_not_repeated():
+    checks = []
+    
+    async def applied():
+        checks.append(True)
+        return True
+    
+    client, result = run_call(
+        [BotAPIError('createNewStickerSet', 'Bad Gateway', error_code=502)], 'createNewStickerSet', applied=applied
+    )
+    
+    assert result is True
+    assert client.sent == ['createNewStickerSet']
+    assert checks == [True]
+
+
+def test_set_change_that_was_lost_is_retried():
+    async def applied():
+        return False
+    
+    client, result = run_call([aiohttp.ClientError()], 'addStickerToSet', applied=applied)
+    
+    assert result == {'method': 'addStickerToSet'}
+    assert client.sent == ['addStickerToSet'] * 2
+
+
+def test_rate_limits_are_retried_for_every_method():
+    error = BotAPIError('addStickerToSet', 'Too Many Requests', error_code=429, retry_after=0.01)
+    client, result = run_call([error], 'addStickerToSet')
+    
+    assert result == {'method': 'addStickerToSet'}
+    assert client.rate_limited == 1
+
+
+def test_rate_limits_without_retry_after_are_retried():
+    error = BotAPIError('addStickerToSet', 'Too Many Requests', error_code=429)
+    client, result = run_call([error], 'addStickerToSet')
+    
+    assert result == {'method': 'addStickerToSet'}
+    assert client.sent == ['addStickerToSet'] * 2
+    assert client.rate_limited == 1
+
+
+def test_permanent_errors_are_raised():
+    client, result = run_call([BotAPIError('getMe', 'Unauthorized', error_code=401)], 'getMe')
+    
+    assert isinstance(result, BotAPIError)
+    assert client.sent == ['getMe']
@@ -0,0 +1,116 @@
+"""Tests for the bot pool's scheduling and bot list parsing."""
+
+import asyncio
+
+import pytest
+
+from sticker_to_emoji.bots import BotPool, load_bot_list, read_bot_list
+
+
+@pytest.fixture(autouse=True)
+def no_env_bots(monkeypatch):
+    # An empty value also keeps load_bot_list from reading a local .env
+    monkeypatch.setenv('TELEGRAM_BOT_TOKENS', '')
+    monkeypatch.delenv('TELEGRAM_USER_IDS', raising=False)
+
+
+def make_pool(*tokens):
+    return BotPool([(token, 1) for token in tokens])
+
+
+def test_picks_the_bot_with_the_most_budget():
+    pool = make_pool('1:a', '2:b', '3:c')
+    pool.accounts[0].api._bucket.pause(30)  # Hit a 429
+    pool.accounts[1].api._bucket.pause(5)
+    
+    assert pool.pick() is pool.accounts[2]
+
+
+def test_busy_bots_wait_for_their_packs():
+    pool = make_pool('1:a', '2:b')
+    pool.accounts[0].active = 2
+    
+    assert pool.pick() is pool.accounts[1]
+
+
+def test_tie_goes_to_the_faster_bot():
+    pool = make_pool('1:a', '2:b')
+    for account, uploads in zip(pool.accounts, (10, 40)):
+        account.packs = 1
+        account.busy_seconds = 20.0
+        account.api.requests['uploadStickerFile'] = uploads
+    
+    assert pool.pick() is pool.accounts[1]
+
+
+def test_lease_spreads_packs_and_counts_them():
+    pool = make_pool('1:a', '2:b')
+    
+    async def run():
+        async with pool.lease() as first:
+            async with pool.lease() as second:
+                assert first is not second
+                assert first.active == second.active == 1
+        return first, second
+    
+    first, second = asyncio.run(run())
+    assert first.active == second.active == 0
+    assert first.packs == second.packs == 1
+
+
+def test_lease_keeps_the_given_bot():
+    pool = make_pool('1:a', '2:b')
+    pool.accounts[1].api._bucket.pause(30)
+    
+    async def run():
+        async with pool.lease(pool.accounts[1]) as account:
+            return account
+    
+    assert asyncio.run(run()) is pool.accounts[1]
+
+
+def test_duplicate_tokens_are_dropped():
+    pool = BotPool([('1:a', 1), ('2:b', 2), ('1:a', 3)])
+    
+    assert [(account.bot_id, account.user_id) for account in pool.accounts] == [('1', 1), ('2', 2)]
+
+
+def test_read_bot_list(tmp_path):
+    path = tmp_path / "bots.txt"
+    path.write_text("# bots\n111:AAA\n\n222:BBB 42  # owner\n", encoding='utf-8')
+    
+    assert read_bot_list(path) == [('111:AAA', None), ('222:BBB', 42)]
+
+
+def test_read_bot_list_rejects_bad_owner(tmp_path):
+    path = tmp_path / "bots.txt"
+    path.write_text("111:AAA\n222:BBB alice\n", encoding='utf-8')
+    
+    with pytest.raises(ValueError, match=r"bots\.txt:2"):
+        read_bot_list(path)
+
+
+def test_owners_default_to_the_main_user(tmp_path, monkeypatch):
+    path = tmp_path / "bots.txt"
+    path.write_text("333:CCC\n444:DDD 7\n", encoding='utf-8')
+    monkeypatch.setenv('TELEGRAM_BOT_TOKENS', '111:AAA,222:BBB')
+    
+    assert load_bot_list(str(path), 99) == [('111:AAA', 99), ('222:BBB', 99), ('333:CCC', 99), ('444:DDD', 7)]
+
+
+def test_owner_ids_from_the_environment(monkeypatch):
+    monkeypatch.setenv('TELEGRAM_BOT_TOKENS', '111:AAA 222:BBB')
+    monkeypatch.setenv('TELEGRAM_USER_IDS', '5,6')
+    assert load_bot_list(None, 99) == [('111:AAA', 5), ('222:BBB', 6)]
+    
+    monkeypatch.setenv('TELEGRAM_USER_IDS', '5')
+    assert load_bot_list(None, 99) == [('111:AAA', 5), ('222:BBB', 5)]
+
+
+@pytest.mark.parametrize('user_ids', ['5,6,7', '5,bob'])
+def test_bad_owner_ids_in_the_environment(monkeypatch, user_ids):
+    monkeypatch.setenv('TELEGRAM_BOT_TOKENS', '111:AAA,222:BBB')
+    monkeypatch.setenv('TELEGRAM_USER_IDS', user_ids)
+    
+    with pytest.raises(ValueError):
+        load_bot_list(None, 99)
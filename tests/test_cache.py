@@ -0,0 +1,87 @@
+"""Tests for the content-addressed conversion cache."""
+
+import os
+
+from sticker_to_emoji.cache import ConversionCache
+
+
+def make_cache(tmp_path, max_bytes=1000):
+    return ConversionCache(tmp_path / "cache", max_bytes=max_bytes)
+
+
+def put(cache, name: str, size: int, mtime: int, document_key: str = None) -> str:
+    key = ConversionCache.content_key(name.encode(), 'params')
+    entry = cache.put(key, b'x' * size, '.webm', 'video', document_key)
+    os.utime(entry.path, (mtime, mtime))
+    return key
+
+
+def test_content_key_depends_on_params():
+    assert ConversionCache.content_key(b'data', 'a') != ConversionCache.content_key(b'data', 'b')
+    assert ConversionCache.content_key(b'data', 'a') == ConversionCache.content_key(b'data', 'a')
+
+
+def test_get_and_document_alias(tmp_path):
+    cache = make_cache(tmp_path)
+    key = put(cache, 'one', 100, 1000, document_key='doc1')
+    
+    assert cache.get(key).sticker_format == 'video'
+    assert cache.get(key).path.read_bytes() == b'x' * 100
+    assert cache.get_document('doc1').key == key
+    assert cache.get_document('missing') is None
+
+
+def test_file_ids_are_remembered(tmp_path):
+    cache = make_cache(tmp_path)
+    key = put(cache, 'one', 100, 1000)
+    cache.set_file_id(key, '111', 'file-a')
+    
+    assert cache.get(key).file_ids == {'111': 'file-a'}
+
+
+def test_put_again_keeps_file_ids(tmp_path):
+    cache = make_cache(tmp_path)
+    key = put(cache, 'one', 100, 1000)
+    cache.set_file_id(key, '111', 'file-a')
+    entry = cache.put(key, b'x' * 100, '.webm', 'video', 'doc1')
+    
+    assert entry.file_ids == {'111': 'file-a'}
+    assert cache.get(key).file_ids == {'111': 'file-a'}
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = make_cache(tmp_path, max_bytes=1000)
+    old = put(cache, 'old', 400, 1000)
+    used = put(cache, 'used', 400, 2000)
+    cache.get(old)  # Touch: now the most recently used
+    put(cache, 'new', 400, 3000)
+    
+    assert cache.get(used) is None
+    assert cache.get(old) is not None
+    assert cache._total_bytes <= 1000
+
+
+def test_eviction_removes_document_aliases(tmp_path):
+    cache = make_cache(tmp_path, max_bytes=1000)
+    old = put(cache, 'old', 600, 1000, document_key='doc-old')
+    cache.link_document('doc-old-2', old)
+    put(cache, 'new', 600, 2000, document_key='doc-new')
+    
+    assert cache.get(old) is None
+    assert sorted(path.name for path in cache.documents_dir.iterdir()) == ['doc-new']
+
+
+def test_dangling_alias_is_dropped_on_lookup(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.documents_dir.mkdir(parents=True)
+    (cache.documents_dir / 'doc').write_text('0' * 64)
+    
+    assert cache.get_document('doc') is None
+    assert not (cache.documents_dir / 'doc').exists()
+
+
+def test_link_document_needs_an_entry(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.link_document('doc', '0' * 64)
+    
+    assert not (cache.documents_dir / 'doc').exists()
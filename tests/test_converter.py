@@ -0,0 +1,355 @@
+"""Tests for filling and syncing emoji sets through a stub Bot API."""
+
+import argparse
+import asyncio
+from collections import defaultdict
+from types import SimpleNamespace
+
+import aiohttp
+import pytest
+from telethon import errors
+
+from sticker_to_emoji.batch import BatchJournal, run_batch
+from sticker_to_emoji.botapi import BotAPIError
+from sticker_to_emoji.converter import MAX_EMOJI_PER_SET, StickerToEmojiConverter
+from sticker_to_emoji.engine import ConversionResult
+from sticker_to_emoji.sync import SyncState
+
+PACK = 'cats_by_test_bot'
+
+
+class FakeBotAPI:
+    """Keeps emoji sets in memory and answers Bot API calls about them.
+    
+    `failures` maps a method to a function of its params that returns an
+    exception to raise, or None. An exception raised with `applied=True`
+    is raised after the call took effect, like a lost response.
+    """
+    
+    def __init__(self):
+        self.sets = {}
+        self.calls = []
+        self.failures = {}
+        self.requests = defaultdict(int)  # Read by the bot pool
+    
+    def add_set(self, name: str, count: int):
+        self.sets[name] = [self.set_sticker(f"old-{i}") for i in range(count)]
+    
+    @staticmethod
+    def set_sticker(file_id: str) -> dict:
+        return {'file_id': f"set-{file_id}", 'file_unique_id': f"u-{file_id}"}
+    
+    def wait_time(self) -> float:
+        return 0.0
+    
+    def uids(self, name: str = PACK) -> list:
+        return [sticker['file_unique_id'] for sticker in self.sets[name]]
+    
+    async def call(self, session, method, params=None, files=None, applied=None):
+        params = {**(params or {}), **(files or {})}
+        self.calls.append(method)
+        failure = self.failures.get(method)
+        error = failure(params) if failure else None
+        if error is not None and not getattr(error, 'applied', False):
+            raise error
+        result = getattr(self, method)(**params)
+        if error is not None:
+            raise error
+        return result
+    
+    def uploadStickerFile(self, user_id, sticker_format, sticker):
+        _, data, _ = sticker
+        return {'file_id': f"file-{data.decode()}"}
+    
+    def getStickerSet(self, name):
+        if name not in self.sets:
+            raise BotAPIError('getStickerSet', 'Bad Request: STICKERSET_INVALID', error_code=400)
+        return {'name': name, 'stickers': list(self.sets[name])}
+    
+    def createNewStickerSet(self, user_id, name, title, stickers, sticker_type):
+        assert name not in self.sets and 0 < len(stickers) <= 50
+        self.sets[name] = [self.set_sticker(sticker['sticker']) for sticker in stickers]
+        return True
+    
+    def addStickerToSet(self, user_id, name, sticker):
+        if len(self.sets[name]) >= MAX_EMOJI_PER_SET:
+            raise BotAPIError('addStickerToSet', 'Bad Request: STICKERS_TOO_MUCH', error_code=400)
+        self.sets[name].append(self.set_sticker(sticker['sticker']))
+        return True
+    
+    def deleteStickerFromSet(self, sticker):
+        for stickers in self.sets.values():
+            stickers[:] = [other for other in stickers if other['file_id'] != sticker]
+        return True
+    
+    def setStickerPositionInSet(self, sticker, position):
+        for stickers in self.sets.values():
+            for other in stickers:
+                if other['file_id'] == sticker:
+                    stickers.remove(other)
+                    stickers.insert(position, other)
+        return True
+
+
+def lost_response() -> Exception:
+    """A network error on a call that went through."""
+    error = aiohttp.ClientError()
+    error.applied = True
+    return error
+
+
+@pytest.fixture
+def api():
+    return FakeBotAPI()
+
+
+@pytest.fixture
+def converter(api):
+    converter = StickerToEmojiConverter(1, 'hash', '123:abc', 42)
+    converter.account.api = api
+    converter.use_bot(converter.account)
+    converter.bot_username = 'test_bot'
+    return converter
+
+
+def stickers(*ids) -> list:
+    """(document, InputSticker) pairs, as the pipeline's ready queue yields them."""
+    return [
+        (SimpleNamespace(id=document_id), {'sticker': f"file-{document_id}", 'emoji_list': ['😀'], 'format': 'static'})
+        for document_id in ids
+    ]
+
+
+def fill(converter, items: list, exists: bool = False, state: SyncState = None) -> list:
+    """Run fill_sticker_set over `items`; returns the document ids that made it into the set."""
+    async def run():
+        ready = asyncio.Queue()
+        for item in items:
+            ready.put_nowait(item)
+        ready.put_nowait(None)
+        return await converter.fill_sticker_set(ready, PACK, 'Cats', None, exists=exists, state=state)
+    
+    return [document.id for document, _ in asyncio.run(run())]
+
+
+def test_small_pack_is_created_in_one_call(converter, api):
+    assert fill(converter, stickers(1, 2, 3)) == [1, 2, 3]
+    
+    assert api.calls == ['createNewStickerSet']
+    assert api.uids() == ['u-file-1', 'u-file-2', 'u-file-3']
+
+
+def test_create_then_add(converter, api):
+    ids = list(range(1, 121))
+    
+    assert fill(converter, stickers(*ids)) == ids
+    assert api.calls.count('createNewStickerSet') == 1
+    assert api.calls.count('addStickerToSet') == 70
+    # The size after creating is known, so adds don't re-read the set
+    assert api.calls.count('getStickerSet') == 0
+    assert api.uids() == [f"u-file-{i}" for i in ids]
+
+
+def test_failed_add_in_a_chunk(converter, api):
+    api.failures['addStickerToSet'] = lambda params: (
+        BotAPIError('addStickerToSet', 'Bad Request', error_code=400) if params['sticker']['sticker'] == 'file-53' else None
+    )
+    ids = list(range(1, 61))
+    
+    assert fill(converter, stickers(*ids)) == [i for i in ids if i != 53]
+    assert api.uids() == [f"u-file-{i}" for i in ids if i != 53]
+    # The set is counted again once, after the failure
+    assert api.calls.count('getStickerSet') == 1
+
+
+def test_lost_add_response_is_not_added_twice(converter, api):
+    api.failures['addStickerToSet'] = lambda params: lost_response() if params['sticker']['sticker'] == 'file-2' else None
+    api.add_set(PACK, 1)
+    
+    assert sorted(fill(converter, stickers(1, 2, 3), exists=True)) == [1, 2, 3]
+    assert api.uids() == ['u-old-0', 'u-file-1', 'u-file-2', 'u-file-3']
+
+
+def test_stops_at_the_set_size_limit(converter, api):
+    api.add_set(PACK, MAX_EMOJI_PER_SET - 2)
+    
+    assert fill(converter, stickers(1, 2, 3, 4), exists=True) == [1, 2]
+    assert len(api.sets[PACK]) == MAX_EMOJI_PER_SET
+    assert api.calls.count('addStickerToSet') == 2
+
+
+def test_nothing_uploaded(converter, api):
+    with pytest.raises(ValueError):
+        fill(converter, [])
+    assert PACK not in api.sets
+
+
+def recorded(state: SyncState) -> dict:
+    """file_unique_id -> source document id."""
+    return {uid: entry['document_id'] for uid, entry in state.stickers.items()}
+
+
+def test_state_records_created_and_added_emoji(converter, api, tmp_path):
+    state = SyncState(tmp_path / "state.json")
+    fill(converter, stickers(*range(1, 61)), state=state)
+    
+    assert recorded(state) == {f"u-file-{i}": i for i in range(1, 61)}
+    assert recorded(SyncState.load(tmp_path / "state.json")) == recorded(state)
+    # One read per chunk
+    assert api.calls.count('getStickerSet') == 2
+
+
+def test_state_matches_emoji_after_a_lost_add_response(converter, api, tmp_path):
+    api.failures['addStickerToSet'] = lambda params: lost_response() if params['sticker']['sticker'] == 'file-2' else None
+    api.add_set(PACK, 1)
+    state = SyncState(tmp_path / "state.json")
+    fill(converter, stickers(1, 2, 3), exists=True, state=state)
+    
+    assert recorded(state) == {'u-file-1': 1, 'u-file-2': 2, 'u-file-3': 3}
+
+
+def test_state_skips_a_failed_add(converter, api, tmp_path):
+    api.failures['addStickerToSet'] = lambda params: (
+        BotAPIError('addStickerToSet', 'Bad Request', error_code=400) if params['sticker']['sticker'] == 'file-2' else None
+    )
+    api.add_set(PACK, 1)
+    state = SyncState(tmp_path / "state.json")
+    fill(converter, stickers(1, 2, 3), exists=True, state=state)
+    
+    assert recorded(state) == {'u-file-1': 1, 'u-file-3': 3}
+
+
+def documents(*ids) -> list:
+    return [SimpleNamespace(id=document_id, attributes=[], mime_type='image/webp') for document_id in ids]
+
+
+def sticker_pack(*ids):
+    return SimpleNamespace(set=SimpleNamespace(title='Cats'), documents=documents(*ids))
+
+
+@pytest.fixture
+def converted(converter):
+    """Serve every sticker as already converted, so the pipeline only uploads."""
+    converter.find_cached_document = lambda sticker, filename: ConversionResult(
+        filename, str(sticker.id).encode(), 'static', size_bytes=1
+    )
+    return converter
+
+
+def create(converter, ids, state_dir):
+    return asyncio.run(converter.convert_and_create_emoji_pack(
+        sticker_pack(*ids), 'cats', None, None, limit=MAX_EMOJI_PER_SET, state_dir=state_dir
+    ))
+
+
+def sync(converter, ids, state_dir, limit: int = MAX_EMOJI_PER_SET):
+    return asyncio.run(converter.sync_emoji_pack(sticker_pack(*ids), 'cats', None, None, state_dir, limit=limit))
+
+
+def test_first_sync_after_create_only_uploads_changes(converted, api, tmp_path):
+    create(converted, range(1, 71), tmp_path)
+    api.calls.clear()
+    
+    ids = [i for i in range(1, 76) if i != 30]
+    sync(converted, ids, tmp_path)
+    
+    assert api.calls.count('uploadStickerFile') == 5
+    assert api.calls.count('deleteStickerFromSet') == 1
+    assert api.uids() == [f"u-file-{i}" for i in ids]
+    assert recorded(SyncState.load(tmp_path / f"{PACK}.json")) == {f"u-file-{i}": i for i in ids}
+
+
+def test_sync_deletes_first_when_adding_first_would_overflow(converted, api, tmp_path):
+    api.add_set(PACK, 150)  # Made by hand, or by an older version: nothing is tracked
+    ids = list(range(1, 101))
+    sync(converted, ids, tmp_path)
+    
+    assert api.uids() == [f"u-file-{i}" for i in ids]
+    assert api.calls.count('addStickerToSet') == 100
+
+
+def test_sync_replaces_an_untracked_set_that_fits(converted, api, tmp_path):
+    api.add_set(PACK, 3)
+    sync(converted, [1, 2], tmp_path)
+    
+    # Added before the old emoji go, so the set is never empty
+    assert api.calls.index('deleteStickerFromSet') > api.calls.index('addStickerToSet')
+    assert api.uids() == ['u-file-1', 'u-file-2']
+
+
+def test_sync_after_a_lost_add_response(converted, api, tmp_path):
+    create(converted, [1, 2], tmp_path)
+    api.failures['addStickerToSet'] = lambda params: lost_response() if params['sticker']['sticker'] == 'file-3' else None
+    sync(converted, [1, 2, 3, 4], tmp_path)
+    api.failures.clear()
+    api.calls.clear()
+    
+    sync(converted, [1, 2, 3, 4], tmp_path)
+    
+    assert api.uids() == ['u-file-1', 'u-file-2', 'u-file-3', 'u-file-4']
+    assert 'uploadStickerFile' not in api.calls
+    assert 'deleteStickerFromSet' not in api.calls
+
+
+def batch_args(tmp_path) -> argparse.Namespace:
+    return argparse.Namespace(
+        retry_failed=False, parallel=1, max_flood_wait=60, output=str(tmp_path / "out"), limit=MAX_EMOJI_PER_SET,
+        sync=False, save_local=False, download_concurrency=4, convert_concurrency=4, workers=1,
+        upload_concurrency=4, cache_dir=str(tmp_path / "cache")
+    )
+
+
+def test_deferred_pack_resumes_without_losing_emoji(converted, api, tmp_path):
+    ids = list(range(1, MAX_EMOJI_PER_SET + 1))
+    
+    async def get_sticker_pack(pack_name):
+        return sticker_pack(*ids)
+    
+    restore = converted.find_cached_document
+    flood = {151}
+    
+    def find_cached_document(sticker, filename):
+        if sticker.id in flood:
+            flood.discard(sticker.id)
+            raise errors.FloodWaitError(request=None, capture=900)
+        return restore(sticker, filename)
+    
+    converted.get_sticker_pack = get_sticker_pack
+    converted.find_cached_document = find_cached_document
+    args = batch_args(tmp_path)
+    journal = BatchJournal(tmp_path / "journal.sqlite3")
+    journal.add([('Cats', 'cats')])
+    
+    assert asyncio.run(run_batch(converted, None, journal, args)) == 0
+    assert journal.deferred('Cats')
+    before = len(api.sets[PACK])
+    assert 0 < before <= 150
+    api.calls.clear()
+    
+    assert asyncio.run(run_batch(converted, None, journal, args)) == 0
+    assert journal.counts() == {'done': 1}
+    assert api.uids() == [f"u-file-{i}" for i in ids]
+    assert api.calls.count('uploadStickerFile') == MAX_EMOJI_PER_SET - before
+    assert 'deleteStickerFromSet' not in api.calls
+
+
+def test_pack_left_running_by_a_crash_resumes(converted, api, tmp_path):
+    ids = list(range(1, MAX_EMOJI_PER_SET + 1))
+    
+    async def get_sticker_pack(pack_name):
+        return sticker_pack(*ids)
+    
+    converted.get_sticker_pack = get_sticker_pack
+    args = batch_args(tmp_path)
+    journal = BatchJournal(tmp_path / "journal.sqlite3")
+    journal.add([('Cats', 'cats')])
+    # The last run crashed after creating the set from its first chunk
+    journal.start('Cats')
+    create(converted, ids[:50], tmp_path / "cache" / "sync")
+    api.calls.clear()
+    
+    assert asyncio.run(run_batch(converted, None, journal, args)) == 0
+    assert journal.counts() == {'done': 1}
+    assert 'createNewStickerSet' not in api.calls
+    assert api.uids() == [f"u-file-{i}" for i in ids]
+    assert api.calls.count('uploadStickerFile') == MAX_EMOJI_PER_SET - 50
@@ -0,0 +1,42 @@
+"""Tests for the adaptive encoder settings."""
+
+from sticker_to_emoji.encoding import MAX_FPS, MIN_FPS, AnimationComplexity, next_plan, plan_encode
+
+SIMPLE = AnimationComplexity(layers=3)
+BUSY = AnimationComplexity(layers=50)
+
+
+def test_output_never_exceeds_max_fps():
+    for fps in (24, 25, 29.97, 30, 48, 50, 60, 120):
+        for complexity in (SIMPLE, BUSY):
+            for motion in (None, 0.0, 1.0):
+                plan = plan_encode(complexity, fps, int(fps * 3), motion)
+                assert plan.output_fps(fps) <= MAX_FPS
+                assert plan.output_fps(fps) >= MIN_FPS
+
+
+def test_simple_60_fps_is_halved():
+    assert plan_encode(SIMPLE, 60, 180, motion=1.0).frame_step == 2
+
+
+def test_busy_or_still_60_fps_is_decimated_further():
+    assert plan_encode(BUSY, 60, 180).output_fps(60) == 15
+    assert plan_encode(SIMPLE, 60, 180, motion=0.0).output_fps(60) == 15
+
+
+def test_30_fps_is_kept():
+    assert plan_encode(BUSY, 30, 90, motion=0.0).frame_step == 1
+
+
+def test_simple_animations_get_lower_crf():
+    assert plan_encode(SIMPLE, 30, 90).crf < plan_encode(BUSY, 30, 90).crf
+
+
+def test_next_plan_tightens_settings():
+    plan = plan_encode(SIMPLE, 30, 90)
+    tighter = next_plan(plan, 200_000, 30)
+    
+    assert tighter.bitrate_k < plan.bitrate_k
+    assert tighter.crf > plan.crf
+    assert tighter.output_fps(30) == MIN_FPS
+    assert next_plan(tighter, 200_000, 30).output_fps(30) == MIN_FPS
@@ -0,0 +1,59 @@
+"""Tests for repeated-frame merging and motion probing."""
+
+from sticker_to_emoji.frames import FrameTimeline, build_timeline, frame_delta, probe_motion
+
+
+def frame(value: int, size: int = 2) -> bytes:
+    return bytes([value]) * (size * size * 4)
+
+
+def test_merges_runs_of_identical_frames():
+    timeline = build_timeline([frame(1), frame(1), frame(2), frame(3), frame(3), frame(3), frame(4)])
+    
+    assert timeline.frames == [frame(1), frame(2), frame(3), frame(4)]
+    assert timeline.starts == [0, 2, 3, 6]
+    assert timeline.length == 7
+    assert timeline.merged == 3
+
+
+def test_still_ending_repeats_the_last_frame():
+    timeline = build_timeline([frame(1), frame(2), frame(2), frame(2)])
+    
+    assert timeline.starts == [0, 1, 3]
+    assert timeline.frames[-1] == frame(2)
+
+
+def test_reused_buffer_is_copied():
+    buffer = bytearray(frame(1))
+    
+    def frames():
+        for value in (1, 2, 3):
+            buffer[:] = frame(value)
+            yield memoryview(buffer)
+    
+    assert build_timeline(frames()).frames == [frame(1), frame(2), frame(3)]
+
+
+def test_pts_filter():
+    assert FrameTimeline(frames=[b'a', b'b'], starts=[0, 1], length=2).pts_filter() is None
+    
+    timeline = FrameTimeline(frames=[b'a', b'b', b'c'], starts=[0, 3, 4], length=5)
+    assert timeline.pts_filter() == "setpts='N+gte(N,1)*2'"
+    
+    timeline = FrameTimeline(frames=[b'a', b'b', b'c'], starts=[0, 2, 5], length=6)
+    assert timeline.pts_filter() == "setpts='N+gte(N,1)*1+gte(N,2)*2'"
+
+
+def test_frame_delta():
+    assert frame_delta(frame(0), frame(0), 2) == 0
+    assert frame_delta(frame(0), frame(255), 2) == 1
+
+
+def test_probe_motion_takes_the_largest_change():
+    frames = [frame(0)] * 10 + [frame(51)] + [frame(51)] * 9
+    
+    def render(numbers):
+        return [frames[n] for n in numbers]
+    
+    assert abs(probe_motion(render, len(frames), 2, probes=20) - 0.2) < 1e-9
+    assert probe_motion(render, 1, 2) == 0.0
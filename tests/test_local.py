@@ -0,0 +1,134 @@
+"""Tests for offline conversion of sticker files on disk."""
+
+import asyncio
+import io
+import json
+import tarfile
+import zipfile
+
+import pytest
+from PIL import Image
+
+from sticker_to_emoji.engine import ConversionEngine
+from sticker_to_emoji.local import MANIFEST_NAME, convert_local, iter_sticker_files, pick_emoji, read_manifest
+
+
+def image_bytes(format: str, colour: tuple, size=(200, 150)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new('RGBA', size, colour).save(buffer, format=format)
+    return buffer.getvalue()
+
+
+# Stickers as they sit in every source, plus files that should be skipped
+FILES = {
+    'cat.webp': image_bytes('WEBP', (255, 0, 0, 255)),
+    'dogs/dog.png': image_bytes('PNG', (0, 255, 0, 128), size=(512, 512)),
+    'notes.txt': b'not a sticker',
+    '.hidden.png': image_bytes('PNG', (0, 0, 255, 255)),
+}
+STICKERS = ['cat.webp', 'dogs/dog.png']
+
+
+def make_dir(tmp_path):
+    source = tmp_path / "stickers"
+    for name, data in FILES.items():
+        path = source / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    return source
+
+
+def make_zip(tmp_path):
+    source = tmp_path / "stickers.zip"
+    with zipfile.ZipFile(source, 'w') as archive:
+        archive.writestr('dogs/', b'')
+        for name, data in FILES.items():
+            archive.writestr(name, data)
+    return source
+
+
+def make_tar(tmp_path):
+    """A tar.gz made like `tar -C stickers -czf stickers.tar.gz .`, so names start with ./"""
+    source = tmp_path / "stickers.tar.gz"
+    with tarfile.open(source, 'w:gz') as archive:
+        for name, data in FILES.items():
+            info = tarfile.TarInfo(f"./{name}")
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return source
+
+
+SOURCES = [make_dir, make_zip, make_tar]
+
+
+@pytest.mark.parametrize('make_source', SOURCES)
+def test_iter_sticker_files(tmp_path, make_source):
+    files = list(iter_sticker_files(make_source(tmp_path)))
+    
+    assert [name for name, _ in files] == STICKERS
+    assert [data for _, data in files] == [FILES[name] for name in STICKERS]
+
+
+def test_iter_rejects_other_files(tmp_path):
+    path = tmp_path / "stickers.txt"
+    path.write_text("cat.webp\n", encoding='utf-8')
+    
+    with pytest.raises(ValueError):
+        list(iter_sticker_files(path))
+
+
+def test_pick_emoji():
+    emoji_map = {'dogs/dog.png': '🐶', 'cat.webp': '🐱', 'fox': '🦊'}
+    
+    assert pick_emoji('dogs/dog.png', emoji_map, '😀') == '🐶'
+    assert pick_emoji('more/cat.webp', emoji_map, '😀') == '🐱'
+    assert pick_emoji('fox.tgs', emoji_map, '😀') == '🦊'
+    assert pick_emoji('owl.png', emoji_map, '😀') == '😀'
+
+
+def run_convert(source, output_dir, **kwargs) -> dict:
+    async def run():
+        with ConversionEngine(1) as engine:
+            return await convert_local(source, output_dir, engine, **kwargs)
+    
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize('make_source', SOURCES)
+def test_convert_and_read_manifest(tmp_path, make_source):
+    output_dir = tmp_path / "out"
+    manifest = run_convert(make_source(tmp_path), output_dir, emoji_map={'dog': '🐶'}, default_emoji='🐱')
+    
+    assert [entry['source'] for entry in manifest['stickers']] == STICKERS
+    assert [entry['emoji'] for entry in manifest['stickers']] == ['🐱', '🐶']
+    assert manifest['failed'] == []
+    assert json.loads((output_dir / MANIFEST_NAME).read_text(encoding='utf-8')) == manifest
+    
+    emoji_files = read_manifest(output_dir / MANIFEST_NAME)
+    assert [(result.filename, emoji) for result, emoji in emoji_files] == [
+        ('emoji_001_🐱.png', '🐱'), ('emoji_002_🐶.png', '🐶')
+    ]
+    for result, _ in emoji_files:
+        assert result.sticker_format == 'static'
+        assert result.data == (output_dir / result.filename).read_bytes()
+        with Image.open(io.BytesIO(result.data)) as img:
+            assert img.size == (100, 100)
+
+
+def test_convert_limit_and_failures(tmp_path):
+    source = make_dir(tmp_path)
+    (source / "broken.png").write_bytes(b'not a png')
+    manifest = run_convert(source, tmp_path / "out", limit=2)
+    
+    # broken.png sorts first, fails, and still counts towards the limit
+    assert [entry['source'] for entry in manifest['stickers']] == ['cat.webp']
+    assert [entry['source'] for entry in manifest['failed']] == ['broken.png']
+    assert len(read_manifest(tmp_path / "out" / MANIFEST_NAME)) == 1
+
+
+def test_read_manifest_rejects_other_versions(tmp_path):
+    path = tmp_path / MANIFEST_NAME
+    path.write_text(json.dumps({'version': 99, 'stickers': []}), encoding='utf-8')
+    
+    with pytest.raises(ValueError):
+        read_manifest(path)
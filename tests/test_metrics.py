@@ -0,0 +1,69 @@
+"""Tests for stage spans, counters and the Prometheus output."""
+
+import json
+
+import pytest
+
+from sticker_to_emoji.metrics import Metrics, format_labels
+
+
+def test_format_labels_escapes_values():
+    assert format_labels([]) == ""
+    assert format_labels([('stage', 'upload')]) == '{stage="upload"}'
+    assert format_labels([('pack', 'a"b\\c\n')]) == '{pack="a\\"b\\\\c\\n"}'
+
+
+def test_disabled_metrics_record_nothing():
+    metrics = Metrics()
+    with metrics.span('download', bytes=10):
+        pass
+    metrics.count('api_retries_total', method='getMe')
+    
+    assert not metrics.enabled
+    assert 'stage="download"' not in metrics.prometheus_text()
+
+
+def test_spans_are_written_as_json_lines(tmp_path):
+    path = tmp_path / "events.jsonl"
+    metrics = Metrics(str(path)).bind(pack='Opa4958')
+    with metrics.span('download', sticker=3) as span:
+        span['bytes'] = 100
+    with pytest.raises(RuntimeError):
+        with metrics.span('convert', sticker=3):
+            raise RuntimeError
+    with metrics.span('upload', sticker=3) as span:
+        span['ok'] = False
+    metrics.close()
+    
+    events = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+    assert [(event['stage'], event['ok']) for event in events] == [('download', True), ('convert', False), ('upload', False)]
+    assert all(event['pack'] == 'Opa4958' and event['sticker'] == 3 for event in events)
+    assert events[0]['bytes'] == 100
+
+
+def test_prometheus_totals(tmp_path):
+    path = tmp_path / "metrics.prom"
+    metrics = Metrics(prometheus_path=str(path))
+    metrics.record('upload', 0.5, bytes=1000)
+    metrics.record('upload', 0.25, ok=False, cache='file_id')
+    metrics.count('api_requests_total', bot='123', method='getMe')
+    metrics.close()
+    
+    text = path.read_text(encoding='utf-8')
+    assert 'sticker_to_emoji_stage_seconds_sum{stage="upload"} 0.750000' in text
+    assert 'sticker_to_emoji_stage_seconds_count{stage="upload"} 2' in text
+    assert 'sticker_to_emoji_stage_failures_total{stage="upload"} 1' in text
+    assert 'sticker_to_emoji_bytes_total{stage="upload"} 1000' in text
+    assert 'sticker_to_emoji_cache_hits_total{cache="file_id"} 1' in text
+    assert 'sticker_to_emoji_api_requests_total{bot="123",method="getMe"} 1' in text
+
+
+def test_bound_metrics_share_totals():
+    metrics = Metrics()
+    events = []
+    metrics.listeners.append(events.append)
+    bound = metrics.bind(bot='123')
+    bound.record('upload', 1.0)
+    
+    assert events[0]['bot'] == '123'
+    assert 'sticker_to_emoji_stage_seconds_count{stage="upload"} 1' in metrics.prometheus_text()
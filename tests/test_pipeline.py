@@ -0,0 +1,141 @@
+"""Tests for the download/convert/upload pipeline, with stub stages."""
+
+import asyncio
+from types import SimpleNamespace
+
+from sticker_to_emoji.engine import ConversionResult
+from sticker_to_emoji.metrics import Metrics
+from sticker_to_emoji.pipeline import PipelineConfig, StickerPipeline
+
+
+class StubConverter:
+    """Stands in for StickerToEmojiConverter; stickers are documents with an id.
+    
+    Stage calls sleep a little, longer for lower ids, so later stickers
+    overtake earlier ones. Ids in the `fail_*` sets fail at that stage.
+    """
+    
+    def __init__(self, fail_download=(), fail_convert=(), fail_upload=()):
+        self.metrics = Metrics()
+        self.downloads = SimpleNamespace(download=self.download)
+        self.engine = SimpleNamespace(convert=self.convert)
+        self.fail_download = set(fail_download)
+        self.fail_convert = set(fail_convert)
+        self.fail_upload = set(fail_upload)
+        self.downloaded = []
+        self.uploaded = []
+    
+    async def pause(self, document_id: int):
+        await asyncio.sleep(0.001 * (10 - document_id % 10))
+    
+    def get_sticker_emoji(self, sticker):
+        return '😀'
+    
+    def get_emoji_filename(self, sticker, index):
+        return f"emoji_{index:03d}.png"
+    
+    def find_cached_document(self, sticker, filename):
+        return None
+    
+    def find_cached_content(self, sticker, file_bytes, filename):
+        return None
+    
+    def store_converted(self, sticker, file_bytes, result):
+        pass
+    
+    def record_render_stages(self, result, **fields):
+        pass
+    
+    def make_conversion_job(self, sticker, file_bytes, filename):
+        return SimpleNamespace(document_id=sticker.id, data=file_bytes, filename=filename)
+    
+    async def download(self, sticker):
+        await self.pause(sticker.id)
+        self.downloaded.append(sticker.id)
+        if sticker.id in self.fail_download:
+            raise OSError("connection reset")
+        return str(sticker.id).encode()
+    
+    async def convert(self, job):
+        await self.pause(job.document_id)
+        if job.document_id in self.fail_convert:
+            return ConversionResult(job.filename, error="too big")
+        return ConversionResult(job.filename, job.data, 'static', size_bytes=len(job.data))
+    
+    async def upload_sticker_file(self, result, emoji, session):
+        document_id = int(result.data)
+        await self.pause(document_id)
+        if document_id in self.fail_upload:
+            raise ValueError("Bad Request")
+        self.uploaded.append(document_id)
+        return {'sticker': f"file-{document_id}", 'emoji_list': [emoji], 'format': 'static'}
+
+
+def documents(count: int) -> list:
+    return [SimpleNamespace(id=document_id) for document_id in range(1, count + 1)]
+
+
+def run_pipeline(converter: StubConverter, count: int, limit: int = 50):
+    """Run a pipeline over `count` stickers; returns (result, ready pairs in the order they came)."""
+    config = PipelineConfig(download_concurrency=3, convert_concurrency=3, upload_concurrency=3, queue_size=2)
+    
+    async def run():
+        pipeline = StickerPipeline(converter, None, limit=limit, config=config)
+        result = await pipeline.run(documents(count))
+        ready = []
+        while (item := pipeline.ready.get_nowait()) is not None:
+            ready.append(item)
+        return result, ready
+    
+    return asyncio.run(run())
+
+
+def ids(pairs) -> list:
+    return [document.id for document, _ in pairs]
+
+
+def test_results_and_ready_queue_keep_pack_order():
+    converter = StubConverter()
+    result, ready = run_pipeline(converter, 8)
+    
+    assert converter.uploaded != sorted(converter.uploaded)  # Stages did finish out of order
+    assert [document.id for document in result.documents] == list(range(1, 9))
+    assert [sticker['sticker'] for sticker in result.stickers] == [f"file-{i}" for i in range(1, 9)]
+    assert [converted.filename for converted, _ in result.converted] == [f"emoji_{i:03d}.png" for i in range(1, 9)]
+    assert ids(ready) == list(range(1, 9))
+
+
+def test_limit_stops_feeding_stickers():
+    converter = StubConverter()
+    result, ready = run_pipeline(converter, 10, limit=4)
+    
+    assert ids(ready) == [1, 2, 3, 4]
+    assert len(result.stickers) == 4
+    assert sorted(converter.downloaded) == [1, 2, 3, 4]
+
+
+def test_failed_stickers_free_their_slot():
+    converter = StubConverter(fail_download={2}, fail_convert={3}, fail_upload={4})
+    result, ready = run_pipeline(converter, 10, limit=4)
+    
+    assert ids(ready) == [1, 5, 6, 7]
+    assert len(result.stickers) == 4
+    assert result.skipped == 1
+    assert result.failed == 2
+
+
+def test_failures_leave_no_gap_in_the_ready_queue():
+    converter = StubConverter(fail_upload={1, 5})
+    result, ready = run_pipeline(converter, 6)
+    
+    assert ids(ready) == [2, 3, 4, 6]
+    assert [document.id for document in result.documents] == [2, 3, 4, 6]
+    assert result.failed == 2
+
+
+def test_running_out_of_stickers_ends_below_the_limit():
+    converter = StubConverter(fail_upload={2})
+    result, ready = run_pipeline(converter, 3, limit=3)
+    
+    assert ids(ready) == [1, 3]
+    assert result.failed == 1
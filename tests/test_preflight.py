@@ -0,0 +1,110 @@
+"""Tests for TGS preflight checks and the cost estimate."""
+
+import gzip
+import json
+
+import pytest
+
+from sticker_to_emoji import preflight
+from sticker_to_emoji.preflight import check_tgs, decompress_tgs, estimate_ms, render_score
+
+
+def shape_layer(shapes: int = 1) -> dict:
+    return {'ty': 4, 'shapes': [{'ty': 'el'} for _ in range(shapes)]}
+
+
+def lottie(layers: list, assets: list = (), frames: int = 60, fps: int = 30) -> dict:
+    return {'fr': fps, 'ip': 0, 'op': frames, 'w': 512, 'h': 512, 'layers': layers, 'assets': list(assets)}
+
+
+def tgs(document: dict) -> bytes:
+    return gzip.compress(json.dumps(document).encode('utf-8'))
+
+
+def test_decompress_cap():
+    data = gzip.compress(b' ' * 2000)
+    
+    assert decompress_tgs(data, limit=2000) == b' ' * 2000
+    with pytest.raises(ValueError):
+        decompress_tgs(data, limit=1999)
+
+
+def test_gzip_bomb_is_refused():
+    bomb = gzip.compress(b'{"layers": [' + b' ' * (preflight.MAX_JSON_BYTES + 1) + b']}')
+    check = check_tgs(bomb)
+    
+    assert check.action == 'refuse'
+    assert 'MB' in check.reason
+
+
+def test_unreadable_stickers_are_refused():
+    assert check_tgs(b'not gzip').action == 'refuse'
+    assert check_tgs(gzip.compress(b'{broken')).action == 'refuse'
+    assert check_tgs(gzip.compress(b'[1, 2]')).action == 'refuse'
+
+
+def test_simple_sticker_is_animated():
+    check = check_tgs(tgs(lottie([shape_layer(2)], frames=60, fps=30)))
+    
+    assert check.action == 'animate'
+    assert check.frames == 60
+    assert check.render_score == 2  # One layer, two shapes at half weight
+    assert check.estimated_ms == estimate_ms(2, 60)
+
+
+def test_frames_capped_at_max_duration():
+    check = check_tgs(tgs(lottie([shape_layer()], frames=600, fps=60)))
+    
+    assert check.frames == 60 * preflight.MAX_DURATION
+
+
+def test_precomps_counted_every_use():
+    asset = {'id': 'comp', 'layers': [shape_layer(4)]}
+    layers = [{'ty': 0, 'refId': 'comp'} for _ in range(3)]
+    
+    # Each precomp layer scores 1, plus 1 + 4 * 0.5 for what it renders
+    assert render_score(lottie(layers, [asset])) == 3 * (1 + 3)
+
+
+def test_repeater_multiplies_shapes_above_it():
+    layer = {'ty': 4, 'shapes': [{'ty': 'el'}, {'ty': 'el'}, {'ty': 'rp', 'c': {'a': 0, 'k': 10}}]}
+    
+    assert render_score(lottie([layer])) == 1 + 20 * 0.5
+
+
+def test_precomp_cycle_is_refused():
+    assets = [{'id': 'a', 'layers': [{'ty': 0, 'refId': 'b'}]}, {'id': 'b', 'layers': [{'ty': 0, 'refId': 'a'}]}]
+    check = check_tgs(tgs(lottie([{'ty': 0, 'refId': 'a'}], assets)))
+    
+    assert check.action == 'refuse'
+    assert 'includes itself' in check.reason
+
+
+def test_huge_images_are_refused():
+    assets = [{'id': 'img', 'p': 'data:', 'w': 10000, 'h': 10000}]
+    check = check_tgs(tgs(lottie([shape_layer()], assets)))
+    
+    assert check.action == 'refuse'
+    assert check.image_pixels == 100_000_000
+
+
+def test_slow_animation_gets_first_frame_only():
+    repeated = {'ty': 4, 'shapes': [{'ty': 'el'}, {'ty': 'rp', 'c': {'a': 0, 'k': 200_000}}]}
+    check = check_tgs(tgs(lottie([repeated], frames=90, fps=30)))
+    
+    assert check.action == 'first_frame'
+    assert check.estimated_ms == estimate_ms(check.render_score, 1)
+    assert check.estimated_ms < estimate_ms(check.render_score, check.frames)
+
+
+def test_still_sticker_gets_first_frame():
+    check = check_tgs(tgs(lottie([shape_layer()], frames=0)))
+    
+    assert check.action == 'first_frame'
+    assert check.reason == "not animated"
+
+
+def test_estimate_grows_with_cost():
+    assert estimate_ms(10, 90) > estimate_ms(10, 30)
+    assert estimate_ms(100, 30) > estimate_ms(10, 30)
+    assert estimate_ms(10, 30, image_pixels=10_000_000) > estimate_ms(10, 30)
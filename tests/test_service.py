@@ -0,0 +1,227 @@
+"""Tests for the HTTP service, run --offline against a stub Bot API."""
+
+import argparse
+import asyncio
+import json
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from PIL import Image
+
+from sticker_to_emoji.converter import MAX_EMOJI_PER_SET, StickerToEmojiConverter, create_session
+from sticker_to_emoji.service import ConverterService, parse_job_request
+
+
+class StubBotAPI:
+    """Answers the Bot API calls that making a pack needs, over HTTP, keeping sets in memory."""
+    
+    def __init__(self):
+        self.sets = {}
+        self.calls = []
+        self.uploads = 0
+    
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        return app
+    
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        self.calls.append(method)
+        if request.content_type == 'multipart/form-data':
+            params = dict(await request.post())
+        else:
+            params = await request.json()
+        
+        if method == 'getMe':
+            return self.ok({'id': 123, 'is_bot': True, 'username': 'test_bot'})
+        if method == 'uploadStickerFile':
+            self.uploads += 1
+            return self.ok({'file_id': f"file-{self.uploads}"})
+        if method == 'getStickerSet':
+            if params['name'] not in self.sets:
+                return self.error(400, 'Bad Request: STICKERSET_INVALID')
+            return self.ok({'name': params['name'], 'stickers': self.sets[params['name']]})
+        if method == 'createNewStickerSet':
+            self.sets[params['name']] = [self.set_sticker(sticker) for sticker in params['stickers']]
+            return self.ok(True)
+        if method == 'addStickerToSet':
+            self.sets[params['name']].append(self.set_sticker(params['sticker']))
+            return self.ok(True)
+        return self.error(404, 'Not Found')
+    
+    @staticmethod
+    def set_sticker(sticker: dict) -> dict:
+        return {'file_id': f"set-{sticker['sticker']}", 'file_unique_id': f"u-{sticker['sticker']}"}
+    
+    @staticmethod
+    def ok(result) -> web.Response:
+        return web.json_response({'ok': True, 'result': result})
+    
+    @staticmethod
+    def error(code: int, description: str) -> web.Response:
+        return web.json_response({'ok': False, 'error_code': code, 'description': description})
+
+
+def make_stickers(tmp_path, count: int = 3):
+    source = tmp_path / "stickers"
+    source.mkdir()
+    for i in range(count):
+        Image.new('RGBA', (200, 200), (i * 80, 0, 0, 255)).save(source / f"sticker_{i}.png")
+    return source
+
+
+def run_service(tmp_path, test):
+    """Run `test(client, service, bot_api)` and return what it returns.
+    
+    The service's worker isn't running, so jobs stay queued until the test
+    starts it; asyncio.run cancels it at the end.
+    """
+    async def run():
+        bot_api = StubBotAPI()
+        async with TestServer(bot_api.create_app()) as bot_server:
+            # --offline: no Telegram client, so no API id or hash
+            converter = StickerToEmojiConverter(
+                None, None, '123:abc', 42, workers=1, bot_api_url=str(bot_server.make_url('')).rstrip('/')
+            )
+            args = argparse.Namespace(offline=True, temp_dir=str(tmp_path / "jobs"), limit=MAX_EMOJI_PER_SET)
+            try:
+                async with create_session() as session:
+                    service = ConverterService(converter, session, args)
+                    async with TestClient(TestServer(service.create_app())) as client:
+                        return await test(client, service, bot_api)
+            finally:
+                await converter.close()
+    
+    return asyncio.run(run())
+
+
+async def read_events(client, job_id: str) -> list:
+    response = await client.get(f"/jobs/{job_id}/events")
+    assert response.status == 200
+    assert response.headers['Content-Type'] == 'application/x-ndjson'
+    return [json.loads(line) for line in (await response.text()).splitlines()]
+
+
+@pytest.mark.parametrize('body', [
+    {},
+    {'name': 'my_pack'},
+    {'source': '/srv/stickers.zip'},
+    {'source': '/srv/stickers.zip', 'pack': 'Opa4958', 'name': 'my_pack'},
+    {'source': '/srv/stickers.zip', 'name': 'my_pack', 'limit': 0},
+    {'source': '/srv/stickers.zip', 'name': 'my_pack', 'limit': MAX_EMOJI_PER_SET + 1},
+    {'source': '/srv/stickers.zip', 'name': 'my_pack', 'emoji_map': ['🐱']},
+    ['/srv/stickers.zip'],
+])
+def test_parse_job_request_rejects(body):
+    with pytest.raises(ValueError):
+        parse_job_request(body)
+
+
+def test_pack_jobs_need_telegram():
+    assert parse_job_request({'pack': 'Opa4958'}) == {'pack': 'Opa4958'}
+    with pytest.raises(ValueError, match='offline'):
+        parse_job_request({'pack': 'Opa4958'}, offline=True)
+
+
+def test_submit_rejects_bad_requests(tmp_path):
+    async def test(client, service, bot_api):
+        for body in ({'pack': 'Opa4958', 'name': 'my_pack'}, {'source': str(tmp_path)}):
+            response = await client.post('/jobs', json=body)
+            assert response.status == 400
+            assert 'error' in await response.json()
+        
+        response = await client.post('/jobs', data='{not json')
+        assert response.status == 400
+        assert (await client.get('/jobs/nope')).status == 404
+        return service.jobs
+    
+    assert run_service(tmp_path, test) == {}
+
+
+def test_source_job_runs_to_done(tmp_path):
+    source = make_stickers(tmp_path)
+    
+    async def test(client, service, bot_api):
+        response = await client.post('/jobs', json={'source': str(source), 'name': 'cats', 'emoji': '🐱'})
+        assert response.status == 202
+        job = await response.json()
+        assert job['status'] == 'queued'
+        assert (await (await client.get('/health')).json())['queued'] == 1
+        
+        asyncio.ensure_future(service.run())
+        events = await read_events(client, job['id'])
+        status = await (await client.get(f"/jobs/{job['id']}")).json()
+        return events, status
+    
+    events, status = run_service(tmp_path, test)
+    
+    assert status['status'] == 'done'
+    assert status['pack_url'] == 'https://t.me/addemoji/cats_by_test_bot'
+    assert status['error'] is None
+    assert status['events'] == len(events)
+    
+    job_events = [event for event in events if event['event'] == 'job']
+    assert [event['status'] for event in job_events] == ['running', 'done']
+    assert events[-1] == job_events[-1]
+    assert events[-1]['pack_url'] == status['pack_url']
+    assert 'events' not in events[-1]
+    # Stage spans of the job come in between, tagged with it
+    assert {event['event'] for event in events[1:-1]} == {'span'}
+    assert {'convert', 'upload'} <= {event['stage'] for event in events[1:-1]}
+    assert all(event['job'] == status['id'] for event in events[1:-1])
+
+
+def test_stub_set_gets_every_sticker(tmp_path):
+    source = make_stickers(tmp_path, count=4)
+    
+    async def test(client, service, bot_api):
+        job = await (await client.post('/jobs', json={'source': str(source), 'name': 'cats', 'limit': 3})).json()
+        asyncio.ensure_future(service.run())
+        await read_events(client, job['id'])
+        return bot_api
+    
+    bot_api = run_service(tmp_path, test)
+    
+    assert bot_api.uploads == 3
+    assert len(bot_api.sets['cats_by_test_bot']) == 3
+    assert 'createNewStickerSet' in bot_api.calls
+    # The job's files are converted in a directory of its own, which is gone afterwards
+    assert list((tmp_path / "jobs").iterdir()) == []
+
+
+def test_failing_job(tmp_path):
+    async def test(client, service, bot_api):
+        missing = await (await client.post('/jobs', json={'source': str(tmp_path / "missing"), 'name': 'cats'})).json()
+        empty = await (await client.post('/jobs', json={'source': str(make_stickers(tmp_path, count=0)), 'name': 'dogs'})).json()
+        asyncio.ensure_future(service.run())
+        events = await read_events(client, empty['id'])
+        statuses = [await (await client.get(f"/jobs/{job['id']}")).json() for job in (missing, empty)]
+        return events, statuses, bot_api
+    
+    events, statuses, bot_api = run_service(tmp_path, test)
+    
+    assert [status['status'] for status in statuses] == ['failed', 'failed']
+    assert all(status['error'] and status['pack_url'] is None for status in statuses)
+    assert 'No stickers' in statuses[1]['error']
+    assert events[-1]['event'] == 'job'
+    assert events[-1]['status'] == 'failed'
+    assert events[-1]['error'] == statuses[1]['error']
+    # Nothing was converted, so no set was made
+    assert bot_api.sets == {}
+
+
+def test_events_of_a_finished_job_replay(tmp_path):
+    source = make_stickers(tmp_path, count=1)
+    
+    async def test(client, service, bot_api):
+        job = await (await client.post('/jobs', json={'source': str(source), 'name': 'cats'})).json()
+        asyncio.ensure_future(service.run())
+        first = await read_events(client, job['id'])
+        return first, await read_events(client, job['id'])
+    
+    first, again = run_service(tmp_path, test)
+    
+    assert again == first
+    assert first[-1]['status'] == 'done'
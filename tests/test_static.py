@@ -0,0 +1,91 @@
+"""Tests for the static sticker resize path."""
+
+import io
+
+import pytest
+from PIL import Image
+
+from sticker_to_emoji.static import StaticConverter
+
+# The box pre-shrink is slightly softer than a single LANCZOS pass
+ALPHA_TOLERANCE = 24
+
+
+def encode(img: Image.Image, **params) -> bytes:
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG', **params)
+    return buffer.getvalue()
+
+
+def reference(image_bytes: bytes, size: int = 100) -> Image.Image:
+    """Plain convert-to-RGBA and LANCZOS fit, centred on a transparent canvas."""
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        img = img.convert('RGBA')
+        img.thumbnail((size, size), Image.Resampling.LANCZOS)
+        canvas = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+        canvas.paste(img, ((size - img.width) // 2, (size - img.height) // 2))
+        return canvas
+
+
+def gradient_rgba(width: int, height: int) -> Image.Image:
+    """Opaque red whose alpha ramps from 0 on the left to 255 on the right."""
+    alpha = Image.linear_gradient('L').rotate(90).resize((width, height))
+    img = Image.new('RGBA', (width, height), (255, 0, 0, 255))
+    img.putalpha(alpha)
+    return img
+
+
+def transparent_half(mode: str, width: int = 512, height: int = 512) -> bytes:
+    """An image of `mode` whose right half is marked transparent with tRNS."""
+    colours = {'P': (1, 0), 'RGB': ((0, 0, 255), (255, 255, 255)), 'L': (40, 255)}
+    solid, clear = colours[mode]
+    img = Image.new(mode, (width, height), solid)
+    img.paste(clear, (width // 2, 0, width, height))
+    if mode == 'P':
+        img.putpalette([255, 255, 255, 0, 0, 255] + [0] * 762)
+    return encode(img, transparency=clear)
+
+
+def assert_alpha_matches(image_bytes: bytes):
+    alpha = StaticConverter().resize(image_bytes).getchannel('A')
+    expected = reference(image_bytes).getchannel('A')
+    
+    assert alpha.size == (100, 100)
+    worst = max(abs(a - b) for a, b in zip(alpha.tobytes(), expected.tobytes()))
+    assert worst <= ALPHA_TOLERANCE
+
+
+@pytest.mark.parametrize('mode', ['P', 'RGB', 'L'])
+def test_trns_transparency_is_kept(mode):
+    image_bytes = transparent_half(mode)
+    assert_alpha_matches(image_bytes)
+    
+    alpha = StaticConverter().resize(image_bytes).getchannel('A')
+    assert alpha.getpixel((10, 50)) == 255
+    assert alpha.getpixel((90, 50)) == 0
+
+
+def test_la_alpha_is_kept():
+    assert_alpha_matches(encode(gradient_rgba(512, 512).convert('LA')))
+
+
+@pytest.mark.parametrize('size', [(512, 512), (512, 256), (200, 512)])
+def test_partial_alpha_is_not_squared(size):
+    assert_alpha_matches(encode(gradient_rgba(*size)))
+
+
+def test_non_square_is_centred_on_transparent_padding():
+    img = StaticConverter().resize(encode(Image.new('RGB', (512, 256), (0, 255, 0))))
+    alpha = img.getchannel('A')
+    
+    assert alpha.getpixel((50, 5)) == 0
+    assert alpha.getpixel((50, 95)) == 0
+    assert alpha.getpixel((50, 50)) == 255
+
+
+def test_canvas_is_cleared_between_stickers():
+    converter = StaticConverter()
+    converter.resize(encode(Image.new('RGB', (512, 256), (0, 255, 0))))
+    img = converter.resize(encode(Image.new('RGBA', (256, 512), (0, 0, 0, 0))))
+    
+    assert img.getchannel('A').getextrema() == (0, 0)
@@ -0,0 +1,106 @@
+"""Tests for the incremental pack sync planner."""
+
+from types import SimpleNamespace
+
+from sticker_to_emoji.sync import SyncState, plan_moves, plan_sync
+
+
+def documents(*ids):
+    return [SimpleNamespace(id=document_id) for document_id in ids]
+
+
+def set_stickers(*uids):
+    return [{'file_unique_id': uid, 'file_id': f'file-{uid}'} for uid in uids]
+
+
+def state_for(tmp_path, **stickers):
+    """State mapping each file_unique_id to (document id, content key)."""
+    state = SyncState(tmp_path / "state.json")
+    for uid, (document_id, content_key) in stickers.items():
+        state.record(uid, document_id, content_key)
+    return state
+
+
+def test_new_pack_adds_everything(tmp_path):
+    plan = plan_sync(documents(1, 2, 3), [], SyncState(tmp_path / "state.json"), {})
+    
+    assert [document.id for document in plan.add] == [1, 2, 3]
+    assert plan.keep == {}
+    assert plan.delete == []
+
+
+def test_adds_new_and_deletes_removed(tmp_path):
+    state = state_for(tmp_path, a=(1, None), b=(2, None))
+    plan = plan_sync(documents(1, 3), set_stickers('a', 'b'), state, {})
+    
+    assert plan.keep == {1: 'a'}
+    assert [document.id for document in plan.add] == [3]
+    assert plan.delete == ['b']
+
+
+def test_unknown_emoji_are_deleted(tmp_path):
+    state = state_for(tmp_path, a=(1, None))
+    plan = plan_sync(documents(1), set_stickers('a', 'by-hand'), state, {})
+    
+    assert plan.keep == {1: 'a'}
+    assert plan.delete == ['by-hand']
+
+
+def test_readded_sticker_matched_by_content(tmp_path):
+    state = state_for(tmp_path, a=(1, 'key-1'))
+    plan = plan_sync(documents(9), set_stickers('a'), state, {9: 'key-1'})
+    
+    assert plan.keep == {9: 'a'}
+    assert plan.add == []
+    assert plan.delete == []
+
+
+def test_content_match_used_once(tmp_path):
+    state = state_for(tmp_path, a=(1, 'same'))
+    plan = plan_sync(documents(8, 9), set_stickers('a'), state, {8: 'same', 9: 'same'})
+    
+    assert plan.keep == {8: 'a'}
+    assert [document.id for document in plan.add] == [9]
+
+
+def test_limit_drops_emoji_past_it(tmp_path):
+    state = state_for(tmp_path, a=(1, None), b=(2, None), c=(3, None))
+    plan = plan_sync(documents(1, 2, 3), set_stickers('a', 'b', 'c'), state, {}, limit=2)
+    
+    assert plan.keep == {1: 'a', 2: 'b'}
+    assert plan.delete == ['c']
+
+
+def test_state_round_trip(tmp_path):
+    state = state_for(tmp_path, a=(1, 'key'))
+    state.save()
+    
+    assert SyncState.load(tmp_path / "state.json").stickers == {'a': {'document_id': 1, 'content_key': 'key'}}
+    assert SyncState.load(tmp_path / "missing.json").stickers == {}
+
+
+def apply_moves(current: list, moves: list) -> list:
+    current = list(current)
+    for uid, position in moves:
+        current.remove(uid)
+        current.insert(position, uid)
+    return current
+
+
+def test_moves_reorder():
+    current = ['c', 'a', 'b']
+    moves = plan_moves(current, ['a', 'b', 'c'])
+    
+    assert apply_moves(current, moves) == ['a', 'b', 'c']
+    assert len(moves) == 2
+
+
+def test_no_moves_when_in_order():
+    assert plan_moves(['a', 'b', 'c'], ['a', 'b', 'c']) == []
+
+
+def test_moves_leave_the_rest_at_the_end():
+    current = ['x', 'b', 'a']
+    moves = plan_moves(current, ['a', 'b'])
+    
+    assert apply_moves(current, moves) == ['a', 'b', 'x']